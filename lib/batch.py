@@ -0,0 +1,251 @@
+# headless execution of notebooks (or plain cell files) through a kernel
+# class, without Jupyter; responses are collected in-process and written
+# back as notebook outputs. See bin/callysto-run
+
+__all__ = (
+    "run_notebook",
+    "run_notebooks")
+
+import base64
+import io
+import json
+import logging
+import multiprocessing
+import os
+
+import binary
+
+_logger = logging.getLogger(__name__)
+
+# line separating two cells in a plain cell file
+CELL_SEPARATOR = "%%"
+
+def _read_cells (filename):
+    with io.open(filename, "r", encoding = "utf-8") as fh:
+        content = fh.read()
+
+    if (filename.endswith(".ipynb")):
+        notebook = json.loads(content)
+        if (notebook.get("nbformat") != 4):
+            raise ValueError(
+                "unsupported notebook format in %s (version 4 "
+                "expected, got %s)" % (filename, notebook.get("nbformat")))
+        return notebook
+
+    # plain cell files are converted to notebooks
+    cells, lines = [], []
+    for line in content.splitlines() + [CELL_SEPARATOR]:
+        if (line.strip() == CELL_SEPARATOR):
+            code = '\n'.join(lines).strip('\n')
+            if (code.strip() != ''):
+                cells.append({
+                    "cell_type": "code",
+                    "execution_count": None,
+                    "metadata": {},
+                    "outputs": [],
+                    "source": code})
+            lines = []
+        else:
+            lines.append(line)
+
+    return {
+        "cells": cells,
+        "metadata": {},
+        "nbformat": 4,
+        "nbformat_minor": 2}
+
+def _decoded (value):
+    # outputs may mix Unicode and byte strings; the latter are taken
+    # as UTF-8, as the Jupyter session does when serializing messages
+    if (isinstance(value, str)):
+        return value.decode("utf-8", "replace")
+    elif (isinstance(value, dict)):
+        return dict((_decoded(key), _decoded(item))
+            for (key, item) in value.iteritems())
+    elif (isinstance(value, (list, tuple))):
+        return [_decoded(item) for item in value]
+    else:
+        return value
+
+def _write_notebook (notebook, filename):
+    content = json.dumps(_decoded(notebook),
+        indent = 1, sort_keys = True, separators = (',', ': '),
+        ensure_ascii = False)
+
+    with io.open(filename, "w", encoding = "utf-8") as fh:
+        fh.write(unicode(content) + u'\n')
+
+class _OutputCollector:
+    # stands for the iopub socket of a kernel; responses
+    # are converted into the outputs of the current cell
+    def __init__ (self):
+        self.outputs, self._displays = [], {}
+        self._binaries = {}
+
+    def send_response (self, stream, msg_type, content, *args, **kwargs):
+        if (msg_type == "stream"):
+            # consecutive texts of a same stream are merged, as
+            # Jupyter would do when displaying them
+            if (len(self.outputs) > 0) and \
+               (self.outputs[-1]["output_type"] == "stream") and \
+               (self.outputs[-1]["name"] == content["name"]):
+                self.outputs[-1]["text"] += content["text"]
+            else:
+                self.outputs.append({
+                    "output_type": "stream",
+                    "name": content["name"],
+                    "text": content["text"]})
+
+        elif (msg_type == "display_data"):
+            output = {
+                "output_type": "display_data",
+                "data": content["data"],
+                "metadata": content["metadata"]}
+
+            display_id = content.get("transient", {}).get("display_id")
+            if (display_id is not None):
+                self._displays.setdefault(display_id, []).append(output)
+
+            self.outputs.append(output)
+
+        elif (msg_type == "update_display_data"):
+            display_id = content["transient"]["display_id"]
+            for output in self._displays.get(display_id, ()):
+                output["data"] = content["data"]
+                output["metadata"] = content["metadata"]
+
+        # binary content (see binary.py) is sent through a comm channel,
+        # and replaces its placeholder output once entirely received
+        elif (msg_type == "comm_open") and \
+             (content["target_name"] == binary.TARGET_NAME):
+            self._binaries[content["comm_id"]] = \
+                (self.outputs[-1], content["data"], [])
+
+        elif (msg_type == "comm_msg") and \
+             (content["comm_id"] in self._binaries):
+            # buffers are passed after the (unused) identities
+            buffers = kwargs.get("buffers")
+            if (buffers is None) and (len(args) > 1):
+                buffers = args[1]
+
+            self._binaries[content["comm_id"]][2].extend(
+                memoryview(buffer_).tobytes() for buffer_ in buffers or ())
+
+        elif (msg_type == "comm_close") and \
+             (content["comm_id"] in self._binaries):
+            output, info, chunks = self._binaries.pop(content["comm_id"])
+            mime_type = info["mime_type"]
+
+            output["data"] = {
+                "text/plain": output["data"]["text/plain"],
+                mime_type: base64.b64encode(''.join(chunks))}
+            if (len(info["metadata"]) > 0):
+                output["metadata"] = {mime_type: info["metadata"]}
+
+        else:
+            _logger.debug("ignoring %s message", msg_type)
+
+def run_notebook (kernel_class, input_filename,
+    output_filename = None, stop_on_error = True):
+    """ Execute the code cells of a notebook (.ipynb file, version 4) or
+        plain cell file (cells separated by lines with CELL_SEPARATOR)
+        through a new instance of a kernel class, then write the notebook
+        with the resulting outputs to `output_filename` (by default, the
+        input file for notebooks, or the input file with a .ipynb
+        extension for plain cell files)
+
+        Return the number of executed cells and the number of cells
+        that failed; unless `stop_on_error` is set to False, no cell
+        is executed after a failed one.
+    """
+    notebook = _read_cells(input_filename)
+
+    if (output_filename is None):
+        output_filename = os.path.splitext(input_filename)[0] + ".ipynb"
+
+    collector = _OutputCollector()
+    kernel = kernel_class()
+    kernel.send_response = collector.send_response
+
+    n_executed, n_failed = 0, 0
+    try:
+        for cell in notebook["cells"]:
+            if (cell["cell_type"] != "code"):
+                continue
+
+            source = cell["source"]
+            if (not isinstance(source, basestring)):
+                source = ''.join(source)
+
+            # same as ipykernel, which counts non-silent executions
+            kernel.execution_count += 1
+            collector.outputs = []
+
+            reply = kernel.do_execute(
+                code = source,
+                silent = False,
+                store_history = True,
+                user_expressions = {},
+                allow_stdin = False)
+
+            cell["execution_count"] = kernel.execution_count
+            cell["outputs"] = collector.outputs
+            n_executed += 1
+
+            if (reply is not None) and (reply["status"] == "error"):
+                n_failed += 1
+                if (stop_on_error):
+                    break
+    finally:
+        kernel.do_shutdown(False)
+
+    _write_notebook(notebook, output_filename)
+
+    _logger.info("executed %d cells of %s (%d failed), written to %s",
+        n_executed, input_filename, n_failed, output_filename)
+
+    return (n_executed, n_failed)
+
+def _run_task (arguments):
+    kernel_class, input_filename, output_filename, stop_on_error = arguments
+    try:
+        return (input_filename, run_notebook(kernel_class,
+            input_filename, output_filename, stop_on_error), None)
+    except Exception as exception:
+        _logger.error("unable to run %s: %s", input_filename, exception)
+        return (input_filename, None, "%s: %s" % (
+            type(exception).__name__, exception))
+
+def run_notebooks (kernel_class, input_filenames,
+    output_directory = None, processes = None, stop_on_error = True):
+    """ Execute several notebooks or plain cell files (see run_notebook)
+        in parallel, using a pool of `processes` worker processes (by
+        default, as many as there are CPUs); the resulting notebooks are
+        written in `output_directory`, if set
+
+        Return a list of (input file, (executed cells, failed cells),
+        error message) tuples, in completion order; the error message
+        is set, and the number of cells is None, if the file could not
+        be executed at all. Note that `kernel_class` must be importable
+        by the worker processes.
+    """
+    tasks = []
+    for input_filename in input_filenames:
+        if (output_directory is None):
+            output_filename = None
+        else:
+            output_filename = os.path.join(output_directory,
+                os.path.splitext(os.path.basename(input_filename))[0] +
+                ".ipynb")
+
+        tasks.append((kernel_class,
+            input_filename, output_filename, stop_on_error))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # each worker process runs one notebook at a time, with
+        # a fresh kernel instance, so that no state leaks across
+        return list(pool.imap_unordered(_run_task, tasks))
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,139 @@
+# transfer of raw binary content to the notebook through a comm
+# channel, as message buffers rather than base64-encoded JSON; a
+# placeholder is displayed first, then filled by a frontend shim
+
+__all__ = (
+    "TARGET_NAME",
+    "send_binary")
+
+import logging
+import uuid
+
+_logger = logging.getLogger(__name__)
+
+TARGET_NAME = "callysto.binary"
+
+# MIME type of binary content whose metadata doesn't set one
+DEFAULT_MIME_TYPE = "application/octet-stream"
+
+# notebook sessions the shim was sent to; a new session starts
+# whenever a notebook is (re)loaded in a browser
+_shimmed_sessions = set()
+
+# frontend shim for the classic notebook, registering the comm target;
+# chunks are collected until the comm is closed, then displayed (for
+# images) or offered as a download (for anything else)
+_SHIM = """\
+(function () {
+    var kernel = Jupyter.notebook.kernel;
+    kernel.comm_manager.register_target("%(target_name)s",
+        function (comm, msg) {
+            var info = msg.content.data, chunks = [];
+            comm.on_msg(function (msg) {
+                for (var i = 0; i < msg.buffers.length; i++) {
+                    chunks.push(msg.buffers[i]);
+                }
+            });
+            comm.on_close(function () {
+                var element = document.getElementById(info.element_id);
+                if (!element) {
+                    return;
+                }
+                var url = URL.createObjectURL(
+                    new Blob(chunks, {type: info.mime_type}));
+                var child;
+                if (info.mime_type.indexOf("image/") === 0) {
+                    child = document.createElement("img");
+                    child.src = url;
+                    ["width", "height"].forEach(function (key) {
+                        if (key in info.metadata) {
+                            child[key] = info.metadata[key];
+                        }
+                    });
+                } else {
+                    child = document.createElement("a");
+                    child.href = url;
+                    child.download = "output";
+                    child.textContent = "Download (" + info.mime_type + ")";
+                }
+                element.textContent = "";
+                element.appendChild(child);
+            });
+        });
+})();
+"""
+
+def is_buffer (content):
+    return isinstance(content, (str, bytearray, memoryview, buffer))
+
+def _iter_chunks (content, chunk_size):
+    # slices of a memoryview share the memory of the content
+    if (is_buffer(content)):
+        view = memoryview(content)
+        for offset in xrange(0, len(view), chunk_size):
+            yield view[offset:offset + chunk_size]
+    else:
+        for chunk in content:
+            yield memoryview(chunk)
+
+def send_binary (send_function, content, metadata, chunk_size,
+    frontend_session = None):
+    """ Send raw content to the notebook through a comm channel, in
+        chunks of `chunk_size` bytes; `content` is either a byte string
+        (or any object supporting the buffer protocol) or an iterable of
+        such objects, and `metadata` (if any) contains the actual MIME
+        type of the content under a 'mime_type' key (DEFAULT_MIME_TYPE
+        if not set)
+
+        The frontend shim is only sent along the first content sent to
+        the notebook session `frontend_session`, if set.
+
+        `send_function` is called with a message type, a message content
+        and a list of buffers. Return the number of bytes sent.
+    """
+    metadata = {} if (metadata is None) else dict(metadata)
+    mime_type = metadata.pop("mime_type", DEFAULT_MIME_TYPE)
+
+    comm_id = uuid.uuid4().hex
+    element_id = "callysto-binary-" + comm_id
+
+    html = "<div id=\"%s\">[loading %s content]</div>" % (
+        element_id, mime_type)
+
+    if (frontend_session is None) or \
+       (not frontend_session in _shimmed_sessions):
+        html += "\n<script type=\"application/javascript\">\n" + \
+            _SHIM % {"target_name": TARGET_NAME} + "</script>"
+        if (frontend_session is not None):
+            _shimmed_sessions.add(frontend_session)
+
+    send_function("display_data", {
+        "metadata": {},
+        "data": {
+            "text/plain": "[%s content]" % mime_type,
+            "text/html": html}})
+
+    send_function("comm_open", {
+        "comm_id": comm_id,
+        "target_name": TARGET_NAME,
+        "data": {
+            "mime_type": mime_type,
+            "element_id": element_id,
+            "metadata": metadata}})
+
+    n_bytes = 0
+    try:
+        for chunk in _iter_chunks(content, chunk_size):
+            send_function("comm_msg", {
+                "comm_id": comm_id,
+                "data": {"offset": n_bytes}}, [chunk])
+            n_bytes += len(chunk) * chunk.itemsize
+    finally:
+        send_function("comm_close", {
+            "comm_id": comm_id,
+            "data": {"length": n_bytes}})
+
+    _logger.debug("sent %d bytes of %s through comm %s",
+        n_bytes, mime_type, comm_id)
+
+    return n_bytes
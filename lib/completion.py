@@ -0,0 +1,144 @@
+# code completion, using sorted indexes of magic commands,
+# magic command options and kernel-provided vocabulary
+
+__all__ = (
+    "CompletionIndex",
+    "CompletionManager")
+
+import bisect
+import logging
+import re
+
+import utils
+
+_logger = logging.getLogger(__name__)
+
+class CompletionIndex:
+    """ Sorted set of words, answering prefix queries in O(log(n) + k)
+
+        Words are reference-counted, so that a word added by several
+        sources only disappears once all of them removed it.
+    """
+    def __init__ (self, words = None):
+        self._words, self._counts = [], {}
+        if (words is not None):
+            self.add(words)
+
+    def add (self, words):
+        if (utils.is_string(words)):
+            words = (words,)
+
+        new_words = []
+        for word in words:
+            count = self._counts.get(word, 0)
+            if (count == 0):
+                new_words.append(word)
+            self._counts[word] = count + 1
+
+        # inserting a few words is cheaper than sorting the whole
+        # index, but the opposite is true for large batches of words
+        if (len(new_words) < 64):
+            for word in new_words:
+                bisect.insort(self._words, word)
+        else:
+            self._words.extend(new_words)
+            self._words.sort()
+
+    def remove (self, words):
+        if (utils.is_string(words)):
+            words = (words,)
+
+        for word in words:
+            count = self._counts.get(word, 0)
+            if (count == 0):
+                raise ValueError("Unknown word: %s" % word)
+            elif (count == 1):
+                del self._counts[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+            else:
+                self._counts[word] = count - 1
+
+    def find (self, prefix, limit = None):
+        """ Return the words starting with a prefix, in sorted order
+        """
+        matches = []
+        i, n = bisect.bisect_left(self._words, prefix), len(self._words)
+        while (i < n) and (self._words[i].startswith(prefix)):
+            matches.append(self._words[i])
+            if (len(matches) == limit):
+                break
+            i += 1
+
+        return matches
+
+    def __contains__ (self, word):
+        return (word in self._counts)
+
+    def __len__ (self):
+        return len(self._words)
+
+# characters considered part of a word when completing vocabulary
+_word_pattern = re.compile(r"[\w.]*$", re.UNICODE)
+
+# options mentioned in the documentation of a magic command
+_option_pattern = re.compile(r"(?<![\w-])(--?\w[\w-]*)", re.UNICODE)
+
+def _list_options (doc):
+    if (doc is None):
+        return []
+    return sorted(set(_option_pattern.findall(doc)))
+
+class CompletionManager:
+    """ Complete either magic commands names (at the beginning of a line
+        starting with the magic commands prefix), their options, or words
+        from the vocabulary declared by the kernel
+    """
+    def __init__ (self, magic_commands, max_matches = 1000):
+        self._magic_commands = magic_commands
+        self.vocabulary = CompletionIndex()
+        self.max_matches = max_matches
+
+    def add_words (self, words):
+        self.vocabulary.add(words)
+
+    def remove_words (self, words):
+        self.vocabulary.remove(words)
+
+    def complete (self, code, cursor_pos):
+        line_start = code.rfind('\n', 0, cursor_pos) + 1
+        line = code[line_start:cursor_pos].lstrip()
+        prefix = self._magic_commands.prefix
+
+        if (line.startswith(prefix)):
+            words = line[len(prefix):].split(' ')
+
+            # name of a magic command
+            if (len(words) == 1):
+                token = words[0]
+                matches = [prefix + name for name in
+                    self._magic_commands._names.find(
+                        token.lower(), self.max_matches)]
+                token = prefix + token
+
+            # option of a magic command
+            else:
+                token = words[-1]
+                options = self._magic_commands._options.get(
+                    words[0].lower(), ())
+                matches = [option for option in options
+                    if option.startswith(token)]
+        else:
+            token = _word_pattern.search(line).group(0)
+            if (token == ''):
+                matches = []
+            else:
+                matches = self.vocabulary.find(token, self.max_matches)
+
+        _logger.debug("completing '%s': %d matches", token, len(matches))
+
+        return {
+            "matches": matches,
+            "cursor_start": cursor_pos - len(token),
+            "cursor_end": cursor_pos,
+            "metadata": {},
+            "status": "ok"}
@@ -0,0 +1,191 @@
+# fork server keeping a kernel class and its dependencies imported
+# in a long-lived parent process, and forking ready-to-go kernels out
+# of it on demand; see BaseKernel.launch_forkserver()
+
+__all__ = (
+    "serve",)
+
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+
+import logs
+
+_logger = logging.getLogger(__name__)
+
+# requests and replies exchanged with bin/callysto-connect-kernel are
+# newline-terminated JSON documents; the client sends one request
+#   {"connection_file": <path>, "cwd": <path>,
+#    "env": <environment variables>, "pid": <client process id>}
+# and the forked kernel replies with
+#   {"pid": <kernel process id>}
+# then, once the kernel exits,
+#   {"exit": <exit status>}
+
+# maximum time, in seconds, a client can take to send its request
+_REQUEST_TIMEOUT = 10
+
+def _readline (connection):
+    # the client sends nothing after its request, so
+    # it can be read by chunks rather than by character
+    buffer_ = []
+    while True:
+        chunk = connection.recv(4096)
+        if (chunk == ''):
+            break
+
+        buffer_.append(chunk)
+        if (chunk.endswith('\n')):
+            break
+
+    return ''.join(buffer_).rstrip('\n')
+
+def _send (connection, message):
+    connection.sendall(json.dumps(message) + '\n')
+
+def _watch_client (connection):
+    # the client process is the one Jupyter monitors; if it goes away
+    # (e.g., killed by the kernel manager) we should go away as well
+    try:
+        while (connection.recv(1024) != ''):
+            pass
+    except socket.error:
+        pass
+
+    _logger.debug("client disconnected; terminating kernel %d", os.getpid())
+    logs.stop_listener()
+    os._exit(1)
+
+def _read_request (connection):
+    connection.settimeout(_REQUEST_TIMEOUT)
+    request = json.loads(_readline(connection))
+    connection.settimeout(None)
+
+    assert isinstance(request, dict) and ("connection_file" in request), \
+        "missing connection file"
+
+    return request
+
+def _adopt_client_context (request):
+    # the kernel should run as if started by the client (i.e., by Jupyter)
+    # rather than by the fork server; with the client working directory,
+    # environment variables and, when available, standard streams
+    if ("cwd" in request):
+        os.chdir(request["cwd"])
+
+    if ("env" in request):
+        os.environ.clear()
+        for (key, value) in request["env"].iteritems():
+            os.environ[key.encode("utf-8")] = value.encode("utf-8")
+
+    if ("pid" in request):
+        for (fd, flags) in (
+            (0, os.O_RDONLY), (1, os.O_WRONLY), (2, os.O_WRONLY)):
+            try:
+                client_fd = os.open(
+                    "/proc/%d/fd/%d" % (request["pid"], fd), flags)
+            except OSError:
+                continue
+
+            os.dup2(client_fd, fd)
+            os.close(client_fd)
+
+def _run_kernel (kernel_class, server, connection):
+    # we don't want the forked kernel to inherit
+    # the signal handlers and socket of the server
+    server.close()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    # the thread writing log records, if any, did not survive the fork
+    logs.restart_listener()
+
+    # the request is read once forked, so that a slow
+    # client doesn't hold up the launch of other kernels
+    try:
+        request = _read_request(connection)
+        _adopt_client_context(request)
+
+    except Exception as exception:
+        _logger.error("invalid fork request: %s", exception)
+        connection.close()
+        logs.stop_listener()
+        os._exit(1)
+
+    _logger.debug("forked kernel %d for connection file %s",
+        os.getpid(), request["connection_file"])
+
+    exit_status = 0
+    try:
+        _send(connection, {"pid": os.getpid()})
+
+        watcher = threading.Thread(target = _watch_client, args = (connection,))
+        watcher.daemon = True
+        watcher.start()
+
+        sys.argv = [sys.argv[0], "-f", request["connection_file"]]
+        kernel_class._launch_instance()
+
+    except SystemExit as exception:
+        exit_status = exception.code if (exception.code is not None) else 0
+
+    except BaseException as exception:
+        _logger.error("kernel %d terminated with error: %s",
+            os.getpid(), exception)
+        exit_status = 1
+
+    try:
+        _send(connection, {"exit": exit_status})
+    except socket.error:
+        pass
+
+    logs.stop_listener()
+    os._exit(exit_status)
+
+def serve (kernel_class, socket_path):
+    """ Listen on a UNIX socket for connection files, and fork
+        a new instance of a kernel class for each of them
+
+        Note that this is a blocking operation.
+    """
+    if (os.path.exists(socket_path)):
+        os.unlink(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(16)
+
+    # forked kernels are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    _logger.info("fork server for %s listening on %s",
+        kernel_class, socket_path)
+
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.error as exception:
+                if (exception.errno == errno.EINTR):
+                    continue
+                raise
+
+            if (os.fork() == 0):
+                _run_kernel(kernel_class, server, connection)
+
+            connection.close()
+
+    except KeyboardInterrupt:
+        _logger.info("fork server for %s stopped", kernel_class)
+
+    finally:
+        server.close()
+        if (os.path.exists(socket_path)):
+            os.unlink(socket_path)
@@ -0,0 +1,348 @@
+# host running many instances of a kernel class in a single process,
+# on a shared event loop; see BaseKernel.launch_host()
+
+__all__ = (
+    "KernelHost",)
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import jupyter_client.session
+import tornado.ioloop
+import zmq
+import zmq.eventloop.zmqstream
+
+import ipykernel.iostream
+
+import renderers.core
+
+_logger = logging.getLogger(__name__)
+
+# host and connection file of the kernel instance being created, if any
+_creating = None
+
+# time given to clients to send their request once connected, in seconds
+_REQUEST_TIMEOUT = 10
+
+def _hosted_instance ():
+    # called by kernel instances when initialized, to find out whether
+    # they are hosted; return their host and connection file, if so
+    if (_creating is None):
+        return (None, None)
+
+    return _creating
+
+def _bind (zmq_socket, connection_info, port_name):
+    transport, ip = connection_info["transport"], connection_info["ip"]
+    port = connection_info[port_name]
+
+    if (transport == "tcp"):
+        zmq_socket.bind("tcp://%s:%d" % (ip, port))
+    else:
+        zmq_socket.bind("%s://%s-%d" % (transport, ip, port))
+
+class _Heartbeats (threading.Thread):
+    # a single thread echoing the heartbeats of all hosted kernels, so
+    # that they keep beating while the event loop is busy with a cell
+    def __init__ (self, context):
+        threading.Thread.__init__(self, name = "callysto-heartbeats")
+        self.daemon = True
+
+        self._context = context
+        self._lock = threading.Lock()
+        self._added, self._removed = [], []
+        self._stopped = threading.Event()
+
+    def add (self, connection_info):
+        with self._lock:
+            self._added.append(connection_info)
+
+    def remove (self, connection_info):
+        with self._lock:
+            self._removed.append(connection_info)
+
+    def stop (self):
+        self._stopped.set()
+        self.join()
+
+    def run (self):
+        poller, sockets = zmq.Poller(), {}
+        while (not self._stopped.is_set()):
+            # sockets are only ever used from this thread
+            with self._lock:
+                added, self._added = self._added, []
+                removed, self._removed = self._removed, []
+
+            for connection_info in added:
+                hb_socket = self._context.socket(zmq.ROUTER)
+                hb_socket.linger = 0
+                _bind(hb_socket, connection_info, "hb_port")
+                poller.register(hb_socket, zmq.POLLIN)
+                sockets[id(connection_info)] = hb_socket
+
+            for connection_info in removed:
+                hb_socket = sockets.pop(id(connection_info))
+                poller.unregister(hb_socket)
+                hb_socket.close()
+
+            for (hb_socket, _) in poller.poll(100):
+                hb_socket.send_multipart(hb_socket.recv_multipart())
+
+        for hb_socket in sockets.itervalues():
+            hb_socket.close()
+
+def _close_sockets (sockets, streams, iopub_thread):
+    for stream in streams:
+        stream.close()
+
+    if (iopub_thread is not None):
+        iopub_thread.stop()
+
+    for socket_ in sockets.itervalues():
+        if (not socket_.closed):
+            socket_.close()
+
+class KernelHost:
+    """ Run instances of a kernel class, one per connection file, in the
+        current process; each instance has its own sockets and state,
+        while module-level resources (e.g., renderers registered with
+        renderers.register_renderer() rather than through the kernel
+        instance) are shared
+
+        Hosted kernels share a single metrics registry and tracer, set
+        up with the options of the first of them, and have a snapshot
+        file of their own (see BaseKernel.snapshot_file).
+
+        Note that hosted kernels can't be interrupted individually;
+        signals sent to the process affect all of them.
+    """
+    def __init__ (self, kernel_class):
+        self.kernel_class = kernel_class
+        self.kernels = []
+
+        self._context = zmq.Context.instance()
+        self._heartbeats = _Heartbeats(self._context)
+        self._heartbeats.start()
+
+        self._metrics, self._metrics_exporters = None, []
+        self._tracer = None
+
+    def _shared_resources (self, kernel):
+        # metrics and tracer shared by all hosted kernels
+        if (self._metrics is None):
+            registry = kernel._create_metrics()
+            self._metrics_exporters = \
+                kernel._start_metrics_exporters(registry)
+            self._tracer = kernel._create_tracer()
+            self._metrics = registry
+
+        return (self._metrics, self._tracer)
+
+    def close (self):
+        """ Stop the threads of the host, once all kernels are removed
+        """
+        self._heartbeats.stop()
+
+        for exporter in self._metrics_exporters:
+            exporter.stop()
+        self._metrics_exporters = []
+
+        if (self._tracer is not None):
+            self._tracer.close()
+
+        self._metrics, self._tracer = None, None
+
+    def add_kernel (self, connection_file):
+        """ Create a new kernel instance for a connection file
+        """
+        with open(connection_file) as fh:
+            connection_info = json.load(fh)
+
+        session = jupyter_client.session.Session(
+            key = connection_info["key"].encode("ascii"),
+            signature_scheme = connection_info.get(
+                "signature_scheme", "hmac-sha256"))
+
+        global _creating
+        sockets, streams, iopub_thread = {}, [], None
+        try:
+            for (name, socket_type) in (
+                ("shell", zmq.ROUTER),
+                ("control", zmq.ROUTER),
+                ("stdin", zmq.ROUTER),
+                ("iopub", zmq.PUB)):
+                sockets[name] = self._context.socket(socket_type)
+                sockets[name].linger = 1000
+                _bind(sockets[name], connection_info, name + "_port")
+
+            iopub_thread = ipykernel.iostream.IOPubThread(
+                sockets["iopub"], pipe = True)
+            iopub_thread.start()
+
+            streams = [zmq.eventloop.zmqstream.ZMQStream(sockets[name])
+                for name in ("shell", "control")]
+
+            _creating = (self, connection_file)
+            try:
+                kernel = self.kernel_class(
+                    session = session,
+                    shell_streams = streams,
+                    iopub_thread = iopub_thread,
+                    iopub_socket = iopub_thread.background_socket,
+                    stdin_socket = sockets["stdin"],
+                    log = logging.getLogger(self.kernel_class.__module__))
+            finally:
+                _creating = None
+
+            kernel._host_client = None
+            kernel._host_resources = (connection_info, sockets, iopub_thread)
+            kernel.start()
+
+        except:
+            # a kernel which failed to start leaves nothing behind,
+            # so that its connection file can be used again
+            _close_sockets(sockets, streams, iopub_thread)
+            raise
+
+        self._heartbeats.add(connection_info)
+        self.kernels.append(kernel)
+
+        _logger.info("hosting kernel %s for %s (%d hosted)",
+            kernel, connection_file, len(self.kernels))
+
+        return kernel
+
+    def remove_kernel (self, kernel):
+        """ Close the sockets of a kernel instance, and forget about it
+        """
+        if (not kernel in self.kernels):
+            return
+
+        self.kernels.remove(kernel)
+        connection_info, sockets, iopub_thread = kernel._host_resources
+
+        self._heartbeats.remove(connection_info)
+        _close_sockets(sockets, kernel.shell_streams, iopub_thread)
+
+        renderers.core._remove_scope(kernel)
+
+        if (kernel._host_client is not None):
+            try:
+                kernel._host_client.sendall(json.dumps({"exit": 0}) + '\n')
+            except socket.error:
+                pass
+
+            tornado.ioloop.IOLoop.current().remove_handler(
+                kernel._host_client.fileno())
+            kernel._host_client.close()
+            kernel._host_client = None
+
+        _logger.info("stopped hosting kernel %s (%d hosted)",
+            kernel, len(self.kernels))
+
+    def _accept (self, server):
+        connection, _ = server.accept()
+        connection.setblocking(False)
+
+        # the request is read as it arrives, so that a slow (or silent)
+        # client doesn't block the event loop shared by all kernels
+        io_loop = tornado.ioloop.IOLoop.current()
+        chunks = []
+
+        def close (reason):
+            io_loop.remove_handler(connection.fileno())
+            io_loop.remove_timeout(timeout)
+            _logger.error("invalid host request: %s", reason)
+            connection.close()
+
+        def on_request_data (fd, events):
+            try:
+                chunk = connection.recv(4096)
+            except socket.error as exception:
+                if (exception.errno not in (errno.EAGAIN, errno.EINTR)):
+                    close(exception)
+                return
+
+            if (chunk == ''):
+                close("connection closed before the request was sent")
+                return
+
+            # the client sends nothing after its request
+            chunks.append(chunk)
+            if (chunk.endswith('\n')):
+                io_loop.remove_handler(fd)
+                io_loop.remove_timeout(timeout)
+                self._handle_request(connection, ''.join(chunks))
+
+        timeout = io_loop.add_timeout(time.time() + _REQUEST_TIMEOUT,
+            lambda: close("no request received after %d seconds" %
+                _REQUEST_TIMEOUT))
+
+        io_loop.add_handler(connection.fileno(), on_request_data,
+            tornado.ioloop.IOLoop.READ)
+
+    def _handle_request (self, connection, request):
+        try:
+            # same protocol as the fork server, except that no process
+            # identifier is given, as hosted kernels share a process
+            request = json.loads(request)
+            kernel = self.add_kernel(request["connection_file"])
+
+        except Exception as exception:
+            _logger.error("invalid host request: %s", exception)
+            connection.close()
+            return
+
+        connection.setblocking(True)
+        connection.sendall(json.dumps({"pid": None}) + '\n')
+
+        # if the client goes away, so does its kernel
+        kernel._host_client = connection
+
+        def on_client_event (fd, events):
+            if (connection.recv(1024) == ''):
+                kernel._host_client = None
+                tornado.ioloop.IOLoop.current().remove_handler(fd)
+                connection.close()
+                self.remove_kernel(kernel)
+
+        tornado.ioloop.IOLoop.current().add_handler(
+            connection.fileno(), on_client_event,
+            tornado.ioloop.IOLoop.READ)
+
+    def serve (self, socket_path):
+        """ Listen on a UNIX socket for connection files, and host a new
+            kernel instance for each of them
+
+            Note that this is a blocking operation.
+        """
+        if (os.path.exists(socket_path)):
+            os.unlink(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        server.listen(16)
+
+        io_loop = tornado.ioloop.IOLoop.current()
+        io_loop.add_handler(server.fileno(),
+            lambda fd, events: self._accept(server),
+            tornado.ioloop.IOLoop.READ)
+
+        _logger.info("kernel host for %s listening on %s",
+            self.kernel_class, socket_path)
+
+        try:
+            io_loop.start()
+        except KeyboardInterrupt:
+            _logger.info("kernel host for %s stopped", self.kernel_class)
+        finally:
+            server.close()
+            if (os.path.exists(socket_path)):
+                os.unlink(socket_path)
+            self.close()
@@ -0,0 +1,177 @@
+# outbound queue decoupling the emission of messages by
+# the kernel from their serialization and actual sending
+
+__all__ = (
+    "ResponseSender",
+    "TextStream")
+
+import logging
+import Queue
+import sys
+import threading
+import time
+
+import future.utils
+
+_logger = logging.getLogger(__name__)
+
+# waits of the main thread are split in waits of at most this number of
+# seconds, as a wait without timeout can't be interrupted by a signal
+_POLL_INTERVAL = 0.05
+
+class ResponseSender (threading.Thread):
+    """ Dedicated thread sending messages in the order they are queued
+
+        The queue is bounded; once it holds `max_queue_size` messages,
+        send() blocks until the thread catches up. Errors raised while
+        sending are reported by the next call to flush(). Blocking calls
+        can be interrupted (e.g., by KeyboardInterrupt).
+    """
+    def __init__ (self, send_function, max_queue_size):
+        threading.Thread.__init__(self, name = "callysto-iopub-sender")
+        self.daemon = True
+
+        self._send_function = send_function
+        self._queue = Queue.Queue(max_queue_size)
+        self._exc_info = None
+
+    def run (self):
+        while True:
+            args = self._queue.get()
+            try:
+                if (args is None):
+                    return
+
+                # once an error occurred, the following messages are
+                # dropped so that the order of messages is never broken
+                if (self._exc_info is None):
+                    self._send_function(*args)
+
+            except Exception:
+                self._exc_info = sys.exc_info()
+
+            finally:
+                self._queue.task_done()
+
+    def _put (self, item):
+        while True:
+            try:
+                self._queue.put(item, timeout = _POLL_INTERVAL)
+                return
+            except Queue.Full:
+                pass
+
+    def send (self, *args):
+        self._put(args)
+
+    def flush (self):
+        """ Wait for all queued messages to be sent
+        """
+        all_tasks_done = self._queue.all_tasks_done
+        with all_tasks_done:
+            while (self._queue.unfinished_tasks > 0):
+                all_tasks_done.wait(_POLL_INTERVAL)
+
+        if (self._exc_info is not None):
+            exc_type, exc_value, exc_traceback = self._exc_info
+            self._exc_info = None
+
+            future.utils.raise_with_traceback(Exception(
+                "Error while sending message: %s" % exc_value), exc_traceback)
+
+    def stop (self):
+        self._put(None)
+        while (self.is_alive()):
+            self.join(_POLL_INTERVAL)
+
+class TextStream:
+    """ Buffer for plain text, sent as a single message once it holds
+        `max_lines` lines or `max_size` characters, or once the oldest
+        text it holds is `max_delay` seconds old; text written after a
+        quiet period of `max_delay` seconds is sent right away
+
+        Delayed text is sent by a dedicated thread, so that it is not
+        held back by a slow writer. Errors raised while sending are
+        reported by the next call to write() or flush().
+    """
+    def __init__ (self, send_function, max_lines, max_size, max_delay):
+        self._send_function = send_function
+        self.max_lines, self.max_size = max_lines, max_size
+        self.max_delay = max_delay
+
+        self._chunks, self._n_lines, self._size = [], 0, 0
+        self._first_write, self._last_send = None, 0
+        self._exc_info, self._closed = None, False
+
+        self._condition = threading.Condition(threading.Lock())
+        self._sender = threading.Thread(
+            target = self._run, name = "callysto-text-stream")
+        self._sender.daemon = True
+        self._sender.start()
+
+    def _send (self):
+        # called with the lock held
+        text = u''.join(self._chunks)
+        self._chunks, self._n_lines, self._size = [], 0, 0
+        self._first_write, self._last_send = None, time.time()
+
+        # once an error occurred, the following text is dropped
+        if (self._exc_info is None):
+            try:
+                self._send_function(text)
+            except Exception:
+                self._exc_info = sys.exc_info()
+
+    def _run (self):
+        with self._condition:
+            while (not self._closed):
+                if (self._first_write is None):
+                    self._condition.wait()
+                    continue
+
+                remaining = self._first_write + self.max_delay - time.time()
+                if (remaining > 0):
+                    self._condition.wait(remaining)
+                else:
+                    self._send()
+
+    def _raise_error (self):
+        if (self._exc_info is not None):
+            exc_type, exc_value, exc_traceback = self._exc_info
+            self._exc_info = None
+
+            future.utils.raise_with_traceback(Exception(
+                "Error while sending message: %s" % exc_value), exc_traceback)
+
+    def write (self, text):
+        with self._condition:
+            self._chunks.append(text)
+            self._n_lines += text.count('\n')
+            self._size += len(text)
+
+            now, is_first = time.time(), (self._first_write is None)
+            if (self._n_lines >= self.max_lines) or \
+               (self._size >= self.max_size) or \
+               (is_first and (now - self._last_send >= self.max_delay)):
+                self._send()
+
+            elif (is_first):
+                # the sender thread takes over from there
+                self._first_write = now
+                self._condition.notify()
+
+            self._raise_error()
+
+    def flush (self):
+        """ Send any buffered text now
+        """
+        with self._condition:
+            if (len(self._chunks) > 0):
+                self._send()
+            self._raise_error()
+
+    def close (self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._sender.join()
@@ -2,6 +2,7 @@
 __all__ = (
     "BaseKernel",)
 
+import contextlib
 import inspect
 import json
 import logging
@@ -9,19 +10,47 @@ import logging.config
 import shutil
 import sys, os
 import tempfile
+import threading
+import time
 import traceback
 
 import future.utils
 import ipykernel.kernelapp
 import ipykernel.kernelbase
 import jupyter_client.kernelspec
-
+import tornado.ioloop
+import zmq
+
+import binary
+import completion
+import forkserver
+import host
+import iopub
+import large_input
+import logs
 import magics
+import memory
+import metrics
 import renderers.core
+import renderers.watchdog
+import scheduler
+import shm
+import snapshot
+import spill
+import tracing
 import utils
 
 _logger = logging.getLogger(__name__)
 
+# histogram buckets for memory sizes, from 0 (or less) to 1 GB
+_BYTES_BUCKETS = (
+    0, 1024, 64 * 1024, 1024 ** 2, 16 * 1024 ** 2, 256 * 1024 ** 2, 1024 ** 3)
+
+def _is_empty (code):
+    if (isinstance(code, large_input.LargeInput)):
+        return (len(code) == 0)
+    return (code.strip() == '')
+
 class BaseKernel (ipykernel.kernelbase.Kernel):
     implementation_name = "KERNEL_IMPLEMENTATION_NAME_PLACEHOLDER"
     implementation_version = "KERNEL_VERSION_PLACEHOLDER"
@@ -36,7 +65,7 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
         banner_ = "%s %s" % (
             self.implementation_name, self.implementation_version)
 
-        _logger.debug("banner requested; returned \"%s\"" % banner_)
+        _logger.debug("banner requested; returned \"%s\"", banner_)
         return banner_
 
     @property
@@ -47,14 +76,97 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             "mimetype": self.language_mimetype,
             "file_extension": self.language_file_extension}
 
-        _logger.debug("language_info requested; returned %s" % language_info_)
+        _logger.debug("language_info requested; returned %s", language_info_)
         return language_info_
 
     implementation = implementation_name
     language = language_name
 
+    # minimum delay, in seconds, between two updates of a same display;
+    # frames yielded with a 'display_id' metadata field faster than that
+    # only have their latest state sent
+    display_update_interval = 0.1
+
+    # if above zero, messages are sent to the notebook by a dedicated
+    # thread, while the kernel goes on with the next frames; no more than
+    # this number of messages can be waiting to be sent at any time
+    iopub_queue_size = 0
+    _response_sender = None
+
+    # if set, plain text frames without metadata bypass the renderers
+    # and are buffered, then sent as a single message once it holds
+    # `text_flush_lines` lines or `text_flush_size` characters, or once
+    # the oldest buffered text is `text_flush_interval` seconds old
+    stream_text = False
+    text_flush_lines = 100
+    text_flush_size = 64 * 1024
+    text_flush_interval = 0.1
+    _text_stream = None
+
+    # if set, the code of cells longer than this number of characters
+    # is written to a file in `large_input_directory` (the temporary
+    # directory by default); do_execute_() and pre-flight commands then
+    # receive a LargeInput view of this file rather than a string, and
+    # only magic commands on the first lines of these cells are parsed
+    large_input_threshold = None
+    large_input_directory = None
+
+    # size, in bytes, of the chunks binary frames are split into
+    # when sent through a comm channel (see MIME_TYPE.BINARY)
+    binary_chunk_size = 1024 * 1024
+
+    # maximum size, in bytes, of a single frame and of all frames sent
+    # by a cell; oversized frames are written in the spill directory (a
+    # temporary directory by default) and replaced by a truncated preview
+    max_frame_size = None
+    max_cell_output_size = None
+    spill_directory = None
+    spill_preview_size = 1024
+    _output_budget = None
+
+    # if set, metrics about the kernel activity are served in the
+    # Prometheus text format on this port of localhost, and/or written
+    # to this file every `metrics_interval` seconds; hosted instances
+    # (see launch_host) share the metrics and tracer of their host
+    metrics_port = None
+    metrics_file = None
+    metrics_interval = 15
+
+    # if set, the processing of each execution request is traced and
+    # the resulting spans written to this file, for a fraction of them
+    trace_file = None
+    trace_sampling_rate = 1.0
+
+    # if set, the memory retained by each cell and renderer is measured
+    # (with tracemalloc if available, from the resident set size if not)
+    # and reported by the 'memory-report' post-flight magic command;
+    # cells retaining at least `memory_leak_threshold` bytes on each of
+    # their last runs are flagged as leaking
+    track_memory = False
+    memory_history_size = 10
+    memory_leak_threshold = 1024 * 1024
+
+    # names of attributes saved when the kernel restarts, and restored
+    # by the new kernel instance before do_startup_() is called; the
+    # snapshot file is next to the connection file, unless set here
+    # (suffixed with the name of the connection file if hosted)
+    snapshot_attributes = ()
+    snapshot_file = None
+
+    # set if this instance is hosted alongside others (see launch_host)
+    _host = None
+    _host_connection_file = None
+
+    # if set, requests waiting on the shell channel are read ahead, so
+    # that consecutive identical execution requests are coalesced into
+    # the last one, and silent ones repeated later in the queue dropped;
+    # the requests skipped this way are replied to as aborted
+    coalesce_requests = False
+    _shell_queue = None
+    _dispatching_shell_queue = False
+
     def __init__ (self, **kwargs):
-        _logger.debug("initializing kernel instance %s" % self)
+        _logger.debug("initializing kernel instance %s", self)
         ipykernel.kernelbase.Kernel.__init__(self, **kwargs)
 
         # expose shortcuts to the magic commands and renderers API
@@ -66,33 +178,447 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
         self.declare_post_flight_command = \
             self.magic_commands.declare_post_flight_command
 
-        self.register_renderer = renderers.core.register_renderer
-        self.deregister_renderer = renderers.core.deregister_renderer
+        # vocabulary for code completion, in addition to magic commands
+        self.completions = completion.CompletionManager(self.magic_commands)
+
+        # total number of frames and bytes diverted to the spill directory
+        self.spilled_frames, self.spilled_bytes = 0, 0
+
+        # held while emitting a sub-frame, as streamed text is emitted
+        # by another thread than the other frames (see iopub.TextStream)
+        self._emit_lock = threading.Lock()
+
+        self._host, self._host_connection_file = host._hosted_instance()
+
+        if (self._host is None):
+            self.metrics = self._create_metrics()
+            self._metrics_exporters = self._start_metrics_exporters(
+                self.metrics)
+            self.tracer = self._create_tracer()
+        else:
+            # hosted instances would otherwise compete for the same
+            # port and files; their host exports for all of them
+            self.metrics, self.tracer = self._host._shared_resources(self)
+            self._metrics_exporters = []
+
+        if (self.track_memory):
+            self.memory = memory.MemoryTracker(
+                history_size = self.memory_history_size,
+                leak_threshold = self.memory_leak_threshold)
+            self.declare_post_flight_command(
+                "memory-report", self._memory_report)
+        else:
+            self.memory = None
+
+        # state saved by the previous instance of this kernel, if any
+        self.snapshot = self._load_snapshot()
+        if (self.snapshot is not None):
+            snapshot.restore_attributes(self, self.snapshot)
 
         self.do_startup_(**kwargs)
-        _logger.debug("initializing kernel instance %s: done" % self)
+
+        if (self.snapshot is not None):
+            snapshot.restore_settings(self, self.snapshot)
+            self.do_restore_(self.snapshot)
+
+        _logger.debug("initializing kernel instance %s: done", self)
+
+    def register_renderer (self, renderer, mime_type, **kwargs):
+        """ Register a renderer for the frames of this kernel only;
+            see renderers.register_renderer() for the arguments
+        """
+        renderers.core.register_renderer(
+            renderer, mime_type, scope = self, **kwargs)
+
+    def deregister_renderer (self, renderer, mime_type = None):
+        renderers.core.deregister_renderer(
+            renderer, mime_type, scope = self)
+
+    def register_javascript_module (self, name, path):
+        renderers.core.register_javascript_module(name, path, scope = self)
+
+    def _get_snapshot_file (self):
+        # the connection file is kept by Jupyter when restarting a
+        # kernel, and identifies each instance hosted by a process
+        if (self._host is not None):
+            if (self.snapshot_file is None):
+                return os.path.abspath(
+                    self._host_connection_file) + ".snapshot"
+
+            return "%s.%s" % (self.snapshot_file,
+                os.path.basename(self._host_connection_file))
+
+        if (self.snapshot_file is not None):
+            return self.snapshot_file
+
+        if (ipykernel.kernelapp.IPKernelApp.initialized()):
+            app = ipykernel.kernelapp.IPKernelApp.instance()
+            if (app.connection_file):
+                return app.abs_connection_file + ".snapshot"
+
+        return None
+
+    def _load_snapshot (self):
+        snapshot_fn = self._get_snapshot_file()
+        if (snapshot_fn is None) or (not os.path.exists(snapshot_fn)):
+            return None
+
+        try:
+            snapshot_ = snapshot.Snapshot.load(snapshot_fn)
+        except Exception as exception:
+            _logger.error("unable to read snapshot %s: %s",
+                snapshot_fn, exception)
+            return None
+        finally:
+            # a snapshot is only used by the instance following its writer
+            os.unlink(snapshot_fn)
+
+        _logger.debug("loaded snapshot %s (%d %s)", snapshot_fn,
+            len(snapshot_), utils.plural("entry", len(snapshot_)))
+
+        return snapshot_
+
+    def _save_snapshot (self):
+        snapshot_fn = self._get_snapshot_file()
+        if (snapshot_fn is None):
+            return
+
+        try:
+            snapshot.take_snapshot(self).save(snapshot_fn)
+        except Exception as exception:
+            _logger.error("unable to write snapshot %s: %s",
+                snapshot_fn, exception)
+            return
+
+        _logger.debug("saved snapshot %s", snapshot_fn)
+
+    def _start_metrics_exporters (self, registry):
+        exporters = []
+
+        if (self.metrics_port is not None):
+            exporters.append(
+                metrics.MetricsServer(registry, self.metrics_port))
+
+        if (self.metrics_file is not None):
+            exporters.append(metrics.MetricsFileWriter(
+                registry, self.metrics_file, self.metrics_interval))
+
+        for exporter in exporters:
+            exporter.start()
+
+        return exporters
+
+    def _create_tracer (self):
+        if (self.trace_file is None):
+            return tracing.NO_TRACER
+
+        return tracing.Tracer(self.trace_file, self.trace_sampling_rate)
+
+    def _create_metrics (self):
+        registry = metrics.MetricsRegistry()
+
+        registry.counter("callysto_cells_total",
+            "Number of cells executed, by status")
+        registry.histogram("callysto_cell_duration_seconds",
+            "Time spent executing cells, in seconds")
+        registry.counter("callysto_emitted_messages_total",
+            "Number of messages sent to the notebook, by message type")
+        registry.counter("callysto_emitted_bytes_total",
+            "Size of the content sent to the notebook, by MIME type")
+        registry.counter("callysto_spilled_bytes_total",
+            "Size of the content written to the spill directory")
+        registry.histogram("callysto_renderer_duration_seconds",
+            "Time spent in renderers, in seconds, by renderer")
+        registry.counter("callysto_renderer_errors_total",
+            "Number of errors raised by renderers, by renderer")
+        registry.counter("callysto_renderer_budget_exceeded_total",
+            "Number of renderers stopped for exceeding their time "
+            "or memory limit, by renderer and reason")
+        registry.histogram("callysto_cell_retained_bytes",
+            "Memory retained by cells, in bytes",
+            buckets = _BYTES_BUCKETS)
+        registry.histogram("callysto_renderer_retained_bytes",
+            "Memory retained by renderers, in bytes, by renderer",
+            buckets = _BYTES_BUCKETS)
+        registry.counter("callysto_leaking_cells_total",
+            "Number of cell executions flagged as leaking memory")
+        registry.histogram("callysto_shell_queue_depth",
+            "Number of shell requests waiting when one is processed",
+            buckets = (0, 1, 2, 5, 10, 20, 50, 100))
+        registry.histogram("callysto_shell_queue_wait_seconds",
+            "Time shell requests waited before being processed, "
+            "in seconds")
+        registry.counter("callysto_skipped_requests_total",
+            "Number of shell requests skipped without being processed, "
+            "by message type and reason")
+
+        return registry
+
+    @contextlib.contextmanager
+    def _monitor_renderer (self, renderer, mime_type):
+        renderer_name = getattr(renderer, "__name__", str(renderer))
+        start_time = time.time()
+
+        if (self.memory is not None):
+            start_memory = self.memory.measure()
+
+        try:
+            with self.tracer.span("render",
+                renderer = renderer_name, mime_type = mime_type):
+                yield
+
+        except renderers.watchdog.BudgetExceeded as exception:
+            self.metrics["callysto_renderer_budget_exceeded_total"].inc(
+                renderer = renderer_name, reason = exception.reason)
+            raise
+
+        except Exception:
+            self.metrics["callysto_renderer_errors_total"].inc(
+                renderer = renderer_name)
+            raise
+
+        finally:
+            self.metrics["callysto_renderer_duration_seconds"].observe(
+                time.time() - start_time, renderer = renderer_name)
+
+            if (self.memory is not None):
+                retained = self.memory.measure() - start_memory
+                self.memory.record_renderer(renderer_name, retained)
+                self.metrics["callysto_renderer_retained_bytes"].observe(
+                    retained, renderer = renderer_name)
 
     def do_startup_ (self, **kwargs):
         pass
 
+    def do_snapshot_ (self, snapshot):
+        """ Add values to the snapshot taken when restarting the kernel;
+            `snapshot` is a dictionary-like object of picklable values
+        """
+        pass
+
+    def do_restore_ (self, snapshot):
+        """ Called after do_startup_() when a snapshot was found; values
+            are only unpickled when accessed, and remain available
+            afterward as the `snapshot` attribute of the kernel
+        """
+        pass
+
     def do_shutdown (self, restart = False):
         verb = "restarting" if (restart) else "shutting down"
-        _logger.debug("%s kernel instance %s" % (verb, self))
+        _logger.debug("%s kernel instance %s", verb, self)
+
+        if (restart):
+            self._save_snapshot()
+
         self.do_shutdown_(restart)
-        _logger.debug("%s kernel instance %s: done" % (verb, self))
+
+        if (self._text_stream is not None):
+            self._text_stream.close()
+            self._text_stream = None
+
+        if (self._response_sender is not None):
+            self._response_sender.stop()
+            self._response_sender = None
+
+        for exporter in self._metrics_exporters:
+            exporter.stop()
+        self._metrics_exporters = []
+
+        # the tracer of hosted instances is closed by their host
+        if (self._host is None):
+            self.tracer.close()
+
+        _logger.debug("%s kernel instance %s: done", verb, self)
 
     def do_shutdown_ (self, will_restart = False):
         pass
 
+    def shutdown_request (self, stream, ident, parent):
+        if (self._host is None):
+            return ipykernel.kernelbase.Kernel.shutdown_request(
+                self, stream, ident, parent)
+
+        # same as the base method, except that a hosted instance
+        # must not stop the event loop shared with the others
+        content = self.do_shutdown(parent["content"]["restart"])
+        self.session.send(stream, "shutdown_reply", content, parent,
+            ident = ident)
+        self._shutdown_message = self.session.msg(
+            "shutdown_reply", content, parent)
+        self._at_shutdown()
+
+        io_loop = tornado.ioloop.IOLoop.current()
+        io_loop.add_timeout(time.time() + 0.1,
+            lambda: self._host.remove_kernel(self))
+
+    def dispatch_shell (self, stream, msg):
+        if (not self.coalesce_requests) or (self._is_control_stream(stream)):
+            return ipykernel.kernelbase.Kernel.dispatch_shell(
+                self, stream, msg)
+
+        if (self._shell_queue is None):
+            self._shell_queue = scheduler.RequestQueue(self.session)
+
+        self._shell_queue.push(stream, msg)
+
+        # requests pushed while processing the queue (e.g.,
+        # by a handler flushing a stream) are processed below
+        if (self._dispatching_shell_queue):
+            return
+
+        self._dispatching_shell_queue = True
+        try:
+            while (len(self._shell_queue) > 0):
+                self._read_shell_requests()
+                request = self._shell_queue.pop()
+
+                self.metrics["callysto_shell_queue_depth"].observe(
+                    len(self._shell_queue))
+                self.metrics["callysto_shell_queue_wait_seconds"].observe(
+                    request.wait_time())
+
+                if (request.superseded is None):
+                    ipykernel.kernelbase.Kernel.dispatch_shell(
+                        self, request.stream, request.frames)
+                else:
+                    self._skip_shell_request(request)
+        finally:
+            self._dispatching_shell_queue = False
+
+    def _is_control_stream (self, stream):
+        # ipykernel 4 passes the control stream as a second shell
+        # stream (see IPKernelApp.init_kernel), not as control_stream
+        return (stream is self.control_stream) or \
+            (stream is not self.shell_streams[0])
+
+    def _read_shell_requests (self):
+        # read all requests waiting in the shell sockets, without blocking;
+        # control requests are not queued behind the execution requests,
+        # but dispatched as soon as read
+        for stream in self.shell_streams:
+            is_control_stream = self._is_control_stream(stream)
+            while True:
+                try:
+                    frames = stream.socket.recv_multipart(
+                        zmq.NOBLOCK, copy = False)
+                except zmq.Again:
+                    break
+
+                if (is_control_stream):
+                    ipykernel.kernelbase.Kernel.dispatch_shell(
+                        self, stream, frames)
+                else:
+                    self._shell_queue.push(stream, frames)
+
+    def _skip_shell_request (self, request):
+        idents, msg = self.session.feed_identities(
+            request.frames, copy = False)
+        try:
+            msg = self.session.deserialize(msg, content = True, copy = False)
+        except Exception:
+            _logger.error("invalid message", exc_info = True)
+            return
+
+        msg_type = msg["header"]["msg_type"]
+        _logger.debug("skipping %s %s (%s)",
+            msg_type, msg["header"]["msg_id"], request.superseded)
+
+        self.metrics["callysto_skipped_requests_total"].inc(
+            msg_type = msg_type, reason = request.superseded)
+
+        status = {"status": "aborted"}
+        metadata = {"engine": self.ident}
+        metadata.update(status)
+
+        self._publish_status(u"busy", parent = msg)
+        self.session.send(request.stream, msg_type.split('_')[0] + "_reply",
+            content = status, metadata = metadata,
+            parent = msg, ident = idents)
+        self._publish_status(u"idle", parent = msg)
+
+    def _abort_queues (self):
+        # requests already read ahead are aborted as well
+        if (self._shell_queue is not None):
+            self._shell_queue.abort_all()
+
+        ipykernel.kernelbase.Kernel._abort_queues(self)
+
+    def do_complete (self, code, cursor_pos):
+        return self.completions.complete(code, cursor_pos)
+
     def do_execute (self, code, silent,
         store_history, user_expressions, allow_stdin):
+        start_time = time.time()
+
+        if (self.memory is not None):
+            start_memory = self.memory.measure()
+
+        with self.tracer.span("execute_request",
+            execution_count = self.execution_count,
+            silent = silent, code_length = len(code)) as span:
+            reply = self._execute_cell(code, silent,
+                store_history, user_expressions, allow_stdin)
+
+            status = "ok" if (reply is None) else reply["status"]
+            span.set_attribute("status", status)
+
+        self.metrics["callysto_cells_total"].inc(status = status)
+        self.metrics["callysto_cell_duration_seconds"].observe(
+            time.time() - start_time)
+
+        if (self.memory is not None):
+            self._record_cell_memory(code, self.memory.measure() - start_memory)
+
+        return reply
+
+    def _record_cell_memory (self, code, retained):
+        history = self.memory.record_cell(code, retained)
+        self.metrics["callysto_cell_retained_bytes"].observe(retained)
+
+        if (self.memory.is_leaking(history)):
+            _logger.warning("cell '%s' retained %s or more on each of "
+                "its last %d runs", history.label,
+                memory._format_size(self.memory.leak_threshold),
+                self.memory.leak_runs)
+            self.metrics["callysto_leaking_cells_total"].inc()
+
+    def _memory_report (self, code, frames):
+        """ Usage: memory-report
+        """
+        for frame in frames:
+            yield frame
+
+        table = [("", "name", "runs", "last run", "overall", "leaking")]
+        for (kind, label, n_runs, last, total, is_leaking) in \
+            self.memory.report():
+            table.append((kind, label, n_runs,
+                memory._format_size(last), memory._format_size(total),
+                "yes" if (is_leaking) else "no"))
+
+        yield (renderers.core.MIME_TYPE.CSV_WITH_HEADER, table)
+
+    def _execute_cell (self, code, silent,
+        store_history, user_expressions, allow_stdin):
+        large_input_ = None
+
+        # shared content handles existing before the cell executes; those
+        # created by the cell are released after it, even if not sent
+        shared_handles = set(shm._handles)
         try:
             # extract pre/post flight commands, if any
-            pre_flight_commands, post_flight_commands, user_code = \
-                self.magic_commands._parse_code(code)
+            with self.tracer.span("parse_magic_commands"):
+                if (self.large_input_threshold is not None) and \
+                   (len(code) > self.large_input_threshold):
+                    pre_flight_commands, post_flight_commands, offset = \
+                        self.magic_commands._parse_header(code)
+                    user_code = large_input_ = large_input.LargeInput.create(
+                        code, offset, self.large_input_directory)
+                else:
+                    pre_flight_commands, post_flight_commands, user_code = \
+                        self.magic_commands._parse_code(code)
 
             # if there is no user code nor pre/post flight commands, do nothing
-            if (user_code.strip() == '') and \
+            if (_is_empty(user_code)) and \
                (len(pre_flight_commands) == 0) and \
                (len(post_flight_commands) == 0):
                 return
@@ -101,7 +627,9 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             for (mc_name, mc_function) in pre_flight_commands:
                 try:
                     # input: string; output: string (or None)
-                    mc_output = mc_function(user_code)
+                    with self.tracer.span("pre_flight_command",
+                        command = mc_name):
+                        mc_output = mc_function(user_code)
 
                 except Exception as exception:
                     future.utils.raise_with_traceback(Exception(
@@ -110,20 +638,22 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
 
                 # output, if any, becomes the new user code
                 if (mc_output is not None):
-                    assert utils.is_string(mc_output), (
+                    assert utils.is_string(mc_output) or \
+                        isinstance(mc_output, large_input.LargeInput), (
                         "Invalid return value for pre-flight "
                         "magic command '%s': Must be a string" % mc_name)
                     user_code = mc_output
 
             # (2/4) pass the user code to the kernel and retrieve frames
-            if (user_code.strip() == ''):
+            if (_is_empty(user_code)):
                 result_frames = []
             else:
                 try:
-                    _logger.debug("executing:\n%s" % user_code)
+                    _logger.debug("executing:\n%s", user_code)
                     # input: string; output: generator
-                    result_frames = self.do_execute_(user_code)
-                    result_frames = renderers.core._check_frames(result_frames)
+                    result_frames = self.tracer.span_frames("do_execute_",
+                        renderers.core._check_frames(
+                            self.do_execute_(user_code)))
                     _logger.debug("executing: done")
 
                 except Exception as exception:
@@ -134,8 +664,10 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             for (mc_name, mc_function) in post_flight_commands:
                 try:
                     # input: generator; output: generator
-                    mc_output = mc_function(user_code, result_frames)
-                    mc_output = renderers.core._check_frames(mc_output)
+                    mc_output = self.tracer.span_frames("post_flight_command",
+                        renderers.core._check_frames(
+                            mc_function(user_code, result_frames)),
+                        command = mc_name)
 
                 except Exception as exception:
                     future.utils.raise_with_traceback(Exception(
@@ -149,55 +681,90 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             if (silent):
                 _logger.debug("emitting nothing (silent notebook)")
             else:
-                n_frames, n_subframes = 0, 0
+                self._output_budget = self._create_output_budget()
+
+                # renderers registered through this kernel only apply
+                # to its frames, as other kernels may share the process
+                renderers.core._set_scope(self)
+
+                # some renderers only send once per notebook session
+                renderers.core._set_frontend_session(
+                    self._parent_header.get("header", {}).get("session"))
+
+                # content shared by handle (see shm.py) is mapped rather
+                # than copied, and released once its frame is sent
+                result_frames = shm._map_frames(result_frames)
+
+                text_stream = self._get_text_stream()
+
+                n_frames, n_subframes, displays = 0, 0, {}
                 for (mime_type, content, metadata) in result_frames:
+                    if (text_stream is not None):
+                        # only Unicode strings are streamed; the others
+                        # (e.g., content shared in memory) go through the
+                        # renderers, which convert them
+                        if (mime_type == "text/plain") and \
+                           (not metadata) and (type(content) is unicode):
+                            # budgets apply to each frame, rather than
+                            # to the batches of text sent by the stream
+                            frame = (mime_type, content, metadata)
+                            if (self._output_budget is not None):
+                                with self._emit_lock:
+                                    frame = self._output_budget.check(*frame)
+
+                            if (frame is not None):
+                                text_stream.write(frame[1])
+                            n_frames += 1
+                            continue
+
+                        # text must be sent before any following frame
+                        text_stream.flush()
+
+                    # frames carrying a display identifier are displayed
+                    # once, then updated in place by subsequent frames
+                    display_id = None
+                    if (metadata is not None) and ("display_id" in metadata):
+                        metadata = dict(metadata)
+                        display_id = metadata.pop("display_id")
+
                     # feed the content to any compatible renderer and
                     # send the resulting sub-frame(s) to the notebook
                     try:
                         subframes = renderers.core._render_content(
-                            mime_type, content, metadata)
+                            mime_type, content, metadata,
+                            self._monitor_renderer)
 
                     except Exception as exception:
                         future.utils.raise_with_traceback(Exception(exception))
 
-                    for (mime_type_, content_, metadata_) in subframes:
-                        length_ = len(content_)
-                        metadata_ = {} if (metadata_ is None) else metadata_
-
-                        if (mime_type_ == "text/plain"):
-                            _logger.debug("emitting text"
-                                " (%d %s)" % (
-                                    len(content_),
-                                    utils.plural("character", length_)))
-
-                            response = ("stream", {
-                                "name": "stdout",
-                                "text": unicode(content_)})
-                        else:
-                            _logger.debug("emitting data"
-                                " (%s, %d %s, metadata = %s)" % (
-                                    mime_type_,
-                                    len(content_),
-                                    utils.plural("byte", length_),
-                                    metadata_))
-
-                            response = ("display_data", {
-                                "metadata": metadata_,
-                                "data": {mime_type_: content_}})
-
-                        self.send_response(self.iopub_socket, *response)
-                        n_subframes += 1
+                    if (display_id is None):
+                        for subframe in subframes:
+                            self._emit_subframe(*subframe)
+                            n_subframes += 1
+                    else:
+                        n_subframes += self._emit_display(
+                            displays, display_id, subframes)
 
+                    n_subframes += self._flush_displays(displays)
                     n_frames += 1
 
-                _logger.debug("emitted %d %s from %d %s" % (
-                    n_subframes, utils.plural("subframe", n_subframes),
-                    n_frames, utils.plural("frame", n_frames)))
+                n_subframes += self._flush_displays(displays, force = True)
+
+                if (_logger.isEnabledFor(logging.DEBUG)):
+                    _logger.debug("emitted %d %s from %d %s",
+                        n_subframes, utils.plural("subframe", n_subframes),
+                        n_frames, utils.plural("frame", n_frames))
+
+            # all frames must have been sent before the execution reply
+            self._flush_responses()
+            self._release_output_budget()
 
         except KeyboardInterrupt:
             msg = "Execution aborted by user"
 
             _logger.error(msg)
+            self._flush_responses(raise_errors = False)
+            self._release_output_budget()
             self.send_response(self.iopub_socket, "stream",
                 {"name": "stderr", "text": msg})
 
@@ -220,6 +787,8 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             if (str(exc_value).strip() == ''):
                 msg += "(no message)"
 
+            self._flush_responses(raise_errors = False)
+            self._release_output_budget()
             self.send_response(self.iopub_socket, "stream",
                 {"name": "stderr", "text": msg})
 
@@ -239,6 +808,12 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
                 "evalue": msg,
                 "traceback": stack}
 
+        finally:
+            renderers.core._set_scope(None)
+            shm._release_handles(shared_handles)
+            if (large_input_ is not None):
+                large_input_.close()
+
         # the execution happened without error
         return {
             "status": "ok",
@@ -246,20 +821,235 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
             "payload": [],  # deprecated
             "user_expressions": {}}
 
+    def _send_response (self, msg_type, content, buffers = None):
+        self.metrics["callysto_emitted_messages_total"].inc(
+            msg_type = msg_type)
+
+        with self.tracer.span("send", msg_type = msg_type):
+            self._deliver_response(msg_type, content, buffers)
+
+    def _deliver_response (self, msg_type, content, buffers = None):
+        args = (self.iopub_socket, msg_type, content)
+        if (buffers is not None):
+            args += (None, buffers)
+
+        if (self.iopub_queue_size > 0):
+            if (self._response_sender is None):
+                self._response_sender = iopub.ResponseSender(
+                    self.send_response, self.iopub_queue_size)
+                self._response_sender.start()
+
+            self._response_sender.send(*args)
+        else:
+            self.send_response(*args)
+
+    def _get_text_stream (self):
+        if (not self.stream_text):
+            return None
+
+        if (self._text_stream is None):
+            # streamed text was checked against the budget when written
+            self._text_stream = iopub.TextStream(
+                lambda text: self._emit_subframe(
+                    "text/plain", text, None, check_budget = False),
+                self.text_flush_lines,
+                self.text_flush_size,
+                self.text_flush_interval)
+        else:
+            # the thresholds may have changed since the previous cell
+            text_stream = self._text_stream
+            text_stream.max_lines = self.text_flush_lines
+            text_stream.max_size = self.text_flush_size
+            text_stream.max_delay = self.text_flush_interval
+
+        return self._text_stream
+
+    def _flush_responses (self, raise_errors = True):
+        # buffered text goes first, as it may be queued for sending
+        for pending in (self._text_stream, self._response_sender):
+            if (pending is None):
+                continue
+
+            try:
+                pending.flush()
+            except Exception as exception:
+                if (raise_errors):
+                    raise
+                _logger.error(str(exception))
+
+    def _create_output_budget (self):
+        if (self.max_frame_size is None) and \
+           (self.max_cell_output_size is None):
+            return None
+
+        if (self.spill_directory is None):
+            self.spill_directory = tempfile.mkdtemp(prefix = "callysto-")
+            _logger.debug("created spill directory %s", self.spill_directory)
+
+        return spill.OutputBudget(
+            self.max_frame_size,
+            self.max_cell_output_size,
+            self.spill_directory,
+            self.spill_preview_size)
+
+    def _release_output_budget (self):
+        if (self._output_budget is None):
+            return
+
+        self.spilled_frames += self._output_budget.spilled_frames
+        self.spilled_bytes += self._output_budget.spilled_bytes
+        self.metrics["callysto_spilled_bytes_total"].inc(
+            self._output_budget.spilled_bytes)
+        self._output_budget = None
+
+    def _emit_subframe (self, mime_type, content, metadata,
+        check_budget = True):
+        with self._emit_lock:
+            self._send_subframe(mime_type, content, metadata, check_budget)
+
+    def _send_subframe (self, mime_type, content, metadata,
+        check_budget = True):
+        is_binary = (mime_type == renderers.core.MIME_TYPE.BINARY.value)
+
+        # streamed binary content (i.e., an iterable of chunks)
+        # has an unknown size, and isn't subject to the budget
+        if (check_budget) and (self._output_budget is not None) and \
+           ((not is_binary) or binary.is_buffer(content)):
+            frame = self._output_budget.check(mime_type, content, metadata)
+            if (frame is None):
+                return
+            mime_type, content, metadata = frame
+            is_binary = (mime_type == renderers.core.MIME_TYPE.BINARY.value)
+
+        if (is_binary):
+            n_bytes = binary.send_binary(self._send_response,
+                content, metadata, self.binary_chunk_size,
+                renderers.core._frontend_session)
+            self.metrics["callysto_emitted_bytes_total"].inc(n_bytes,
+                mime_type = (metadata or {}).get(
+                    "mime_type", binary.DEFAULT_MIME_TYPE))
+            return
+
+        renderers.core._frame_sent(mime_type, metadata)
+
+        length = len(content)
+        metadata = {} if (metadata is None) else metadata
+
+        if (mime_type == renderers.core.MIME_TYPE.BUNDLE.value):
+            self._count_emitted_bytes(content)
+        else:
+            self.metrics["callysto_emitted_bytes_total"].inc(
+                length, mime_type = mime_type)
+
+        # building the log messages is costly; we only do so if needed
+        debug = _logger.isEnabledFor(logging.DEBUG)
+
+        if (mime_type == renderers.core.MIME_TYPE.BUNDLE.value):
+            if (debug):
+                _logger.debug("emitting data bundle (%s, metadata = %s)",
+                    ', '.join(sorted(content)), metadata)
+
+            response = ("display_data", {
+                "metadata": metadata,
+                "data": content})
+
+        elif (mime_type == "text/plain"):
+            if (debug):
+                _logger.debug("emitting text (%d %s)",
+                    length, utils.plural("character", length))
+
+            response = ("stream", {
+                "name": "stdout",
+                "text": unicode(content)})
+        else:
+            if (debug):
+                _logger.debug("emitting data (%s, %d %s, metadata = %s)",
+                    mime_type, length, utils.plural("byte", length), metadata)
+
+            response = ("display_data", {
+                "metadata": metadata,
+                "data": {mime_type: content}})
+
+        self._send_response(*response)
+
+    def _count_emitted_bytes (self, data):
+        for (mime_type, content) in data.iteritems():
+            self.metrics["callysto_emitted_bytes_total"].inc(
+                len(content), mime_type = mime_type)
+
+    def _send_display (self, msg_type, display_id, subframes):
+        # all sub-frames are sent as alternative
+        # representations of a single output
+        data, metadata = renderers.core._bundle_frames(subframes)
+
+        with self._emit_lock:
+            if (self._output_budget is not None):
+                frame = self._output_budget.check(
+                    renderers.core.MIME_TYPE.BUNDLE.value, data, metadata)
+                if (frame is None):
+                    return
+                data, metadata = renderers.core._bundle_frames([frame])
+
+            renderers.core._frame_sent(
+                renderers.core.MIME_TYPE.BUNDLE.value, metadata)
+            self._count_emitted_bytes(data)
+
+            if (_logger.isEnabledFor(logging.DEBUG)):
+                _logger.debug("emitting %s for display '%s' (%s)",
+                    msg_type, display_id, ', '.join(sorted(data)))
+
+            self._send_response(msg_type, {
+                "metadata": metadata,
+                "data": data,
+                "transient": {"display_id": display_id}})
+
+    def _emit_display (self, displays, display_id, subframes):
+        now = time.time()
+
+        # first frame for this display identifier in this cell
+        if (not display_id in displays):
+            self._send_display("display_data", display_id, subframes)
+            displays[display_id] = [now, None]
+            return 1
+
+        # subsequent frames are rate-limited; only
+        # the latest one is kept until it can be sent
+        display = displays[display_id]
+        if (now - display[0] < self.display_update_interval):
+            display[1] = subframes
+            return 0
+
+        self._send_display("update_display_data", display_id, subframes)
+        display[:] = [now, None]
+        return 1
+
+    def _flush_displays (self, displays, force = False):
+        now, n_updates = time.time(), 0
+        for (display_id, display) in displays.items():
+            if (display[1] is None):
+                continue
+
+            if (force) or (now - display[0] >= self.display_update_interval):
+                self._send_display(
+                    "update_display_data", display_id, display[1])
+                display[:] = [now, None]
+                n_updates += 1
+
+        return n_updates
+
     def do_execute_ (self, code):
         yield
 
     @classmethod
-    def launch (cls, debug = None):
-        """ Launch a singleton instance of this kernel
-
-            Note that this is a blocking operation; no more than one
-            kernel instance can be launched from the same thread.
-        """
+    def _configure_logging (cls, debug = None, queued = None):
         if (debug is None):
             debug = str(os.getenv("CALLYSTO_DEBUG", ""))
             debug = (debug.lower() in ("1", "true", "yes"))
 
+        if (queued is None):
+            queued = str(os.getenv("CALLYSTO_LOG_QUEUE", "yes"))
+            queued = (queued.lower() in ("1", "true", "yes"))
+
         logging.config.dictConfig({
             "version": 1,
             "disable_existing_loggers": False,
@@ -275,27 +1065,114 @@ class BaseKernel (ipykernel.kernelbase.Kernel):
                 "level": logging.DEBUG if (debug) else logging.INFO,
                 "propagate": True}}})
 
+        # log records are written by a background thread, so
+        # that the kernel is not blocked by slow log outputs
+        if (queued):
+            logs.start_listener()
+
         if (debug):
             _logger.info("running in debug mode")
 
-        _logger.debug("starting kernel application using %s" % cls)
+    @classmethod
+    def _launch_instance (cls):
+        _logger.debug("starting kernel application using %s", cls)
         ipykernel.kernelapp.IPKernelApp.launch_instance(kernel_class = cls)
-        _logger.debug("stopping kernel application using %s" % cls)
+        _logger.debug("stopping kernel application using %s", cls)
 
     @classmethod
-    def install (cls, all_users = False, prefix = None):
+    def launch (cls, debug = None, queued_logging = None):
+        """ Launch a singleton instance of this kernel
+
+            Note that this is a blocking operation; no more than one
+            kernel instance can be launched from the same thread. See
+            launch_host() to run several instances in one process.
+
+            Unless `queued_logging` is set to False (or the environment
+            variable CALLYSTO_LOG_QUEUE is set to 'no'), log messages
+            are written by a background thread.
+        """
+        cls._configure_logging(debug, queued_logging)
+        cls._launch_instance()
+
+    @classmethod
+    def do_warmup_ (cls):
+        pass
+
+    @classmethod
+    def launch_forkserver (cls, socket_path,
+        debug = None, queued_logging = None):
+        """ Launch a fork server for this kernel
+
+            The fork server is a long-lived process which imports this
+            kernel class and its dependencies once, calls do_warmup_(),
+            then forks a new kernel instance for each connection file
+            it receives through the UNIX socket at `socket_path`. See
+            the `forkserver` option of install().
+
+            Note that this is a blocking operation.
+        """
+        cls._configure_logging(debug, queued_logging)
+
+        _logger.debug("warming up %s", cls)
+        cls.do_warmup_()
+        _logger.debug("warming up %s: done", cls)
+
+        forkserver.serve(cls, socket_path)
+
+    @classmethod
+    def launch_host (cls, socket_path,
+        debug = None, queued_logging = None):
+        """ Launch a kernel host for this kernel
+
+            The kernel host is a long-lived process which runs a new
+            kernel instance, on a shared event loop, for each connection
+            file it receives through the UNIX socket at `socket_path`;
+            the instances share module-level resources such as the
+            registered renderers. The kernel can be installed with the
+            same `forkserver` option of install() as for a fork server.
+
+            Note that this is a blocking operation. Hosted instances
+            execute their cells one at a time, and can't be interrupted.
+        """
+        cls._configure_logging(debug, queued_logging)
+
+        _logger.debug("warming up %s", cls)
+        cls.do_warmup_()
+        _logger.debug("warming up %s: done", cls)
+
+        host.KernelHost(cls).serve(socket_path)
+
+    @classmethod
+    def install (cls, all_users = False, prefix = None, forkserver = None):
         """ Install this kernel
+
+            If `forkserver` is set to the path of a UNIX socket, the
+            kernel will be requested from the fork server or kernel host
+            listening on it (see launch_forkserver() and launch_host())
+            rather than started from scratch; it is started from scratch
+            if no server answers.
         """
+        module_name = inspect.getmodule(cls).__name__
+
         # create the kernel specifications file
-        kspec = {
-            "argv": [
+        if (forkserver is None):
+            argv = [
                 "python",
-                "-m", inspect.getmodule(cls).__name__,
-                "-f", "{connection_file}"],
+                "-m", module_name,
+                "-f", "{connection_file}"]
+        else:
+            argv = [
+                "callysto-connect-kernel",
+                "--socket", os.path.abspath(forkserver),
+                "--module", module_name,
+                "-f", "{connection_file}"]
+
+        kspec = {
+            "argv": argv,
             "display_name": cls.implementation_name,
             "language": cls.language_name}
 
-        _logger.debug("kernel specifications: %s" % kspec)
+        _logger.debug("kernel specifications: %s", kspec)
 
         kspec_path = tempfile.mkdtemp()
         kspec_fn = os.path.join(kspec_path, "kernel.json")
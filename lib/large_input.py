@@ -0,0 +1,95 @@
+# file-backed view of the code of large cells; the code is written once
+# to a temporary file, then read back line by line or mapped in memory,
+# rather than copied at each stage of the processing of the cell
+
+__all__ = (
+    "LargeInput",)
+
+import errno
+import io
+import logging
+import mmap
+import os
+import tempfile
+
+_logger = logging.getLogger(__name__)
+
+# number of characters written at once; Unicode code is encoded
+# by chunks, while byte strings are assumed to be UTF-8 already
+_CHUNK_SIZE = 1024 * 1024
+
+class LargeInput:
+    """ Read-only view of the code of a cell, stored as UTF-8 in a file;
+        iterating over it returns its lines (as Unicode strings, with
+        their line ending), while buffer() gives access to its bytes
+        without copying them
+
+        The view is only valid during the execution of the cell, after
+        which the file is removed.
+    """
+    def __init__ (self, filename, size):
+        self.filename, self.size = filename, size
+        self._buffer = None
+
+    @classmethod
+    def create (cls, code, offset = 0, directory = None):
+        """ Write `code`, starting at `offset`, to a temporary file
+            and return a view of it
+        """
+        fd, filename = tempfile.mkstemp(
+            prefix = "callysto-", suffix = ".input", dir = directory)
+
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                for start in xrange(offset, len(code), _CHUNK_SIZE):
+                    if (isinstance(code, unicode)):
+                        fh.write(
+                            code[start:start + _CHUNK_SIZE].encode("utf-8"))
+                    else:
+                        fh.write(buffer(code, start, _CHUNK_SIZE))
+                size = fh.tell()
+        except:
+            os.unlink(filename)
+            raise
+
+        _logger.debug("wrote %d bytes of code to %s", size, filename)
+        return cls(filename, size)
+
+    def __iter__ (self):
+        with io.open(self.filename, "rt", encoding = "utf-8") as fh:
+            for line in fh:
+                yield line
+
+    def __len__ (self):
+        return self.size
+
+    def buffer (self):
+        """ Return a read-only buffer on the UTF-8 encoded code
+        """
+        if (self._buffer is None):
+            if (self.size == 0):
+                self._buffer = ''
+            else:
+                with open(self.filename, "rb") as fh:
+                    self._buffer = buffer(mmap.mmap(
+                        fh.fileno(), self.size, access = mmap.ACCESS_READ))
+
+        return self._buffer
+
+    def read (self):
+        """ Return the whole code as a Unicode string; note that,
+            unlike iterating over the view, this copies it in memory
+        """
+        return unicode(self.buffer(), "utf-8")
+
+    def close (self):
+        # buffers already returned remain valid
+        self._buffer = None
+        try:
+            os.unlink(self.filename)
+        except OSError as exception:
+            if (exception.errno != errno.ENOENT):
+                raise
+
+    def __repr__ (self):
+        return "<LargeInput %s (%d bytes)>" % (self.filename, self.size)
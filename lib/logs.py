@@ -0,0 +1,122 @@
+# non-blocking logging, with log records being queued by the
+# caller then formatted and written by a background thread
+
+__all__ = (
+    "start_listener",
+    "stop_listener",
+    "restart_listener")
+
+import atexit
+import logging
+import Queue
+import threading
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+
+except ImportError:
+    # minimal equivalents of the Python 3 classes
+    class QueueHandler (logging.Handler):
+        def __init__ (self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def prepare (self, record):
+            # the message is merged with its arguments in the caller's
+            # thread, as these arguments may be modified afterward
+            self.format(record)
+            record.msg, record.args = record.message, None
+            record.exc_info = None
+            return record
+
+        def emit (self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener:
+        _sentinel = None
+
+        def __init__ (self, queue, *handlers):
+            self.queue = queue
+            self.handlers = handlers
+            self._thread = None
+
+        def _monitor (self):
+            while True:
+                record = self.queue.get()
+                if (record is self._sentinel):
+                    break
+
+                for handler in self.handlers:
+                    if (record.levelno >= handler.level):
+                        handler.handle(record)
+
+        def start (self):
+            self._thread = threading.Thread(target = self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def stop (self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+_listener, _queue_handler, _queued_logger = None, None, None
+
+def start_listener (logger = None):
+    """ Move the handlers of a logger (the root logger by default) to
+        a background thread, fed by a queue the logger writes to; this
+        has no effect if already done for this logger
+    """
+    global _listener, _queue_handler, _queued_logger
+
+    logger = logging.getLogger() if (logger is None) else logger
+    if (_listener is not None):
+        # the handlers of the logger may have been replaced since
+        if (logger is _queued_logger) and \
+           (_queue_handler in logger.handlers):
+            return
+        stop_listener()
+
+    handlers = list(logger.handlers)
+
+    _queue_handler = QueueHandler(Queue.Queue())
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(_queue_handler)
+
+    _listener = QueueListener(_queue_handler.queue, *handlers)
+    _listener.start()
+    _queued_logger = logger
+
+def stop_listener ():
+    """ Write any queued log record, stop the background thread,
+        and give its handlers back to the logger
+    """
+    global _listener, _queue_handler, _queued_logger
+    if (_listener is None):
+        return
+
+    _listener.stop()
+    if (_queue_handler in _queued_logger.handlers):
+        _queued_logger.removeHandler(_queue_handler)
+        for handler in _listener.handlers:
+            _queued_logger.addHandler(handler)
+
+    _listener, _queue_handler, _queued_logger = None, None, None
+
+def restart_listener ():
+    """ Restart the background thread after a fork; the queue, which
+        may have been left in an inconsistent state, is replaced
+    """
+    global _listener
+    if (_listener is None):
+        return
+
+    _queue_handler.queue = Queue.Queue()
+    _listener = QueueListener(_queue_handler.queue, *_listener.handlers)
+    _listener.start()
+
+atexit.register(stop_listener)
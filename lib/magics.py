@@ -1,23 +1,41 @@
 
+import collections
 import functools
 import logging
 import re
 
 import docopt
 
+import completion
 import utils
 
 _logger = logging.getLogger(__name__)
 
+# maximum number of parsed sets of magic commands kept in cache
+_MAX_CACHED_PLANS = 64
+
 class MagicCommandsManager:
     def __init__ (self):
         self._magic_commands_prefix = '%'
         self._magic_commands = {}
 
+        # indexes used for code completion
+        self._names = completion.CompletionIndex()
+        self._options = {}
+
+        # original declarations, as needed for kernel snapshots
+        self._declarations = {}
+
+        # magic commands of the cells, once parsed, keyed by
+        # the prefix and their lines; cleared whenever commands
+        # are declared or removed
+        self._plans = collections.OrderedDict()
+
     def set_prefix (self, prefix):
         if (not utils.is_string(prefix)) or (len(prefix) != 1):
             raise ValueError("Invalid value for prefix: must be a character")
         self._magic_commands_prefix = prefix
+        self._plans.clear()
 
     def get_prefix (self):
         return self._magic_commands_prefix
@@ -71,19 +89,26 @@ class MagicCommandsManager:
 
             _logger.debug(
                 "executing %s-flight command '%s' "
-                "(callback function: %s)" % (
-                    "pre" if is_pre_flight else "post",
-                    name.lower(), callback_function))
+                "(callback function: %s)",
+                "pre" if is_pre_flight else "post",
+                name.lower(), callback_function)
 
             return callback_function(*args_from_kernel, **kwargs)
 
+        if (not self.has_command(name)):
+            self._names.add(name.lower())
+
         self._magic_commands[name.lower()] = (
             functools.partial(_wrapper, doc), is_pre_flight)
+        self._options[name.lower()] = completion._list_options(doc)
+        self._declarations[name.lower()] = (
+            callback_function, doc, is_pre_flight)
+        self._plans.clear()
 
         _logger.debug(
-            "added %s-flight command '%s' (callback function: %s)" % (
-                "pre" if is_pre_flight else "post",
-                name.lower(), callback_function))
+            "added %s-flight command '%s' (callback function: %s)",
+            "pre" if is_pre_flight else "post",
+            name.lower(), callback_function)
 
     def declare_pre_flight_command (self,
         name, callback_function, doc = None, overwrite = False):
@@ -110,33 +135,97 @@ class MagicCommandsManager:
         if (not self.has_command(name)):
             raise ValueError("Unknown magic command: %s" % name)
         del self._magic_commands[name.lower()]
+        del self._options[name.lower()]
+        del self._declarations[name.lower()]
+        self._names.remove(name.lower())
+        self._plans.clear()
+
+    def _parse_line (self, line):
+        # return the magic command of a (stripped) line
+        # starting with the prefix, as a tuple
+        # (name, function, is_pre_flight)
+        line = line[1:]
+
+        mc_argv = line.split(' ', 1)
+        mc_args = None if (len(mc_argv) == 1) else mc_argv[1]
+
+        mc_name = mc_argv[0]
+        if (not self.has_command(mc_name)):
+            raise Exception("Unknown magic command: %s" % mc_name)
+
+        mc, is_pre_flight = self._magic_commands[mc_name.lower()]
+        return (mc_name, functools.partial(mc, mc_args), is_pre_flight)
+
+    def _get_plan (self, magic_lines):
+        # return the pre- and post-flight commands for a
+        # sequence of magic command lines, parsed only once;
+        # the prefix is part of the key, as it can be changed
+        # without calling set_prefix() (this isn't a new-style
+        # class, so the 'prefix' property has no effect on writes)
+        key = (self.prefix, tuple(magic_lines))
+        try:
+            plan = self._plans.pop(key)
+        except KeyError:
+            pre_flight_commands, post_flight_commands = [], []
+            for line in magic_lines:
+                mc_name, mc_function, is_pre_flight = self._parse_line(line)
+                if (is_pre_flight):
+                    commands = pre_flight_commands
+                else:
+                    commands = post_flight_commands
+
+                commands.append((mc_name, mc_function))
+
+            plan = (tuple(pre_flight_commands), tuple(post_flight_commands))
+            if (len(self._plans) >= _MAX_CACHED_PLANS):
+                self._plans.popitem(last = False)
+
+        self._plans[key] = plan
+        return plan
 
     def _parse_code (self, code):
         # detect magic commands, removing them from the input code
-        pre_flight_commands, post_flight_commands, code_ = [], [], []
+        magic_lines, code_ = [], []
 
+        prefix = self.prefix
         for line in code.splitlines():
-            if (line.strip().startswith(self.prefix)):
-                line = line.strip()[1:]
+            line_ = line.strip()
+            if (line_.startswith(prefix)):
+                magic_lines.append(line_)
+            else:
+                code_.append(line)
 
-                mc_argv = line.split(' ', 1)
-                mc_args = None if (len(mc_argv) == 1) else mc_argv[1]
+        pre_flight_commands, post_flight_commands = \
+            self._get_plan(magic_lines)
 
-                mc_name = mc_argv[0]
-                if (not self.has_command(mc_name)):
-                    raise Exception("Unknown magic command: %s" % mc_name)
+        return (
+            list(pre_flight_commands),
+            list(post_flight_commands),
+            '\n'.join(code_))
 
-                mc, is_pre_flight = self._magic_commands[mc_name.lower()]
-                if (is_pre_flight):
-                    commands = pre_flight_commands
-                else:
-                    commands = post_flight_commands
+    def _parse_header (self, code):
+        # same as _parse_code(), but only for the magic commands found on
+        # the first lines; the offset of the remaining code is returned
+        # in place of this code, so that it is never copied
+        magic_lines, prefix = [], self.prefix
 
-                commands.append((mc_name, functools.partial(mc, mc_args)))
-            else:
-                code_.append(line)
+        offset = 0
+        while (offset < len(code)):
+            end = code.find('\n', offset)
+            if (end < 0):
+                end = len(code)
+
+            line = code[offset:end].strip()
+            if (not line.startswith(prefix)):
+                break
+
+            magic_lines.append(line)
+            offset = end + 1
+
+        pre_flight_commands, post_flight_commands = \
+            self._get_plan(magic_lines)
 
         return (
-            pre_flight_commands,
-            post_flight_commands,
-            '\n'.join(code_))
+            list(pre_flight_commands),
+            list(post_flight_commands),
+            min(offset, len(code)))
@@ -0,0 +1,160 @@
+# accounting of the memory retained by cells and renderers, measured
+# with tracemalloc when available or as the resident set size otherwise;
+# cells retaining more memory run after run are flagged as leaking
+
+__all__ = (
+    "MemoryTracker",)
+
+import collections
+import hashlib
+import logging
+import resource
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_logger = logging.getLogger(__name__)
+
+# number of characters of a cell hashed at once, as
+# cells can be too large to be copied as a whole
+_CHUNK_SIZE = 1024 * 1024
+
+def _resident_memory ():
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except (IOError, ValueError):
+        return 0
+
+def _traced_memory ():
+    return tracemalloc.get_traced_memory()[0]
+
+def _first_line (code):
+    # first non-empty line of the code, found without splitting it
+    start = 0
+    while (start < len(code)):
+        end = code.find('\n', start)
+        if (end < 0):
+            end = len(code)
+
+        line = code[start:end].strip()
+        if (line != ''):
+            return line
+
+        start = end + 1
+
+    return ''
+
+def _hash_code (code):
+    digest = hashlib.sha1()
+    for start in xrange(0, len(code), _CHUNK_SIZE):
+        if (isinstance(code, unicode)):
+            digest.update(code[start:start + _CHUNK_SIZE].encode("utf-8"))
+        else:
+            digest.update(buffer(code, start, _CHUNK_SIZE))
+
+    return digest.digest()
+
+class _History:
+    """ Memory retained by the latest runs of a cell or renderer
+    """
+    __slots__ = ("kind", "label", "deltas", "n_runs", "total")
+
+    def __init__ (self, kind, label, history_size):
+        self.kind, self.label = kind, label
+        self.deltas = collections.deque(maxlen = history_size)
+        self.n_runs, self.total = 0, 0
+
+class MemoryTracker:
+    """ Net memory retained by each cell and renderer, i.e., allocated
+        but not released by the time they completed; the last
+        `history_size` measurements are kept for up to `max_entries`
+        cells and renderers (the least recently run being forgotten)
+
+        A cell is considered leaking once its last `leak_runs` runs
+        each retained at least `leak_threshold` bytes.
+    """
+    def __init__ (self, history_size = 10, max_entries = 100,
+        leak_threshold = 1024 * 1024, leak_runs = 3):
+        self.history_size, self.max_entries = history_size, max_entries
+        self.leak_threshold, self.leak_runs = leak_threshold, leak_runs
+
+        if (tracemalloc is not None):
+            if (not tracemalloc.is_tracing()):
+                tracemalloc.start()
+            self.source, self.measure = "tracemalloc", _traced_memory
+        else:
+            self.source, self.measure = "rss", _resident_memory
+
+        _logger.debug("measuring memory with %s", self.source)
+        self._cells = collections.OrderedDict()
+        self._renderers = collections.OrderedDict()
+
+    def _record (self, entries, kind, key, label, delta):
+        history = entries.pop(key, None)
+        if (history is None):
+            history = _History(kind, label, self.history_size)
+
+        history.deltas.append(delta)
+        history.n_runs += 1
+        history.total += delta
+
+        entries[key] = history
+        if (len(entries) > self.max_entries):
+            entries.popitem(last = False)
+
+        return history
+
+    def record_cell (self, code, delta):
+        """ Record the memory retained by a run of a cell, identified by
+            its content, and return the history of this cell
+        """
+        # cells are labelled with their first non-empty line
+        label = _first_line(code)
+        if (len(label) > 40):
+            label = label[:37] + "..."
+
+        return self._record(self._cells,
+            "cell", _hash_code(code), label, delta)
+
+    def record_renderer (self, name, delta):
+        """ Record the memory retained by a call to a renderer, and
+            return the history of this renderer
+        """
+        return self._record(self._renderers, "renderer", name, name, delta)
+
+    def is_leaking (self, history):
+        if (len(history.deltas) < self.leak_runs):
+            return False
+
+        deltas = list(history.deltas)[-self.leak_runs:]
+        return all(delta >= self.leak_threshold for delta in deltas)
+
+    def leaking_cells (self):
+        return [history for history in self._cells.itervalues()
+            if self.is_leaking(history)]
+
+    def report (self):
+        """ Return a table of cells and renderers, as a list of rows
+            (kind, label, number of runs, bytes retained by the last run,
+            bytes retained overall, leaking flag), leaking cells first
+            then by decreasing overall retained memory
+        """
+        rows = []
+        for history in self._cells.values() + self._renderers.values():
+            rows.append((
+                history.kind, history.label, history.n_runs,
+                history.deltas[-1], history.total,
+                (history.kind == "cell") and self.is_leaking(history)))
+
+        return sorted(rows, key = lambda row: (not row[5], -row[4]))
+
+def _format_size (n_bytes):
+    for unit in ("bytes", "KB", "MB"):
+        if (abs(n_bytes) < 1024):
+            return ("%d %s" if (unit == "bytes") else "%.1f %s") % (
+                n_bytes, unit)
+        n_bytes /= 1024.0
+    return "%.1f GB" % n_bytes
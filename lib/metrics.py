@@ -0,0 +1,197 @@
+# counters and histograms describing the activity of a kernel,
+# exposed in the Prometheus text format through a local HTTP
+# endpoint or a periodically written file
+
+__all__ = (
+    "Counter",
+    "Histogram",
+    "MetricsRegistry",
+    "MetricsServer",
+    "MetricsFileWriter")
+
+import BaseHTTPServer
+import bisect
+import io
+import logging
+import os
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# note that metrics are updated without locking; updates are expected
+# to come from the kernel thread, while exporters only read the values
+
+def _format_labels (labels):
+    if (len(labels) == 0):
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key,
+        unicode(value).replace('\\', "\\\\").replace('"', "\\\""))
+        for (key, value) in labels)
+
+def _format_value (value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    TYPE = "counter"
+
+    def __init__ (self, name, help):
+        self.name, self.help = name, help
+        self._values = {}
+
+    def inc (self, amount = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get (self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def _samples (self):
+        for (key, value) in sorted(self._values.items()):
+            yield (self.name, key, value)
+
+class Histogram:
+    TYPE = "histogram"
+
+    DEFAULT_BUCKETS = (
+        0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+    def __init__ (self, name, help, buckets = None):
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self._values = {}
+
+    def observe (self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        try:
+            counts, total = self._values[key]
+        except KeyError:
+            counts, total = [0] * (len(self.buckets) + 1), 0
+
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[key] = (counts, total + value)
+
+    def get (self, **labels):
+        """ Return the number and sum of the observed values
+        """
+        key = tuple(sorted(labels.items()))
+        counts, total = self._values.get(key, ((), 0))
+        return (sum(counts), total)
+
+    def _samples (self):
+        for (key, (counts, total)) in sorted(self._values.items()):
+            cumulative_count = 0
+            for (bucket, count) in zip(self.buckets + ("+Inf",), counts):
+                cumulative_count += count
+                yield (self.name + "_bucket",
+                    key + (("le", bucket),), cumulative_count)
+
+            yield (self.name + "_sum", key, total)
+            yield (self.name + "_count", key, cumulative_count)
+
+class MetricsRegistry:
+    def __init__ (self):
+        self._metrics = {}
+
+    def _declare (self, metric_class, name, *args):
+        if (not name in self._metrics):
+            self._metrics[name] = metric_class(name, *args)
+
+        metric = self._metrics[name]
+        if (not isinstance(metric, metric_class)):
+            raise ValueError(
+                "Invalid metric name: '%s' is already "
+                "declared as a %s" % (name, metric.TYPE))
+
+        return metric
+
+    def counter (self, name, help):
+        return self._declare(Counter, name, help)
+
+    def histogram (self, name, help, buckets = None):
+        return self._declare(Histogram, name, help, buckets)
+
+    def __getitem__ (self, name):
+        return self._metrics[name]
+
+    def __contains__ (self, name):
+        return (name in self._metrics)
+
+    def render (self):
+        """ Return all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for (name, metric) in sorted(self._metrics.items()):
+            lines.append("# HELP %s %s" % (name, metric.help))
+            lines.append("# TYPE %s %s" % (name, metric.TYPE))
+
+            # the values are copied first, as they may
+            # be updated by the kernel while we iterate
+            for (name_, labels, value) in list(metric._samples()):
+                lines.append("%s%s %s" % (
+                    name_, _format_labels(labels), _format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer (threading.Thread):
+    """ Thread serving the metrics of a registry over HTTP, on localhost
+    """
+    def __init__ (self, registry, port):
+        threading.Thread.__init__(self, name = "callysto-metrics-server")
+        self.daemon = True
+
+        class Handler (BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET (self):
+                content = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type",
+                    "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message (self, format, *args):
+                _logger.debug("metrics request: " + format, *args)
+
+        self._server = BaseHTTPServer.HTTPServer(("127.0.0.1", port), Handler)
+        self.port = self._server.server_address[1]
+
+    def run (self):
+        _logger.debug("serving metrics on port %d", self.port)
+        self._server.serve_forever()
+
+    def stop (self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class MetricsFileWriter (threading.Thread):
+    """ Thread writing the metrics of a registry to a file, periodically
+    """
+    def __init__ (self, registry, filename, interval):
+        threading.Thread.__init__(self, name = "callysto-metrics-writer")
+        self.daemon = True
+
+        self._registry = registry
+        self._filename = filename
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def write (self):
+        # the file is replaced atomically, so that
+        # readers never see it partially written
+        tmp_fn = self._filename + ".tmp"
+        with io.open(tmp_fn, "w", encoding = "utf-8") as fh:
+            fh.write(self._registry.render())
+        os.rename(tmp_fn, self._filename)
+
+    def run (self):
+        _logger.debug("writing metrics to %s", self._filename)
+        while (not self._stopped.wait(self._interval)):
+            try:
+                self.write()
+            except Exception as exception:
+                _logger.error("unable to write metrics: %s", exception)
+
+    def stop (self):
+        self._stopped.set()
+        self.join()
+        self.write()
@@ -9,4 +9,15 @@ import logging
 _logger = logging.getLogger(__name__)
 
 class BaseRenderer:
-    pass
+    def get_state (self):
+        """ Return the settings of this renderer, as a picklable object;
+            these are saved when the kernel restarts (see set_state)
+        """
+        return dict((key, value)
+            for (key, value) in self.__dict__.iteritems()
+            if (not key.startswith("__")))
+
+    def set_state (self, state):
+        """ Restore settings returned by get_state()
+        """
+        self.__dict__.update(state)
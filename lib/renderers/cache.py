@@ -0,0 +1,106 @@
+# least-recently-used cache of the frames produced by pure renderers,
+# keyed by a digest of their input and bounded in size
+
+__all__ = (
+    "RenderCache",)
+
+import collections
+import cPickle
+import hashlib
+import logging
+
+from .. import utils
+
+_logger = logging.getLogger(__name__)
+
+def _digest (mime_type, content, metadata):
+    # content which can't be pickled (e.g., generators) isn't cached
+    hash_ = hashlib.sha1(mime_type)
+    try:
+        if (isinstance(content, unicode)):
+            hash_.update('u' + content.encode("utf-8"))
+        elif (isinstance(content, str)):
+            hash_.update('s' + content)
+        else:
+            hash_.update('p' + cPickle.dumps(content, 2))
+
+        if (metadata):
+            hash_.update(cPickle.dumps(sorted(metadata.items()), 2))
+
+    except Exception:
+        return None
+
+    return hash_.digest()
+
+def _size (content):
+    if (utils.is_string(content)):
+        return len(content)
+    elif (isinstance(content, dict)):
+        return sum(_size(value) for value in content.itervalues())
+    try:
+        return len(cPickle.dumps(content, 2))
+    except Exception:
+        return 0
+
+class RenderCache:
+    """ Cache of rendered frames, shared by all kernels of a process;
+        once the total size of the cached frames exceeds `max_bytes`
+        bytes, the least recently used entries are evicted
+    """
+    def __init__ (self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits, self.misses = 0, 0
+        self._entries = collections.OrderedDict()
+
+    def key (self, renderer, registered_mime_type,
+        mime_type, content, metadata):
+        """ Return the key of a rendering, or None if it can't be cached
+        """
+        digest = _digest(mime_type, content, metadata)
+        if (digest is None):
+            return None
+        return (renderer, registered_mime_type, digest)
+
+    def get (self, key):
+        """ Return the cached frames for a key, or None
+        """
+        try:
+            frames, size = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._entries[key] = (frames, size)
+        self.hits += 1
+        return frames
+
+    def put (self, key, frames):
+        size = sum(_size(content) for ((_, content, _), _) in frames)
+        if (size > self.max_bytes):
+            return
+
+        if (key in self._entries):
+            self.size -= self._entries.pop(key)[1]
+
+        self._entries[key] = (frames, size)
+        self.size += size
+
+        while (self.size > self.max_bytes):
+            _, (_, size_) = self._entries.popitem(last = False)
+            self.size -= size_
+
+    def invalidate (self, renderer, mime_type = None):
+        """ Remove the entries of a renderer, for all or one MIME type
+        """
+        for key in list(self._entries):
+            if (key[0] == renderer) and \
+               ((mime_type is None) or (key[1] == mime_type)):
+                self.size -= self._entries.pop(key)[1]
+
+    def clear (self):
+        self._entries.clear()
+        self.size = 0
+
+    def __len__ (self):
+        return len(self._entries)
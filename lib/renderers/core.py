@@ -3,27 +3,37 @@
 
 __all__ = (
     "MIME_TYPE",
+    "Frame",
     "register_renderer",
     "deregister_renderer",
+    "register_javascript_module",
     "list_renderers_for_mime_type",
     "list_mime_types_for_renderer")
 
 import base64
+import contextlib
 import enum
 import fnmatch
 import inspect
+import json
 import logging
+import re
 import textwrap
+import uuid
 
 import future.utils
 import html
 import IPython.display
 
 from .. import utils
+import cache
+import watchdog
 
 # base mimetypes
 class MIME_TYPE (enum.Enum):
     TEXT = "text/plain"
+    BUNDLE = "application/vnd.callysto.bundle"
+    BINARY = "application/vnd.callysto.binary"
     CSV = "text/csv"
     CSV_WITH_HEADER = "text/csv;header"
     GIF = "image/gif"
@@ -40,6 +50,27 @@ _logger = logging.getLogger(__name__)
 
 _renderers = []
 
+# options of each (renderer, MIME type) registration
+_renderer_options = {}
+
+class _Scope (object):
+    # registrations made through a kernel instance, which only apply
+    # when rendering for this kernel (see BaseKernel.register_renderer),
+    # while those above are shared by all the kernels of the process
+    __slots__ = ("renderers", "renderer_options", "javascript_modules")
+
+    def __init__ (self):
+        self.renderers, self.renderer_options = [], {}
+        self.javascript_modules = {}
+
+_scopes = {}
+
+# kernel the frames are currently rendered for, if any
+_current_scope = None
+
+# frames rendered by pure renderers, shared by all kernels
+render_cache = cache.RenderCache(max_bytes = 64 * 1024 * 1024)
+
 def _validate_mime_type (mime_type):
     if (utils.is_string(mime_type)):
         return mime_type.lower().strip()
@@ -49,8 +80,114 @@ def _validate_mime_type (mime_type):
 
     raise ValueError("Invalid MIME type: %s" % mime_type)
 
-def register_renderer (renderer, mime_type):
-    global _renderers
+class Frame (object):
+    """ Content frame, to be yielded by kernels and renderers
+
+        Frames are validated once when created, and are then passed
+        through as is; tuples and strings are validated as yielded.
+    """
+    __slots__ = ("mime_type", "content", "metadata")
+
+    def __init__ (self, mime_type, content, metadata = None):
+        self.mime_type = _validate_mime_type(mime_type)
+        self.content = content
+        self.metadata = metadata
+
+    def __iter__ (self):
+        yield self.mime_type
+        yield self.content
+        yield self.metadata
+
+    def __repr__ (self):
+        return "<Frame %s>" % self.mime_type
+
+def _get_registrations (scope):
+    if (scope is None):
+        return (_renderers, _renderer_options)
+
+    scope_ = _scopes.get(scope)
+    if (scope_ is None):
+        scope_ = _scopes[scope] = _Scope()
+
+    return (scope_.renderers, scope_.renderer_options)
+
+def _list_renderers (scope = None):
+    # registrations visible from a scope, by decreasing priority; for
+    # equal priorities, those of the scope come first
+    scope_ = _scopes.get(scope)
+    if (scope_ is None) or (len(scope_.renderers) == 0):
+        return _renderers
+
+    scoped_renderers, index, n_scoped = [], 0, len(scope_.renderers)
+    for key in _renderers:
+        priority = _renderer_options[key]["priority"]
+        while (index < n_scoped) and (scope_.renderer_options[
+            scope_.renderers[index]]["priority"] >= priority):
+            scoped_renderers.append(scope_.renderers[index])
+            index += 1
+        scoped_renderers.append(key)
+
+    scoped_renderers.extend(scope_.renderers[index:])
+    return scoped_renderers
+
+def _get_renderer_options (renderer, mime_type):
+    scope_ = _scopes.get(_current_scope)
+    if (scope_ is not None):
+        options = scope_.renderer_options.get((renderer, mime_type))
+        if (options is not None):
+            return options
+
+    return _renderer_options[(renderer, mime_type)]
+
+def _set_scope (scope):
+    # kernel the next frames are rendered for; registrations made
+    # through this kernel are used in addition to the shared ones
+    global _current_scope
+    _current_scope = scope
+
+def _remove_scope (scope):
+    # forget about the registrations made through a kernel
+    global _current_scope
+
+    scope_ = _scopes.pop(scope, None)
+    if (scope_ is not None):
+        for (renderer, mime_type) in scope_.renderers:
+            render_cache.invalidate(renderer, mime_type)
+
+    if (_current_scope is scope):
+        _current_scope = None
+
+def register_renderer (renderer, mime_type, pure = False,
+    priority = 0, accepts = None, timeout = None, memory_limit = None,
+    scope = None):
+    """ Register a renderer for one or more MIME types
+
+        If `pure` is set to True, the renderer output is assumed to only
+        depend on its input (content, MIME type and metadata), and is
+        cached; the same input won't be rendered twice.
+
+        When several renderers match a MIME type, the one with highest
+        `priority` is used (the most recently registered one for equal
+        priorities), unless it has an `accepts` predicate returning
+        False for the content; e.g., a lightweight renderer could be
+        used for large tables instead of a richer one:
+
+            register_renderer(grid_renderer, MIME_TYPE.CSV, priority = 1,
+                accepts = lambda content, mime_type, **metadata:
+                    len(content) < 10000)
+
+        The predicate receives the same arguments as the renderer.
+
+        If `timeout` (in seconds) and/or `memory_limit` (in bytes) are
+        set, the renderer runs in a separate process which is stopped
+        if exceeding these limits; the content is then shown as raw
+        text, with a notice. Such renderers must yield picklable frames,
+        and are given a timeout of watchdog.DEFAULT_TIMEOUT if none set.
+
+        If `scope` is set (to a kernel instance), the renderer is only
+        used for the frames of this kernel.
+    """
+    renderers_, renderer_options = _get_registrations(scope)
 
     if (not utils.is_callable(renderer)):
         raise ValueError("Invalid renderer: not a function")
@@ -63,33 +200,60 @@ def register_renderer (renderer, mime_type):
     for mime_type in mime_types:
         mime_type = _validate_mime_type(mime_type)
 
-        _renderers.insert(0, (renderer, mime_type))
-        _logger.debug("added renderer for %s: %s" % (mime_type, renderer))
-
-def deregister_renderer (renderer, mime_type = None):
-    global _renderers
-
+        # renderers are kept sorted by decreasing priority, with the
+        # most recently registered ones first for equal priorities
+        index = 0
+        while (index < len(renderers_)) and \
+              (renderer_options[renderers_[index]]["priority"] > priority):
+            index += 1
+
+        renderers_.insert(index, (renderer, mime_type))
+        renderer_options[(renderer, mime_type)] = {
+            "pure": pure,
+            "priority": priority,
+            "accepts": accepts,
+            "timeout": timeout,
+            "memory_limit": memory_limit}
+        _logger.debug("added renderer for %s: %s", mime_type, renderer)
+
+def deregister_renderer (renderer, mime_type = None, scope = None):
+    """ Deregister a renderer, for one or all of its MIME types
+
+        If `scope` is set, the renderer is looked for in the registrations
+        made for this kernel first, then in the shared ones.
+    """
     if (mime_type is None):
         seeve = lambda x: (x[0] == renderer)
     else:
         mime_type = _validate_mime_type(mime_type)
         seeve = lambda x: (x[0] == renderer) and (x[1] == mime_type)
 
-    previous_n_renderers = len(_renderers)
-    _renderers = filter(lambda x: not seeve(x), _renderers)
+    for scope_ in (scope, None):
+        renderers_, renderer_options = _get_registrations(scope_)
 
-    if (len(_renderers) == previous_n_renderers):
-        msg = "Renderer %s not found" % renderer
-        if (mime_type is not None):
-            msg += " for MIME type %s" % mime_type
-        raise Exception(msg)
+        previous_n_renderers = len(renderers_)
+        renderers_[:] = filter(lambda x: not seeve(x), renderers_)
+
+        if (len(renderers_) < previous_n_renderers):
+            break
 
-    _logger.debug("removed renderer %s" % renderer)
+        if (scope_ is None):
+            msg = "Renderer %s not found" % renderer
+            if (mime_type is not None):
+                msg += " for MIME type %s" % mime_type
+            raise Exception(msg)
+
+    for key in list(renderer_options):
+        if (seeve(key)):
+            del renderer_options[key]
+
+    render_cache.invalidate(renderer, mime_type)
+    _logger.debug("removed renderer %s", renderer)
 
 def list_renderers_for_mime_type (mime_type, return_mime_type = False):
     mime_type, matching_renderers = _validate_mime_type(mime_type), []
 
-    for (renderer, mime_type_) in _renderers:
+    for (renderer, mime_type_) in _list_renderers(_current_scope):
         if (fnmatch.fnmatch(mime_type_, mime_type)):
             matching_renderers.append((renderer, mime_type_))
 
@@ -101,7 +265,7 @@ def list_renderers_for_mime_type (mime_type, return_mime_type = False):
 def list_mime_types_for_renderer (renderer):
     matching_mime_types = []
 
-    for (renderer_, mime_type_) in _renderers:
+    for (renderer_, mime_type_) in _list_renderers(_current_scope):
         if (renderer_ == renderer):
             matching_mime_types.append((renderer, mime_type_))
 
@@ -112,6 +276,7 @@ def _check_frames (frames):
         raise Exception("Invalid frames: not a generator")
 
     # ensure the frames are in a valid format; valid formats are
+    # - Frame(<mime_type>, <data>, <metadata>)
     # - <data>  -- will be assumed to be plain text
     # - (<mime_type>, <data>)
     # - (<mime_type>, <data>, <metadata>)
@@ -119,13 +284,18 @@ def _check_frames (frames):
         if (frame is None):
             yield None
 
-        elif (not utils.is_iterable(frame)):
+        # frames validated at creation; this is the fast path
+        elif (type(frame) is Frame):
+            yield (frame.mime_type, frame.content, frame.metadata)
+
+        # strings are tested first, as they are the
+        # most common frames and is_iterable() is slow
+        elif (utils.is_string(frame)) or (not utils.is_iterable(frame)):
             # default content type is plain text
             yield (MIME_TYPE.TEXT.value, unicode(frame), None)
 
         else:
             try:
-                assert (utils.is_iterable(frame)), "Not an iterable"
                 frame = list(frame)
                 frame_length = len(frame)
 
@@ -141,30 +311,152 @@ def _check_frames (frames):
             except Exception as e:
                 raise Exception("Invalid frame #%d: %s" % (n+1, e))
 
-def _render_content (mime_type, content, metadata):
+def _bundle_frames (frames):
+    # merge frames into a single set of alternative representations,
+    # with metadata keyed by MIME type as expected by Jupyter; of
+    # several representations with a same MIME type, the first is kept
+    data, metadata = {}, {}
+    for (mime_type, content, metadata_) in frames:
+        if (mime_type == MIME_TYPE.BUNDLE.value):
+            metadata_ = {} if (metadata_ is None) else metadata_
+            representations = [
+                (mime_type_, content_, metadata_.get(mime_type_))
+                for (mime_type_, content_) in content.iteritems()]
+        else:
+            representations = [(mime_type, content, metadata_)]
+
+        for (mime_type_, content_, metadata__) in representations:
+            if (mime_type_ in data):
+                _logger.warning("several representations of MIME type %s "
+                    "in a same output; only the first one is kept",
+                    mime_type_)
+                continue
+
+            data[mime_type_] = content_
+            if (metadata__):
+                metadata[mime_type_] = metadata__
+
+    return (data, metadata)
+
+def _run_renderer (renderer, content, mime_type, metadata):
+    frames = []
+    for frame in _check_frames(renderer(content, mime_type, **metadata)):
+        # if we get a None value from the renderer, we interpret it
+        # as asking for the last frame sent to be renderered as is
+        if (frame is None):
+            if (len(frames) > 0):
+                frames[-1][1] = True
+        # by default, we want to send this
+        # frame to any compatible renderer
+        else:
+            frames.append([frame, False])
+
+    return frames
+
+def _fallback_frames (renderer, mime_type, content, exception):
+    # content of a renderer which exceeded its budget, shown as raw text
+    if (isinstance(content, unicode)):
+        text = content
+    elif (isinstance(content, str)):
+        text = content.decode("utf-8", "replace")
+    else:
+        text = unicode(repr(content))
+
+    notice = "[renderer %s stopped for %s content: %s; " \
+        "raw content follows]\n" % (
+            getattr(renderer, "__name__", renderer), mime_type, exception)
+
+    return [
+        [(MIME_TYPE.TEXT.value, notice, None), True],
+        [(MIME_TYPE.TEXT.value, text, None), True]]
+
+@contextlib.contextmanager
+def _no_monitor (renderer, mime_type):
+    yield
+
+def _render_bundle (content, metadata, monitor):
+    # each representation is rendered on its own, with the metadata
+    # found under its MIME type, then merged back into a single frame
+    if (not isinstance(content, dict)):
+        raise Exception("Invalid bundle: not a dictionary")
+
+    metadata = {} if (metadata is None) else metadata
+    metadata = dict((_validate_mime_type(mime_type), metadata_)
+        for (mime_type, metadata_) in metadata.iteritems())
+
+    frames = []
+    for (mime_type, content_) in content.iteritems():
+        mime_type = _validate_mime_type(mime_type)
+        frames.extend(_render_content(
+            mime_type, content_, metadata.get(mime_type), monitor))
+
+    data, metadata = _bundle_frames(frames)
+    return [(MIME_TYPE.BUNDLE.value, data, metadata)]
+
+def _render_content (mime_type, content, metadata, monitor = None):
+    # the monitor, if any, is a context manager factory wrapping
+    # each call to a renderer; it receives the renderer and MIME type
+    if (monitor is None):
+        monitor = _no_monitor
+
     def get_frames (mime_type, content, metadata):
+        # bundles, either provided by the kernel or by a renderer,
+        # have their representations rendered then merged back
+        if (mime_type == MIME_TYPE.BUNDLE.value):
+            frames = _render_bundle(content, metadata, monitor)
+            return [[frame, True] for frame in frames]
+
         mime_type, renderers = list_renderers_for_mime_type(mime_type, True)
         metadata = {} if (metadata is None) else metadata
 
-        # pass-through rendering (will be handled by Jupyter itself)
-        if (len(renderers) == 0):
-            _logger.debug("no renderer found for content type %s" % mime_type)
-            return [((mime_type, content, metadata), True)]
-
-        # delegated rendering
+        # delegated rendering, to the first renderer accepting this content
+        renderer = None
         try:
-            renderer, _ = renderers[0]
-            frames = []
-            for frame in _check_frames(renderer(content, mime_type, **metadata)):
-                # if we get a None value from the renderer, we interpret it
-                # as asking for the last frame sent to be renderered as is
-                if (frame is None):
-                    if (len(frames) > 0):
-                        frames[-1][1] = True
-                # by default, we want to send this
-                # frame to any compatible renderer
-                else:
-                    frames.append([frame, False])
+            for (renderer, mime_type_) in renderers:
+                accepts = _get_renderer_options(
+                    renderer, mime_type_)["accepts"]
+                if (accepts is None) or \
+                   (accepts(content, mime_type, **metadata)):
+                    break
+
+            # pass-through rendering (will be handled by Jupyter itself)
+            else:
+                _logger.debug(
+                    "no renderer found for content type %s", mime_type)
+                return [((mime_type, content, metadata), True)]
+
+            # the output of pure renderers is cached
+            options = _get_renderer_options(renderer, mime_type_)
+            if (options["pure"]):
+                key = render_cache.key(
+                    renderer, mime_type_, mime_type, content, metadata)
+            else:
+                key = None
+
+            if (key is not None):
+                frames = render_cache.get(key)
+                if (frames is not None):
+                    return [[frame, as_is] for (frame, as_is) in frames]
+
+            try:
+                with monitor(renderer, mime_type):
+                    if (options["timeout"] is None) and \
+                       (options["memory_limit"] is None):
+                        frames = _run_renderer(
+                            renderer, content, mime_type, metadata)
+                    else:
+                        frames = watchdog.run_with_limits(_run_renderer,
+                            (renderer, content, mime_type, metadata),
+                            options["timeout"], options["memory_limit"])
+
+            except watchdog.BudgetExceeded as exception:
+                _logger.warning("renderer %s stopped: %s", renderer, exception)
+                return _fallback_frames(
+                    renderer, mime_type, content, exception)
+
+            if (key is not None):
+                render_cache.put(key,
+                    tuple((frame, as_is) for (frame, as_is) in frames))
 
             return frames
 
@@ -211,7 +503,7 @@ def base_text_renderer (content, mime_type, **metadata):
     if ("encoding" in metadata):
         content = unicode(content, metadata["encoding"])
 
-    yield (MIME_TYPE.TEXT, content)
+    yield Frame(MIME_TYPE.TEXT, content)
     yield None
 
 register_renderer(base_text_renderer, MIME_TYPE.TEXT)
@@ -234,26 +526,160 @@ def _base_csv_renderer (content, with_header):
             .td(style = "border: 1px solid #ccc")\
             .code(unicode(x)), row)
 
-    return (MIME_TYPE.HTML, unicode(html_table))
-
-def default_csv_without_header_renderer (content, mime_type, **metadata):
+    return Frame(MIME_TYPE.HTML, unicode(html_table))
+
+# client-side table viewer, as a RequireJS module; rows are drawn as
+# they are scrolled into view, out of a columnar encoding of the table
+_TABLE_VIEWER = """\
+define([], function () {
+    var ROW_HEIGHT = 24, VISIBLE_ROWS = 20;
+
+    function escape (text) {
+        return text.replace(/&/g, "&amp;")
+            .replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    }
+
+    function row (tag, cells) {
+        var html = ["<tr style='height: " + ROW_HEIGHT + "px'>"];
+        for (var i = 0; i < cells.length; i++) {
+            html.push("<" + tag + " style='border: 1px solid #ccc; " +
+                "white-space: nowrap'>" + escape(cells[i]) +
+                "</" + tag + ">");
+        }
+        html.push("</tr>");
+        return html.join("");
+    }
+
+    function render (container_id, table) {
+        var container = document.getElementById(container_id);
+        if (container === null) {
+            return;
+        }
+
+        var columns = table.columns, header = table.header;
+        var n_rows = (columns.length > 0) ? columns[0].length : 0;
+        var n_header_rows = (header === null) ? 0 : 1;
+
+        var viewport = document.createElement("div");
+        viewport.style.cssText = "position: relative; overflow: auto; " +
+            "max-height: " + ((VISIBLE_ROWS + 1) * ROW_HEIGHT) + "px";
+
+        var spacer = document.createElement("div");
+        spacer.style.height =
+            ((n_rows + n_header_rows) * ROW_HEIGHT) + "px";
+
+        var grid = document.createElement("table");
+        grid.style.cssText = "position: absolute; top: 0; left: 0; " +
+            "border-collapse: collapse; border: none";
+
+        function draw () {
+            var first = Math.floor(viewport.scrollTop / ROW_HEIGHT);
+            var last = Math.min(n_rows, first + VISIBLE_ROWS + 1);
+            var html = (header === null) ? [] : [row("th", header)];
+            for (var i = first; i < last; i++) {
+                var cells = [];
+                for (var j = 0; j < columns.length; j++) {
+                    cells.push(columns[j][i]);
+                }
+                html.push(row("td", cells));
+            }
+            grid.innerHTML = html.join("");
+            grid.style.top = (first * ROW_HEIGHT) + "px";
+        }
+
+        viewport.appendChild(spacer);
+        viewport.appendChild(grid);
+        viewport.addEventListener("scroll", draw);
+        container.appendChild(viewport);
+        draw();
+    }
+
+    return {render: render};
+});
+"""
+
+# the viewer is loaded once per notebook page, from a data URL
+_TABLE_VIEWER_URL = "data:application/javascript;base64," + \
+    base64.b64encode(_TABLE_VIEWER)
+
+def _client_csv_renderer (content, with_header, metadata):
+    # the table is sent as a compact list of columns, to be
+    # rendered by the notebook itself (see _TABLE_VIEWER)
+    metadata.pop("mode")
     _ensure_no_metadata(metadata)
-    yield _base_csv_renderer(content, with_header = False)
+
+    rows = [[unicode(value) for value in row] for row in content]
+
+    header = None
+    if (with_header) and (len(rows) > 0):
+        header, rows = rows[0], rows[1:]
+
+    n_columns = max([len(row) for row in rows] + [len(header or ())])
+    columns = [[row[i] if (i < len(row)) else u'' for row in rows]
+        for i in range(n_columns)]
+
+    table = json.dumps({"header": header, "columns": columns},
+        separators = (',', ':'))
+
+    # the table is embedded in a script element, which can't contain '</'
+    table = table.replace("</", "<\\/")
+
+    # the viewer draws the table in the container with this identifier,
+    # as containers of other tables may be waiting for it as well
+    container_id = "callysto-table-" + uuid.uuid4().hex
+
+    yield Frame(MIME_TYPE.HTML,
+        "<div class=\"callysto-table\" id=\"%s\"></div>" % container_id)
     yield None
 
+    yield Frame(MIME_TYPE.JAVASCRIPT,
+        "callysto_table.render(\"%s\", %s);" % (container_id, table),
+        {"modules": ["callysto_table"]})
+
+def _csv_renderer (content, with_header, metadata):
+    # tables are rendered as HTML, unless the 'mode' metadata field
+    # is set to 'client' for them to be rendered by the notebook (see
+    # client_csv_renderer)
+    mode = metadata.pop("mode", "html")
+    _ensure_no_metadata(metadata)
+
+    if (mode == "html"):
+        yield _base_csv_renderer(content, with_header)
+        yield None
+
+    else:
+        raise Exception("Invalid value for metadata field 'mode': %s" % mode)
+
+def default_csv_without_header_renderer (content, mime_type, **metadata):
+    return _csv_renderer(content, False, metadata)
+
 register_renderer(
-    default_csv_without_header_renderer, MIME_TYPE.CSV)
+    default_csv_without_header_renderer, MIME_TYPE.CSV,
+    pure = True)
 
 def default_csv_with_header_renderer (content, mime_type, **metadata):
-    _ensure_no_metadata(metadata)
-    yield _base_csv_renderer(content, with_header = True)
-    yield None
+    return _csv_renderer(content, True, metadata)
 
 register_renderer(
-    default_csv_with_header_renderer, MIME_TYPE.CSV_WITH_HEADER)
+    default_csv_with_header_renderer, MIME_TYPE.CSV_WITH_HEADER,
+    pure = True)
+
+# tables rendered by the notebook have a container identifier of their
+# own; the output of their renderer is thus not cached, unlike above
+def client_csv_renderer (content, mime_type, **metadata):
+    return _client_csv_renderer(content,
+        (mime_type == MIME_TYPE.CSV_WITH_HEADER.value), metadata)
 
-# JPG and PNG image renderer
+register_renderer(
+    client_csv_renderer, (MIME_TYPE.CSV, MIME_TYPE.CSV_WITH_HEADER),
+    accepts = lambda content, mime_type, **metadata:
+        metadata.get("mode") == "client")
+
+# JPG and PNG image renderer; if the 'binary' metadata field is set,
+# images are sent as raw bytes through a comm channel (see binary.py)
 def default_image_renderer (content, mime_type, **metadata):
+    binary = metadata.pop("binary", False)
+
     for key in metadata:
         if (not key in ("width", "height")):
             raise Exception("Unknown metadata field: %s" % key)
@@ -263,7 +689,11 @@ def default_image_renderer (content, mime_type, **metadata):
             raise Exception("Invalid value for metadata field '%s': %s" % (
                 key, metadata[key]))
 
-    yield (mime_type, base64.b64encode(content), metadata)
+    if (binary):
+        metadata["mime_type"] = mime_type
+        yield Frame(MIME_TYPE.BINARY, content, metadata)
+    else:
+        yield Frame(mime_type, base64.b64encode(content), metadata)
     yield None
 
 register_renderer(default_image_renderer, MIME_TYPE.GIF)
@@ -279,44 +709,132 @@ def default_svg_renderer (content, mime_type, **metadata):
     # handy manipulation of the XML structure, when needed
     display_object = IPython.display.SVG(data = content)
 
-    yield (mime_type, display_object._repr_svg_())
+    yield Frame(mime_type, display_object._repr_svg_())
     yield None
 
-register_renderer(default_svg_renderer, MIME_TYPE.SVG)
+register_renderer(default_svg_renderer, MIME_TYPE.SVG, pure = True)
+
+# JavaScript code renderer; the 'modules' metadata field, if any, lists
+# names of RequireJS modules the code depends on (or maps these names to
+# their path), which are made available to the code under their name
+
+_js_identifier = re.compile(r"^[A-Za-z_$][\w$]*$")
+
+# paths of the declared modules, and names of the modules whose
+# configuration was already sent, for each notebook session
+_javascript_modules = {}
+_configured_javascript_modules = {}
+_frontend_session = None
+
+# metadata field of the frames configuring modules; these modules are
+# only considered configured once such a frame is actually sent, as it
+# may be dropped on its way (e.g., by the output budget)
+_MODULE_PATHS_FIELD = "callysto_module_paths"
+
+def register_javascript_module (name, path, scope = None):
+    """ Declare a RequireJS module, from its path (without the .js
+        extension) or URL; the module configuration is only sent along
+        the first JavaScript frame using it in a notebook session
+
+        If `scope` is set, the module is only declared for this kernel.
+    """
+    if (not utils.is_string(name)) or (not _js_identifier.match(name)):
+        raise ValueError("Invalid module name: %s" % name)
+
+    if (scope is None):
+        javascript_modules = _javascript_modules
+    else:
+        _get_registrations(scope)
+        javascript_modules = _scopes[scope].javascript_modules
+
+    if (javascript_modules.get(name) == path):
+        return
+
+    javascript_modules[name] = path
+    for configured_modules in _configured_javascript_modules.itervalues():
+        configured_modules.discard(name)
+
+    _logger.debug("added JavaScript module %s: %s", name, path)
+
+def _get_javascript_module (name):
+    scope_ = _scopes.get(_current_scope)
+    if (scope_ is not None) and (name in scope_.javascript_modules):
+        return scope_.javascript_modules[name]
+
+    return _javascript_modules.get(name)
+
+def _pop_module_paths (metadata):
+    paths = metadata.pop(_MODULE_PATHS_FIELD, None)
+    if (paths is not None):
+        _configured_javascript_modules.setdefault(
+            _frontend_session, set()).update(paths)
+
+def _frame_sent (mime_type, metadata):
+    # called right before a frame (or bundle) is sent to the notebook;
+    # the modules it configures are marked as such, and the field
+    # listing them is removed from its metadata
+    if (metadata is None):
+        return
+
+    if (mime_type == MIME_TYPE.BUNDLE.value):
+        for (mime_type_, metadata_) in metadata.items():
+            if (isinstance(metadata_, dict)) and \
+               (_MODULE_PATHS_FIELD in metadata_):
+                _pop_module_paths(metadata_)
+                if (len(metadata_) == 0):
+                    del metadata[mime_type_]
+    else:
+        _pop_module_paths(metadata)
+
+def _set_frontend_session (session_id):
+    # notebook session the next frames are rendered for; a new
+    # session starts whenever a notebook is (re)loaded in a browser
+    global _frontend_session
+    _frontend_session = session_id
 
-# JavaScript code renderer
 def default_javascript_renderer (content, mime_type, **metadata):
     for key in metadata:
         if (key != "modules"):
             raise Exception("Unknown metadata field: %s" % key)
 
-    modules = metadata.get(key, [])
-    if (not isinstance(modules, dict)):
+    modules = metadata.get("modules", ())
+    if (isinstance(modules, dict)):
+        for (name, path) in modules.iteritems():
+            register_javascript_module(name, path, _current_scope)
+        names = sorted(modules)
+
+    elif (utils.is_iterable(modules)):
+        names = list(modules)
+        for name in names:
+            if (_get_javascript_module(name) is None):
+                raise Exception("Unknown JavaScript module: %s" % name)
+    else:
         raise Exception(
             "Invalid value for metadata field 'modules': %s" % modules)
 
     wrapper = "<script type=\"application/javascript\">\n%s\n</script>"
     code = textwrap.dedent(content).strip()
 
-    if (len(modules) > 0):
-        paths = [{"prefix": k, "path": v} for (k, v) in modules.iteritems()]
+    frame_metadata = None
+    if (len(names) > 0):
+        configured_modules = _configured_javascript_modules.get(
+            _frontend_session, ())
 
-        module_prefixes = "\"%s"
+        paths = dict((name, _get_javascript_module(name))
+            for name in names if (not name in configured_modules))
 
-        wrapper = wrapper % """\
-            require.config({
-                paths: {
-                    %(paths)s
-                },
-                shim: {%(dependencies)s}
-            });
+        code = "require(%s, function (%s) {\n%s\n});" % (
+            json.dumps(names), ', '.join(names), code)
 
-            require([%(module_quoted_prefixes)s], function(%(module_prefixes)s) {
-                %%s
-            });
-            """
+        # these modules will be marked as configured once sent
+        if (len(paths) > 0):
+            code = "require.config({paths: %s});\n%s" % (
+                json.dumps(paths), code)
+            frame_metadata = {_MODULE_PATHS_FIELD: sorted(paths)}
 
-    yield (MIME_TYPE.HTML, wrapper % code)
+    yield Frame(MIME_TYPE.HTML, wrapper % code, frame_metadata)
     yield None
 
 register_renderer(default_javascript_renderer, MIME_TYPE.JAVASCRIPT)
+
+register_javascript_module("callysto_table", _TABLE_VIEWER_URL)
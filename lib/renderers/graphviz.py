@@ -43,7 +43,7 @@ class GraphvizRenderer (BaseRenderer):
                 "Unknown program: %s" % layout_program)
 
         self._layout_program = layout_program
-        _logger.debug("set graphviz layout program to '%s'" % layout_program)
+        _logger.debug("set graphviz layout program to '%s'", layout_program)
 
     def set_output_format (self, code, **kwargs):
         """ usage: set-output-format <name>
@@ -57,7 +57,7 @@ class GraphvizRenderer (BaseRenderer):
                 "Unknown or unsupported format: %s" % output_format)
 
         self._output_format = output_format
-        _logger.debug("set graphviz output format to '%s'" % output_format)
+        _logger.debug("set graphviz output format to '%s'", output_format)
 
     def reset_graph_properties (self, code, **kwargs):
         """ Usage: reset-graph-properties
@@ -0,0 +1,156 @@
+# execution of renderers within time and memory limits; the renderer
+# runs in a forked process, which is killed if it runs for too long
+
+__all__ = (
+    "BudgetExceeded",
+    "run_with_limits")
+
+import cPickle
+import errno
+import logging
+import os
+import resource
+import select
+import signal
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# time limit, in seconds, of functions given none; the forked process
+# inherits the locks held by other threads at the time of the fork, and
+# may wait forever for one of them to be released
+DEFAULT_TIMEOUT = 60
+
+class BudgetExceeded (Exception):
+    """ Raised when a function exceeds its time or memory limit; the
+        `reason` attribute is set to either 'timeout' or 'memory'
+    """
+    def __init__ (self, reason, msg):
+        Exception.__init__(self, msg)
+        self.reason = reason
+
+def _used_memory ():
+    # virtual memory size of the current process, as
+    # the limit on the address space applies to it
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[0]) * resource.getpagesize()
+    except (IOError, ValueError):
+        return 0
+
+def _reset_logging_locks ():
+    # the locks of the logging module are the most likely to be held
+    # by another thread, and used by the function; they are recreated
+    logging._lock = threading.RLock()
+    for handler_ref in logging._handlerList:
+        handler = handler_ref()
+        if (handler is not None):
+            handler.createLock()
+
+def _run_child (write_fd, function, args, memory_limit):
+    status = 0
+    try:
+        _reset_logging_locks()
+
+        if (memory_limit is not None):
+            limit = _used_memory() + memory_limit
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+        try:
+            result = ("ok", function(*args))
+        except MemoryError:
+            result = ("memory", None)
+        except Exception as exception:
+            result = ("error", "%s: %s" % (
+                type(exception).__name__, exception))
+
+        data = cPickle.dumps(result, 2)
+        while (len(data) > 0):
+            data = data[os.write(write_fd, data):]
+
+    except BaseException:
+        status = 1
+
+    finally:
+        # the child must not run any cleanup handler of its parent
+        os._exit(status)
+
+def _read_result (read_fd, pid, timeout):
+    chunks, deadline = [], None
+    if (timeout is not None):
+        deadline = time.time() + timeout
+
+    while True:
+        if (deadline is None):
+            remaining = None
+        else:
+            remaining = max(0, deadline - time.time())
+
+        try:
+            readable, _, _ = select.select([read_fd], [], [], remaining)
+        except select.error as exception:
+            if (exception.args[0] == errno.EINTR):
+                continue
+            raise
+
+        if (len(readable) == 0):
+            os.kill(pid, signal.SIGKILL)
+            return None
+
+        chunk = os.read(read_fd, 65536)
+        if (chunk == ''):
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+def run_with_limits (function, args, timeout = None, memory_limit = None):
+    """ Call a function with arguments `args` in a forked process, and
+        return its result; BudgetExceeded is raised if the function runs
+        for more than `timeout` seconds (DEFAULT_TIMEOUT if not set), or
+        allocates more than `memory_limit` bytes. The result must be
+        picklable.
+
+        Note that, as the function runs in another process, any change
+        it makes to the state of the current process is lost.
+    """
+    if (not hasattr(os, "fork")):
+        _logger.warning("no time or memory limit enforced on this platform")
+        return function(*args)
+
+    if (timeout is None):
+        timeout = DEFAULT_TIMEOUT
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if (pid == 0):
+        os.close(read_fd)
+        _run_child(write_fd, function, args, memory_limit)
+
+    os.close(write_fd)
+    try:
+        data = _read_result(read_fd, pid, timeout)
+    finally:
+        os.close(read_fd)
+        try:
+            os.waitpid(pid, 0)
+        except OSError as exception:
+            # children may be reaped automatically if SIGCHLD is ignored
+            if (exception.errno != errno.ECHILD):
+                raise
+
+    if (data is None):
+        raise BudgetExceeded("timeout",
+            "time limit of %g seconds exceeded" % timeout)
+
+    if (data == ''):
+        raise Exception("process terminated unexpectedly")
+
+    status, result = cPickle.loads(data)
+    if (status == "ok"):
+        return result
+    elif (status == "memory"):
+        raise BudgetExceeded("memory",
+            "memory limit of %d bytes exceeded" % memory_limit)
+    else:
+        raise Exception(result)
@@ -0,0 +1,162 @@
+# scheduling of the requests received on the shell channel; pending
+# requests are read ahead into a queue, where those made pointless by
+# later ones are flagged so they can be answered without being executed
+
+__all__ = (
+    "RequestQueue",
+    "find_superseded")
+
+import collections
+import logging
+import time
+
+import jupyter_client.jsonutil
+import jupyter_client.session
+
+_logger = logging.getLogger(__name__)
+
+def _execution_key (msg_type, content):
+    # two execution requests are identical if they would run the same
+    # code the same way; user expressions are part of the reply
+    if (msg_type != "execute_request"):
+        return None
+
+    user_expressions = content.get("user_expressions") or {}
+    return (
+        content.get("code"),
+        bool(content.get("silent", False)),
+        bool(content.get("store_history", True)),
+        tuple(sorted(user_expressions.items())))
+
+class _Supersession:
+    # rules of find_superseded(), applied one request at a time; only
+    # the previous request and the last silent request of each key
+    # are kept, so that each request is compared to these only
+    def __init__ (self):
+        self._previous, self._last_silent = (None, None), {}
+
+    def add (self, request, key):
+        # return the (request, reason) tuples superseded by this
+        # request, of the given execution key (None if not any)
+        superseded = []
+        previous_request, previous_key = self._previous
+
+        if (key is not None) and (key == previous_key):
+            superseded.append((previous_request, "coalesced"))
+
+        # silent requests are expected to have no side effect
+        # visible to the user, so only the latest one matters
+        if (key is not None) and (key[1]):
+            if (key in self._last_silent):
+                superseded.append((self._last_silent[key], "superseded"))
+            self._last_silent[key] = request
+
+        self._previous = (request, key)
+        return superseded
+
+    def discard (self, request, key):
+        # forget a request which left the queue
+        if (self._previous[0] is request):
+            self._previous = (None, None)
+
+        if (key is not None) and (self._last_silent.get(key) is request):
+            del self._last_silent[key]
+
+def find_superseded (requests):
+    """ Return the requests of a queue made redundant by later ones, as
+        a dictionary of their index to the reason they were superseded;
+        `requests` is a list of (message type, message content) tuples,
+        in the order they were received
+
+        - consecutive identical execution requests are coalesced into
+          the last of them ('coalesced')
+        - a silent execution request is dropped if an identical silent
+          request is queued after it ('superseded')
+    """
+    superseded, supersession = {}, _Supersession()
+
+    for (index, (msg_type, content)) in enumerate(requests):
+        key = _execution_key(msg_type, content)
+        for (index_, reason) in supersession.add(index, key):
+            superseded.setdefault(index_, reason)
+
+    return superseded
+
+class _PendingRequest:
+    __slots__ = (
+        "stream", "frames", "msg_type", "content",
+        "date", "received", "superseded", "key")
+
+    def __init__ (self, stream, frames, msg_type, content, date):
+        self.stream, self.frames = stream, frames
+        self.msg_type, self.content, self.date = msg_type, content, date
+        self.received = time.time()
+        self.superseded = None
+        self.key = _execution_key(msg_type, content)
+
+    def wait_time (self):
+        # the date set by the client accounts for the time the request
+        # spent in the socket, before the kernel read it
+        if (self.date is not None):
+            delta = jupyter_client.session.utcnow() - self.date
+            return max(0, delta.total_seconds())
+
+        return time.time() - self.received
+
+class RequestQueue:
+    """ Queue of the shell requests waiting to be processed, as lists of
+        raw message frames; their header and content are only decoded to
+        find the superseded ones, and are verified when processed
+    """
+    def __init__ (self, session):
+        self._session = session
+        self._requests = collections.deque()
+        self._supersession = _Supersession()
+
+    def _peek (self, frames):
+        try:
+            _, msg_list = self._session.feed_identities(frames, copy = False)
+            header, content = [self._session.unpack(
+                getattr(frame, "bytes", frame))
+                for frame in (msg_list[1], msg_list[4])]
+
+            date = jupyter_client.jsonutil.parse_date(header.get("date"))
+            if (not hasattr(date, "tzinfo")):
+                date = None
+
+            return (header.get("msg_type"), content, date)
+
+        except Exception:
+            # invalid messages are left for the kernel to report
+            return (None, {}, None)
+
+    def push (self, stream, frames):
+        msg_type, content, date = self._peek(frames)
+        request = _PendingRequest(stream, frames, msg_type, content, date)
+        self._requests.append(request)
+
+        # the new request is only compared to those queued before
+        superseded = self._supersession.add(request, request.key)
+
+        for (request, reason) in superseded:
+            if (request.superseded is None):
+                request.superseded = reason
+                _logger.debug("%s superseded (%s)", request.msg_type, reason)
+
+    def pop (self):
+        """ Return the oldest pending request, with its `superseded`
+            attribute set to the reason it was superseded, if any
+        """
+        request = self._requests.popleft()
+        self._supersession.discard(request, request.key)
+        return request
+
+    def abort_all (self):
+        """ Flag all pending requests, e.g. after a failed execution
+        """
+        for request in self._requests:
+            if (request.superseded is None):
+                request.superseded = "aborted"
+
+    def __len__ (self):
+        return len(self._requests)
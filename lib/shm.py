@@ -0,0 +1,137 @@
+# transport of frame content through shared memory, e.g. from worker
+# processes to the kernel; content is written once in a memory-backed
+# file, and only a handle to this file crosses process boundaries
+
+__all__ = (
+    "SharedContent",
+    "share")
+
+import errno
+import logging
+import mmap
+import os
+import tempfile
+
+import utils
+
+_logger = logging.getLogger(__name__)
+
+# handles created (or unpickled) in this process and not released yet
+_handles = set()
+
+def _default_directory ():
+    # /dev/shm is backed by memory on Linux; the
+    # temporary directory is used everywhere else
+    if (os.path.isdir("/dev/shm")) and (os.access("/dev/shm", os.W_OK)):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+class SharedContent:
+    """ Picklable handle to content written in shared memory by share();
+        handles can be yielded by do_execute_() in place of the content
+        of a frame, which is then mapped by the kernel rather than copied
+        and released once sent to the notebook
+    """
+    def __init__ (self, filename, size, encoding = None):
+        self.filename, self.size = filename, size
+        self.encoding = encoding
+        _handles.add(self)
+
+    def __setstate__ (self, state):
+        self.__dict__.update(state)
+        _handles.add(self)
+
+    def map (self):
+        """ Return the content, as a read-only buffer on the shared memory
+            or as a Unicode string if the shared content was one
+        """
+        if (self.size == 0):
+            content = ''
+        else:
+            with open(self.filename, "rb") as fh:
+                mapping = mmap.mmap(
+                    fh.fileno(), self.size, access = mmap.ACCESS_READ)
+
+            # the buffer keeps the mapping alive, even once released
+            content = buffer(mapping)
+
+        if (self.encoding is not None):
+            content = unicode(content, self.encoding)
+
+        return content
+
+    def release (self):
+        """ Free the shared memory; buffers returned by map() remain
+            valid until they are garbage collected
+        """
+        _handles.discard(self)
+        try:
+            os.unlink(self.filename)
+        except OSError as exception:
+            if (exception.errno != errno.ENOENT):
+                raise
+
+    def __repr__ (self):
+        return "<SharedContent %s (%d bytes)>" % (self.filename, self.size)
+
+def share (content, directory = None):
+    """ Write content in shared memory and return a SharedContent handle
+        to it; `content` is either a string or any object supporting the
+        buffer protocol. Unicode strings are stored as UTF-8.
+
+        The content is kept until the handle is released, which the
+        kernel does once it sent the content to the notebook, or once
+        the cell that created the handle executed if it wasn't sent.
+    """
+    encoding = None
+    if (isinstance(content, unicode)):
+        content, encoding = content.encode("utf-8"), "utf-8"
+
+    fd, filename = tempfile.mkstemp(
+        prefix = "callysto-", suffix = ".shm",
+        dir = _default_directory() if (directory is None) else directory)
+
+    try:
+        size, offset = len(content), 0
+        while (offset < size):
+            # slices of the content are written without being copied
+            if (isinstance(content, memoryview)):
+                offset += os.write(fd, content[offset:])
+            else:
+                offset += os.write(fd, buffer(content, offset))
+    except:
+        os.unlink(filename)
+        raise
+    finally:
+        os.close(fd)
+
+    _logger.debug("shared %d bytes as %s", size, filename)
+    return SharedContent(filename, size, encoding)
+
+def _map_frames (frames):
+    # each shared content is released when the next frame is requested,
+    # i.e., once the kernel sent the frame holding it to the notebook
+    for frame in frames:
+        if (frame is None) or (not isinstance(frame[1], SharedContent)):
+            yield frame
+            continue
+
+        mime_type, shared_content, metadata = frame
+        try:
+            yield (mime_type, shared_content.map(), metadata)
+        finally:
+            shared_content.release()
+
+def _release_handles (kept_handles):
+    # release the handles not found in `kept_handles`; this is done once
+    # a cell executed, for those its frames didn't send (e.g., if the
+    # cell was silent or failed)
+    n_handles = 0
+    for handle in list(_handles):
+        if (not handle in kept_handles):
+            handle.release()
+            n_handles += 1
+
+    if (n_handles > 0):
+        _logger.debug("released %d unsent shared content %s",
+            n_handles, utils.plural("handle", n_handles))
@@ -0,0 +1,166 @@
+# snapshot of the state of a kernel, written when the kernel restarts
+# and read by the new kernel process; values are pickled separately,
+# and only unpickled when accessed
+
+__all__ = (
+    "Snapshot",)
+
+import cPickle
+import logging
+import os
+
+import renderers.base
+import renderers.core
+
+_logger = logging.getLogger(__name__)
+
+class Snapshot:
+    """ Dictionary-like set of named, picklable values
+    """
+    def __init__ (self, entries = None):
+        self._entries = {} if (entries is None) else entries
+        self._values = {}
+
+    def __setitem__ (self, key, value):
+        self._entries[key] = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        self._values[key] = value
+
+    def __getitem__ (self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = cPickle.loads(self._entries[key])
+            self._values[key] = value
+            return value
+
+    def __delitem__ (self, key):
+        del self._entries[key]
+        self._values.pop(key, None)
+
+    def __contains__ (self, key):
+        return (key in self._entries)
+
+    def __len__ (self):
+        return len(self._entries)
+
+    def get (self, key, default = None):
+        if (key in self._entries):
+            return self[key]
+        return default
+
+    def keys (self):
+        return self._entries.keys()
+
+    def save (self, filename):
+        # the file is replaced atomically, and only readable by its owner
+        tmp_fn = filename + ".tmp"
+        fd = os.open(tmp_fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as fh:
+            cPickle.dump(self._entries, fh, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fn, filename)
+
+    @classmethod
+    def load (cls, filename):
+        with open(filename, "rb") as fh:
+            return cls(cPickle.load(fh))
+
+#:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
+
+def _store (snapshot, key, value):
+    try:
+        snapshot[key] = value
+        return True
+    except Exception as exception:
+        _logger.warning("unable to snapshot %s: %s", key, exception)
+        return False
+
+def _list_stateful_renderers (kernel):
+    # instances of BaseRenderer whose methods are registered as
+    # renderers, identified by their class and registration order
+    stateful_renderers, seen, counts = [], set(), {}
+    for (renderer, _) in reversed(renderers.core._list_renderers(kernel)):
+        instance = getattr(renderer, "im_self", None)
+        if (not isinstance(instance, renderers.base.BaseRenderer)) or \
+           (id(instance) in seen):
+            continue
+
+        class_ = instance.__class__
+        name = "%s.%s" % (class_.__module__, class_.__name__)
+        counts[name] = counts.get(name, 0) + 1
+
+        stateful_renderers.append(
+            ("renderer:%s:%d" % (name, counts[name]), instance))
+        seen.add(id(instance))
+
+    return stateful_renderers
+
+def take_snapshot (kernel):
+    """ Return a snapshot of the declared attributes, magic commands
+        and renderers settings of a kernel, plus whatever is added by
+        its do_snapshot_() method
+    """
+    snapshot = Snapshot()
+
+    for name in kernel.snapshot_attributes:
+        if (hasattr(kernel, name)):
+            _store(snapshot, "attribute:" + name, getattr(kernel, name))
+
+    # magic commands whose callback is a method of the kernel are
+    # stored by name; the others are stored only if picklable
+    magic_commands = kernel.magic_commands
+    _store(snapshot, "magic-commands-prefix", magic_commands.prefix)
+
+    for (name, (callback, doc, is_pre_flight)) in \
+        magic_commands._declarations.iteritems():
+        if (getattr(callback, "im_self", None) is kernel):
+            callback = ("method", callback.__name__)
+        else:
+            callback = ("function", callback)
+
+        _store(snapshot, "magic-command:" + name,
+            (callback, doc, is_pre_flight))
+
+    for (key, renderer) in _list_stateful_renderers(kernel):
+        _store(snapshot, key, renderer.get_state())
+
+    kernel.do_snapshot_(snapshot)
+    return snapshot
+
+def restore_attributes (kernel, snapshot):
+    for name in kernel.snapshot_attributes:
+        key = "attribute:" + name
+        if (key in snapshot):
+            setattr(kernel, name, snapshot[key])
+
+def restore_settings (kernel, snapshot):
+    """ Restore the magic commands and renderers settings of a kernel;
+        magic commands it already declared are left untouched
+    """
+    magic_commands = kernel.magic_commands
+    if ("magic-commands-prefix" in snapshot):
+        magic_commands.prefix = snapshot["magic-commands-prefix"]
+
+    for key in snapshot.keys():
+        if (not key.startswith("magic-command:")):
+            continue
+
+        name = key.split(':', 1)[1]
+        if (magic_commands.has_command(name)):
+            continue
+
+        try:
+            (callback_type, callback), doc, is_pre_flight = snapshot[key]
+        except Exception as exception:
+            _logger.warning("unable to restore magic command '%s': %s",
+                name, exception)
+            continue
+
+        if (callback_type == "method"):
+            callback = getattr(kernel, callback)
+
+        magic_commands._declare_command(
+            name, callback, doc, False, is_pre_flight)
+
+    for (key, renderer) in _list_stateful_renderers(kernel):
+        if (key in snapshot):
+            renderer.set_state(snapshot[key])
@@ -0,0 +1,160 @@
+# output budgets, diverting oversized frames to files on disk
+# rather than sending them to the notebook
+
+__all__ = (
+    "OutputBudget",)
+
+import base64
+import io
+import itertools
+import json
+import logging
+import mimetypes
+import os
+
+import binary
+import renderers.core
+import utils
+
+_logger = logging.getLogger(__name__)
+
+_spilled_frame_ids = itertools.count(1)
+
+# extensions of the spilled files for common MIME types; those
+# returned by mimetypes.guess_extension() are arbitrary for some
+_EXTENSIONS = {
+    "application/json": ".json",
+    "application/javascript": ".js",
+    "application/octet-stream": ".bin",
+    "image/gif": ".gif",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/svg+xml": ".svg",
+    "text/csv": ".csv",
+    "text/html": ".html",
+    "text/markdown": ".md",
+    "text/plain": ".txt"}
+
+def _extension (mime_type, default):
+    extension = _EXTENSIONS.get(mime_type)
+    if (extension is None):
+        extension = mimetypes.guess_extension(mime_type) or default
+    return extension
+
+def _content_size (content):
+    # size once encoded, as sent to the notebook
+    if (isinstance(content, unicode)):
+        return len(content.encode("utf-8"))
+    elif (utils.is_string(content)) or (binary.is_buffer(content)):
+        return len(content)
+    elif (isinstance(content, dict)):
+        return sum(map(_content_size, content.values()))
+    else:
+        return len(json.dumps(content))
+
+class OutputBudget:
+    """ Per-cell output budget
+
+        Frames larger than `max_frame_size` bytes, or sent after a total
+        of `max_cell_size` bytes has been reached, are written to files
+        in `spill_directory`. The former are replaced by a preview of at
+        most `preview_size` characters; the latter are dropped, with a
+        single notice sent the first time it happens. Previews and
+        notices count toward the cell budget, but are always sent.
+    """
+    def __init__ (self, max_frame_size, max_cell_size,
+        spill_directory, preview_size = 1024):
+        self.max_frame_size = max_frame_size
+        self.max_cell_size = max_cell_size
+        self.spill_directory = spill_directory
+        self.preview_size = preview_size
+
+        self.emitted_bytes = 0
+        self.spilled_frames = 0
+        self.spilled_bytes = 0
+        self.cell_limit_reached = False
+
+    def _spill (self, mime_type, content, metadata, size):
+        self.spilled_frames += 1
+        self.spilled_bytes += size
+
+        fn = os.path.join(self.spill_directory,
+            "frame-%d-%d" % (os.getpid(), next(_spilled_frame_ids)))
+
+        # raw content sent through a comm channel (see binary.py)
+        if (mime_type == renderers.core.MIME_TYPE.BINARY.value):
+            mime_type = (metadata or {}).get(
+                "mime_type", binary.DEFAULT_MIME_TYPE)
+            extension = _extension(mime_type, ".bin")
+            if (isinstance(content, memoryview)):
+                content = content.tobytes()
+            else:
+                content = bytes(content)
+
+        elif (utils.is_string(content)):
+            extension = _extension(mime_type, ".txt")
+
+            # binary content is base64-encoded by the renderers
+            if (mime_type.startswith("image/")) and \
+               (mime_type != "image/svg+xml"):
+                content = base64.b64decode(content)
+        else:
+            extension, content = ".json", json.dumps(content)
+
+        if (isinstance(content, unicode)):
+            content = content.encode("utf-8")
+
+        fn += extension
+        with io.open(fn, "wb") as fh:
+            fh.write(content)
+
+        if (_logger.isEnabledFor(logging.DEBUG)):
+            _logger.debug("spilled %d %s of %s to %s",
+                size, utils.plural("byte", size), mime_type, fn)
+
+        return fn
+
+    def check (self, mime_type, content, metadata):
+        """ Return the frame to send in place of the one provided,
+            or None if nothing is to be sent
+        """
+        size = _content_size(content)
+
+        if (self.cell_limit_reached):
+            self._spill(mime_type, content, metadata, size)
+            return None
+
+        if (self.max_cell_size is not None) and \
+           (self.emitted_bytes + size > self.max_cell_size):
+            self.cell_limit_reached = True
+            fn = self._spill(mime_type, content, metadata, size)
+
+            return self._count("text/plain",
+                "\n[output limit of %d %s reached for this cell; further "
+                "output written to %s]\n" % (
+                    self.max_cell_size,
+                    utils.plural("byte", self.max_cell_size),
+                    os.path.dirname(fn)), None)
+
+        if (self.max_frame_size is not None) and \
+           (size > self.max_frame_size):
+            fn = self._spill(mime_type, content, metadata, size)
+
+            if (mime_type == "text/plain"):
+                preview = content[:self.preview_size]
+            else:
+                preview = ''
+
+            return self._count("text/plain",
+                "%s\n[output of %d %s (%s) truncated; full content "
+                "written to %s]\n" % (
+                    preview, size, utils.plural("byte", size), mime_type, fn),
+                None)
+
+        self.emitted_bytes += size
+        return (mime_type, content, metadata)
+
+    def _count (self, mime_type, content, metadata):
+        # frames sent in place of spilled ones use the budget as well
+        self.emitted_bytes += _content_size(content)
+        return (mime_type, content, metadata)
@@ -0,0 +1,236 @@
+# span-based tracing of the kernel activity, with spans
+# exported asynchronously to a rotating JSON Lines file
+
+__all__ = (
+    "Tracer",
+    "NO_TRACER")
+
+import io
+import json
+import logging
+import os
+import Queue
+import random
+import sys
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+class _Span:
+    def __init__ (self, tracer, name, attributes):
+        self._tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def set_attribute (self, key, value):
+        self.attributes[key] = value
+
+    def _start (self, stack):
+        if (len(stack) == 0):
+            self.trace_id = "%032x" % random.getrandbits(128)
+            self.parent_id = None
+        else:
+            self.trace_id = stack[-1].trace_id
+            self.parent_id = stack[-1].span_id
+
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.start_time = time.time()
+
+    def _end (self, exc_type, exc_value):
+        duration = time.time() - self.start_time
+
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration": duration,
+            "attributes": self.attributes}
+
+        if (exc_type is None):
+            record["status"] = "ok"
+        else:
+            record["status"] = "error"
+            record["error"] = "%s: %s" % (exc_type.__name__, exc_value)
+
+        self._tracer._export(record)
+
+    def __enter__ (self):
+        stack = self._tracer._stack()
+        self._start(stack)
+        stack.append(self)
+        return self
+
+    def __exit__ (self, exc_type, exc_value, exc_traceback):
+        self._tracer._stack().pop()
+        self._end(exc_type, exc_value)
+
+class _NoSpan:
+    # stands for spans that are not recorded; either because tracing
+    # is disabled, or because the trace they belong to is not sampled
+    def __init__ (self, tracer = None):
+        self._tracer = tracer
+
+    def set_attribute (self, key, value):
+        pass
+
+    def _start (self, stack):
+        pass
+
+    def _end (self, exc_type, exc_value):
+        pass
+
+    def __enter__ (self):
+        if (self._tracer is not None):
+            self._tracer._stack().append(self)
+        return self
+
+    def __exit__ (self, exc_type, exc_value, exc_traceback):
+        if (self._tracer is not None):
+            self._tracer._stack().pop()
+
+def _span_frames (span, frames):
+    # the span lasts until the frames are exhausted, but is only the
+    # parent of spans started while they are produced; not of those
+    # started while the caller processes them
+    stack = span._tracer._stack()
+    span._start(stack)
+
+    exc_type, exc_value = None, None
+    try:
+        while True:
+            stack.append(span)
+            try:
+                frame = next(frames)
+            except StopIteration:
+                return
+            except:
+                exc_type, exc_value = sys.exc_info()[:2]
+                raise
+            finally:
+                stack.pop()
+
+            yield frame
+    finally:
+        span._end(exc_type, exc_value)
+
+class _NoTracer:
+    _span = _NoSpan()
+
+    def span (self, name, **attributes):
+        return self._span
+
+    def span_frames (self, name, frames, **attributes):
+        return frames
+
+    def close (self):
+        pass
+
+NO_TRACER = _NoTracer()
+
+class Tracer:
+    """ Record spans and export them to a JSON Lines file
+
+        Only a fraction `sampling_rate` of the traces (i.e., trees of
+        spans started from a top-level span) are recorded. The file is
+        rotated once it reaches `max_bytes` bytes, with `backup_count`
+        previous files being kept.
+    """
+    def __init__ (self, filename, sampling_rate = 1.0,
+        max_bytes = 10 * 1024 * 1024, backup_count = 3):
+        self.filename = filename
+        self.sampling_rate = sampling_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self._local = threading.local()
+        self._queue = Queue.Queue()
+
+        self._exporter = threading.Thread(
+            target = self._export_spans, name = "callysto-tracer")
+        self._exporter.daemon = True
+        self._exporter.start()
+
+    def _stack (self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def span (self, name, **attributes):
+        """ Return a context manager recording a span; spans started
+            within it, from the same thread, are its children
+        """
+        stack = self._stack()
+        if (len(stack) == 0):
+            sampled = (random.random() < self.sampling_rate)
+        else:
+            sampled = not isinstance(stack[-1], _NoSpan)
+
+        if (sampled):
+            return _Span(self, name, attributes)
+        else:
+            return _NoSpan(self)
+
+    def span_frames (self, name, frames, **attributes):
+        """ Return a generator over `frames`, recording a span from the
+            first frame requested until the last one is returned
+        """
+        return _span_frames(self.span(name, **attributes), frames)
+
+    def _export (self, record):
+        self._queue.put(record)
+
+    def _rotate (self):
+        for i in range(self.backup_count - 1, 0, -1):
+            fn = "%s.%d" % (self.filename, i)
+            if (os.path.exists(fn)):
+                os.rename(fn, "%s.%d" % (self.filename, i + 1))
+
+        if (self.backup_count > 0):
+            os.rename(self.filename, self.filename + ".1")
+        else:
+            os.unlink(self.filename)
+
+    def _export_spans (self):
+        fh = None
+        while True:
+            record = self._queue.get()
+            try:
+                if (record is None):
+                    return
+
+                if (fh is None):
+                    fh = io.open(self.filename, "ab")
+
+                fh.write(json.dumps(record, default = repr) + '\n')
+
+                # spans are flushed in batches, whenever the queue is empty
+                if (self._queue.empty()):
+                    fh.flush()
+
+                if (fh.tell() >= self.max_bytes):
+                    fh.close()
+                    fh = None
+                    self._rotate()
+
+            except Exception as exception:
+                _logger.error("unable to export span: %s", exception)
+
+            finally:
+                self._queue.task_done()
+
+                if (record is None) and (fh is not None):
+                    fh.close()
+
+    def flush (self):
+        """ Wait for all recorded spans to be exported
+        """
+        self._queue.join()
+
+    def close (self):
+        self._queue.put(None)
+        self._exporter.join()
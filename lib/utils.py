@@ -1,5 +1,7 @@
 
 import collections
+import importlib
+import inspect
 
 import inflect
 import six
@@ -23,3 +25,54 @@ def flatten_text (text):
     for line in text.splitlines():
         lines.append(line.strip())
     return ' '.join(lines)
+
+def _walk_classes (module):
+    # classes of the module itself, then of the modules it imports
+    modules = [module] + [
+        obj for (_, obj) in inspect.getmembers(module, inspect.ismodule)]
+    for module_ in modules:
+        for (_, class_) in inspect.getmembers(module_, inspect.isclass):
+            yield class_
+
+def find_class (qualified_name, base_class):
+    """ Return a class from its fully qualified name; if only a module
+        name is provided, the first subclass of `base_class` found in
+        this module, then in the modules it imports, is returned instead
+    """
+    if (qualified_name.count('.') < 1):
+        module_name, class_name = qualified_name, None
+    else:
+        module_name, class_name = qualified_name.rsplit('.', 1)
+
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as exception:
+        if (str(exception).endswith(module_name)):
+            raise ValueError(
+                "invalid qualified name: module '%s' not found" % module_name)
+        else:
+            raise ValueError(
+                "error while importing '%s': %s" % (module_name, exception))
+
+    if (class_name is not None):
+        try:
+            class_ = getattr(module, class_name)
+        except AttributeError:
+            raise ValueError(
+                "invalid qualified name: class '%s' not found" % class_name)
+
+        if (not issubclass(class_, base_class)):
+            raise ValueError(
+                "invalid class: '%s' is not a subclass "
+                "of %s" % (class_, base_class.__name__))
+
+        return class_
+
+    for candidate in _walk_classes(module):
+        if (issubclass(candidate, base_class)) and \
+           (candidate is not base_class):
+            return candidate
+
+    raise ValueError(
+        "invalid module '%s': no class subclassing "
+        "%s found" % (module_name, base_class.__name__))
@@ -0,0 +1,122 @@
+
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import callysto.batch
+from commons import *
+
+class BatchRunnerTests (unittest.TestCase):
+
+    def setUp (self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown (self):
+        shutil.rmtree(self.tmp_path)
+
+    def _write (self, filename, content):
+        filename = os.path.join(self.tmp_path, filename)
+        with io.open(filename, "w", encoding = "utf-8") as fh:
+            fh.write(content)
+        return filename
+
+    def _read (self, filename):
+        with io.open(os.path.join(self.tmp_path, filename),
+            encoding = "utf-8") as fh:
+            return json.load(fh)
+
+    def test_running_notebooks (self):
+        notebook_fn = self._write("notebook.ipynb", unicode(json.dumps({
+            "cells": [
+                {"cell_type": "markdown", "metadata": {},
+                 "source": "# title"},
+                {"cell_type": "code", "metadata": {}, "outputs": [],
+                 "execution_count": None, "source": ["foo\n", "bar"]},
+                {"cell_type": "code", "metadata": {}, "outputs": [],
+                 "execution_count": None, "source": "%unknown\nbaz"},
+                {"cell_type": "code", "metadata": {}, "outputs": [],
+                 "execution_count": None, "source": "qux"}],
+            "metadata": {}, "nbformat": 4, "nbformat_minor": 2})))
+
+        # the outputs should be written back in the notebook,
+        n_executed, n_failed = callysto.batch.run_notebook(
+            DummyKernel, notebook_fn)
+        self.assertEqual((n_executed, n_failed), (2, 1))
+
+        cells = self._read("notebook.ipynb")["cells"]
+        self.assertEqual(cells[0]["source"], "# title")
+        self.assertEqual(cells[1]["execution_count"], 1)
+        self.assertEqual(cells[1]["outputs"], [{
+            "output_type": "stream", "name": "stdout", "text": "foo\nbar"}])
+        self.assertEqual(cells[2]["outputs"][0]["name"], "stderr")
+
+        # with no cell executed after a failed one
+        self.assertEqual(cells[3]["outputs"], [])
+        self.assertEqual(cells[3]["execution_count"], None)
+
+    def test_non_ascii_outputs (self):
+        class NonASCIIDummyKernel (DummyKernel):
+            def do_execute_ (self, code):
+                yield u"caf\xe9"
+                yield ("text/html", "<b>caf\xc3\xa9</b>")
+
+        cells_fn = self._write("cells.txt", u"abc")
+
+        # Unicode and UTF-8 encoded byte strings can be mixed
+        n_executed, n_failed = callysto.batch.run_notebook(
+            NonASCIIDummyKernel, cells_fn)
+        self.assertEqual((n_executed, n_failed), (1, 0))
+
+        outputs = self._read("cells.ipynb")["cells"][0]["outputs"]
+        self.assertEqual(outputs[0]["text"], u"caf\xe9")
+        self.assertEqual(outputs[1]["data"]["text/html"], u"<b>caf\xe9</b>")
+
+    def test_binary_outputs (self):
+        class BinaryDummyKernel (DummyKernel):
+            binary_chunk_size = 2
+
+            def do_execute_ (self, code):
+                yield ("image/png", str(code), {"binary": True, "width": 10})
+
+        cells_fn = self._write("cells.txt", u"abcde")
+
+        # binary content sent through comm channels
+        # should be written as a regular output
+        n_executed, n_failed = callysto.batch.run_notebook(
+            BinaryDummyKernel, cells_fn)
+        self.assertEqual((n_executed, n_failed), (1, 0))
+
+        outputs = self._read("cells.ipynb")["cells"][0]["outputs"]
+        self.assertEqual(len(outputs), 1)
+        self.assertEqual(outputs[0]["data"], {
+            "text/plain": "[image/png content]",
+            "image/png": base64.b64encode("abcde")})
+        self.assertEqual(outputs[0]["metadata"], {"image/png": {"width": 10}})
+
+    def test_running_files_in_parallel (self):
+        input_fns = [
+            self._write("cells-%d.txt" % i, u"a%d\n%%%%\nb%d\n" % (i, i))
+            for i in range(3)]
+
+        output_path = os.path.join(self.tmp_path, "outputs")
+        os.mkdir(output_path)
+
+        results = callysto.batch.run_notebooks(
+            DummyKernel, input_fns, output_path, processes = 2)
+
+        self.assertEqual(sorted(results),
+            [(fn, (2, 0), None) for fn in input_fns])
+
+        # plain cell files should be written as notebooks
+        for i in range(3):
+            cells = self._read(os.path.join("outputs", "cells-%d.ipynb" % i))
+            self.assertEqual(
+                [cell["outputs"][0]["text"] for cell in cells["cells"]],
+                ["a%d" % i, "b%d" % i])
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,70 @@
+
+import unittest
+
+from commons import *
+
+class CodeCompletionTests (unittest.TestCase):
+
+    def test_completing_magic_commands (self):
+        dummy_kernel = DummyKernel()
+
+        def command (code, **kwargs):
+            """ Usage: command [--foo STRING] [--bar]
+            """
+            return code
+
+        dummy_kernel.declare_pre_flight_command("set-foo", command)
+        dummy_kernel.declare_post_flight_command("set-bar", command)
+        dummy_kernel.declare_post_flight_command("reset", command)
+
+        # names of magic commands should be completed,
+        reply = dummy_kernel.do_complete("%se", 3)
+        self.assertEqual(reply["matches"], ["%set-bar", "%set-foo"])
+        self.assertEqual(reply["cursor_start"], 0)
+        self.assertEqual(reply["cursor_end"], 3)
+
+        # including when using a non-default prefix,
+        dummy_kernel.magic_commands.prefix = '!'
+        reply = dummy_kernel.do_complete("test\n!re", 8)
+        self.assertEqual(reply["matches"], ["!reset"])
+        self.assertEqual(reply["cursor_start"], 5)
+
+        # as should be their options,
+        reply = dummy_kernel.do_complete("!set-foo --", 11)
+        self.assertEqual(reply["matches"], ["--bar", "--foo"])
+        self.assertEqual(reply["cursor_start"], 9)
+
+        # but not once they are removed
+        dummy_kernel.magic_commands.remove_command("set-foo")
+        reply = dummy_kernel.do_complete("!set", 4)
+        self.assertEqual(reply["matches"], ["!set-bar"])
+
+        reply = dummy_kernel.do_complete("!set-foo --", 11)
+        self.assertEqual(reply["matches"], [])
+
+    def test_completing_vocabulary (self):
+        dummy_kernel = DummyKernel()
+
+        dummy_kernel.completions.add_words(
+            ["table_%05d" % i for i in range(100000)])
+        dummy_kernel.completions.add_words(["SELECT", "SET"])
+
+        # words should be completed from the vocabulary
+        reply = dummy_kernel.do_complete("SELECT * FROM table_0999", 24)
+        self.assertEqual(reply["matches"],
+            ["table_0999%d" % i for i in range(10)])
+        self.assertEqual(reply["cursor_start"], 14)
+
+        reply = dummy_kernel.do_complete("SE", 2)
+        self.assertEqual(reply["matches"], ["SELECT", "SET"])
+
+        # but not once they are removed
+        dummy_kernel.completions.remove_words("SET")
+        reply = dummy_kernel.do_complete("SE", 2)
+        self.assertEqual(reply["matches"], ["SELECT"])
+
+        with self.assertRaises(ValueError):
+            dummy_kernel.completions.remove_words("SET")
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,198 @@
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+import jupyter_client.connect
+import tornado.ioloop
+import zmq
+
+import callysto.host
+import callysto.renderers
+from commons import *
+from commons import _execute
+
+class KernelHostTests (unittest.TestCase):
+
+    def setUp (self):
+        self.tmp_path = tempfile.mkdtemp()
+
+    def tearDown (self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_hosting_kernels (self):
+        host = callysto.host.KernelHost(DummyKernel)
+
+        kernels = []
+        for i in range(2):
+            connection_fn, _ = jupyter_client.connect.write_connection_file(
+                os.path.join(self.tmp_path, "kernel-%d.json" % i))
+            kernels.append(host.add_kernel(connection_fn))
+
+        # each hosted kernel should have its own state,
+        self.assertEqual(host.kernels, kernels)
+        self.assertIsNot(kernels[0].session, kernels[1].session)
+
+        kernels[0].declare_pre_flight_command("upper",
+            lambda code: code.upper())
+
+        status, results = _execute(kernels[0], "%upper\nfoo")
+        self.assertEqual(status["status"], "ok")
+        self.assertEqual(results[0][2]["text"], "FOO")
+
+        status, results = _execute(kernels[1], "%upper\nfoo")
+        self.assertEqual(status["status"], "error")
+
+        # renderers registered through a kernel only apply to it
+        for (i, kernel) in enumerate(kernels):
+            def dummy_renderer (content, mime_type, i = i):
+                yield "kernel %d: %s" % (i, content)
+                yield None
+
+            kernel.register_renderer(dummy_renderer, "dummy/vnd.a")
+
+        def do_execute_ (self, code):
+            yield ("dummy/vnd.a", code)
+
+        for (i, kernel) in enumerate(kernels):
+            kernel.update_executor(do_execute_)
+            status, results = _execute(kernel, "foo")
+            self.assertEqual(status["status"], "ok")
+            self.assertEqual(results[0][2]["text"], "kernel %d: foo" % i)
+
+        self.assertEqual(
+            callysto.renderers.list_renderers_for_mime_type("dummy/*"), [])
+
+        # and should be forgotten once removed, with their renderers
+        for kernel in kernels:
+            host.remove_kernel(kernel)
+        self.assertEqual(host.kernels, [])
+        host.close()
+        self.assertFalse(any(kernel in callysto.renderers.core._scopes
+            for kernel in kernels))
+
+    def test_host_requests (self):
+        host = callysto.host.KernelHost(DummyKernel)
+
+        socket_path = os.path.join(self.tmp_path, "host.socket")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(4)
+
+        io_loop = tornado.ioloop.IOLoop.current()
+        io_loop.add_handler(server.fileno(),
+            lambda fd, events: host._accept(server),
+            tornado.ioloop.IOLoop.READ)
+
+        def connect (request = None):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(socket_path)
+            if (request is not None):
+                client.sendall(json.dumps(request) + '\n')
+            return client
+
+        connection_fn, _ = jupyter_client.connect.write_connection_file(
+            os.path.join(self.tmp_path, "kernel.json"))
+
+        # a client sending nothing should neither hold back
+        # the requests of others, nor be kept connected
+        timeout = callysto.host._REQUEST_TIMEOUT
+        callysto.host._REQUEST_TIMEOUT = 0.2
+        try:
+            silent_client = connect()
+            client = connect({"connection_file": connection_fn})
+
+            io_loop.add_timeout(time.time() + 0.5, io_loop.stop)
+            io_loop.start()
+        finally:
+            callysto.host._REQUEST_TIMEOUT = timeout
+            io_loop.remove_handler(server.fileno())
+            server.close()
+
+        self.assertEqual(len(host.kernels), 1)
+        self.assertEqual(json.loads(client.recv(1024)), {"pid": None})
+        self.assertEqual(silent_client.recv(1024), '')
+
+        host.remove_kernel(host.kernels[0])
+        host.close()
+
+        client.close()
+        silent_client.close()
+
+    def test_shared_resources (self):
+        class FailingDummyKernel (DummyKernel):
+            failing = False
+
+            def do_startup_ (self, **kwargs):
+                if (FailingDummyKernel.failing):
+                    raise ValueError("failed")
+
+        FailingDummyKernel.metrics_file = \
+            os.path.join(self.tmp_path, "metrics.prom")
+        FailingDummyKernel.trace_file = \
+            os.path.join(self.tmp_path, "traces.jsonl")
+
+        host = callysto.host.KernelHost(FailingDummyKernel)
+
+        connection_fns = []
+        for i in range(2):
+            connection_fn, _ = jupyter_client.connect.write_connection_file(
+                os.path.join(self.tmp_path, "kernel-%d.json" % i))
+            connection_fns.append(connection_fn)
+
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        FailingDummyKernel.metrics_port = server.getsockname()[1]
+        server.close()
+
+        # a kernel failing to start should release its sockets
+        FailingDummyKernel.failing = True
+        with self.assertRaises(ValueError):
+            host.add_kernel(connection_fns[0])
+        self.assertEqual(host.kernels, [])
+
+        # (which are closed asynchronously, hence the retries)
+        FailingDummyKernel.failing = False
+        for i in range(50):
+            try:
+                kernels = [host.add_kernel(connection_fns[0])]
+                break
+            except zmq.ZMQError:
+                time.sleep(0.02)
+
+        kernels.append(host.add_kernel(connection_fns[1]))
+
+        # hosted kernels should share their metrics and tracer,
+        self.assertIs(kernels[0].metrics, kernels[1].metrics)
+        self.assertIs(kernels[0].tracer, kernels[1].tracer)
+
+        for kernel in kernels:
+            _execute(kernel, "foo")
+        self.assertEqual(kernels[0].metrics[
+            "callysto_cells_total"].get(status = "ok"), 2)
+
+        # but have a snapshot file of their own
+        self.assertEqual(
+            [kernel._get_snapshot_file() for kernel in kernels],
+            [os.path.abspath(fn) + ".snapshot" for fn in connection_fns])
+
+        FailingDummyKernel.snapshot_file = \
+            os.path.join(self.tmp_path, "snapshot")
+        self.assertEqual(
+            [kernel._get_snapshot_file() for kernel in kernels],
+            [os.path.join(self.tmp_path, "snapshot.kernel-%d.json" % i)
+                for i in range(2)])
+
+        for kernel in kernels:
+            host.remove_kernel(kernel)
+        host.close()
+
+        with open(FailingDummyKernel.metrics_file) as fh:
+            self.assertIn("callysto_cells_total{status=\"ok\"} 2", fh.read())
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,84 @@
+
+import hashlib
+import unittest
+
+import callysto.memory
+from commons import *
+from commons import _execute
+
+class LeakyKernel (DummyKernel):
+    track_memory = True
+    memory_leak_threshold = 1024 ** 2
+
+    def do_startup_ (self, **kwargs):
+        self.values = []
+
+    def do_execute_ (self, code):
+        if (code.strip() == "leak"):
+            self.values.append('x' * (4 * 1024 ** 2))
+        yield code
+
+class MemoryAccountingTests (unittest.TestCase):
+    def test_memory_tracker (self):
+        tracker = callysto.memory.MemoryTracker(
+            history_size = 4, max_entries = 2,
+            leak_threshold = 100, leak_runs = 3)
+
+        # cells are identified by their content
+        for delta in (200, 300, 400):
+            history = tracker.record_cell(u"a\nb", delta)
+        self.assertEqual(history.label, "a")
+        self.assertEqual((history.n_runs, history.total), (3, 900))
+        self.assertTrue(tracker.is_leaking(history))
+
+        # a cell releasing memory is no longer leaking
+        tracker.record_cell(u"a\nb", 0)
+        self.assertEqual(tracker.leaking_cells(), [])
+
+        # only the latest measurements of the latest cells are kept
+        for delta in (1, 2):
+            history = tracker.record_cell(u"a\nb", delta)
+        self.assertEqual(list(history.deltas), [400, 0, 1, 2])
+
+        tracker.record_cell(u"c", 10)
+        tracker.record_cell(u"\r\n  \n  %s  \r\ne" % ("d" * 50), 20)
+        tracker.record_renderer("renderer", 30)
+
+        self.assertEqual(tracker.report(), [
+            ("renderer", "renderer", 1, 30, 30, False),
+            ("cell", "d" * 37 + "...", 1, 20, 20, False),
+            ("cell", "c", 1, 10, 10, False)])
+
+        # cells are hashed by chunks, and byte strings as is
+        self.assertEqual(callysto.memory._hash_code(u"caf\xe9" * 10 ** 6),
+            hashlib.sha1(u"caf\xe9".encode("utf-8") * 10 ** 6).digest())
+        self.assertEqual(callysto.memory._hash_code("caf\xc3\xa9"),
+            hashlib.sha1("caf\xc3\xa9").digest())
+
+    def test_leaking_cells (self):
+        kernel = LeakyKernel()
+
+        for i in range(3):
+            status_message, _ = _execute(kernel, "leak")
+            self.assertEqual(status_message["status"], "ok")
+            _execute(kernel, "no leak")
+
+        self.assertEqual(
+            [history.label for history in kernel.memory.leaking_cells()],
+            ["leak"])
+        self.assertEqual(
+            kernel.metrics["callysto_leaking_cells_total"].get(), 1)
+
+        # the report is displayed after the cell output
+        status_message, results = _execute(kernel, "%memory-report\nreport")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(results[0][2]["text"], "report")
+
+        rows = results[1][2]["data"]["text/html"].splitlines()
+        leak_row = [row for row in rows if ("<code>leak</code>" in row)][0]
+        self.assertTrue(leak_row.endswith("<code>yes</code></td></tr>"))
+
+        kernel.do_shutdown()
+
+if (__name__ == "__main__"):
+    unittest.main()
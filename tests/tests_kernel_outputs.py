@@ -0,0 +1,772 @@
+
+import base64
+import cPickle
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+import callysto
+import callysto.iopub
+import callysto.shm
+from commons import *
+from commons import _execute
+
+# handler keeping the log records it receives
+class RecordingHandler (logging.Handler):
+    def __init__ (self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit (self, record):
+        self.records.append(record)
+
+class KernelOutputsTests (unittest.TestCase):
+
+    def test_display_updates (self):
+        dummy_kernel = DummyKernel()
+
+        # dummy executor, which report progress on a same display
+        def do_execute_ (self, code):
+            for i in range(5):
+                yield ("text/plain", "%d%%" % (i * 25),
+                    {"display_id": "progress"})
+
+        dummy_kernel.update_executor(do_execute_)
+
+        # without rate limiting, each frame should update the display
+        dummy_kernel.display_update_interval = 0
+        status_message, results = _execute(dummy_kernel, "test")
+
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(
+            [target for (_, target, _) in results],
+            ["display_data"] + ["update_display_data"] * 4)
+
+        for (_, target, data) in results:
+            self.assertEqual(data["transient"], {"display_id": "progress"})
+
+        self.assertEqual(results[-1][2]["data"], {"text/plain": "100%"})
+
+        # with rate limiting, only the first and last states should be sent
+        dummy_kernel.display_update_interval = 3600
+        status_message, results = _execute(dummy_kernel, "test")
+
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(
+            [target for (_, target, _) in results],
+            ["display_data", "update_display_data"])
+
+        self.assertEqual(results[0][2]["data"], {"text/plain": "0%"})
+        self.assertEqual(results[1][2]["data"], {"text/plain": "100%"})
+
+    def test_frames (self):
+        dummy_kernel = DummyKernel()
+
+        # Frame objects, tuples and strings should be equivalent
+        def do_execute_ (self, code):
+            yield callysto.Frame(callysto.MIME_TYPE.HTML, "<b>a</b>")
+            yield ("text/html", "<b>b</b>")
+            yield callysto.Frame("text/plain", "c")
+            yield "d"
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(
+            [(target, data.get("data", data.get("text")))
+                for (_, target, data) in results],
+            [("display_data", {"text/html": "<b>a</b>"}),
+             ("display_data", {"text/html": "<b>b</b>"}),
+             ("stream", "c"),
+             ("stream", "d")])
+
+        # with invalid MIME types being rejected when creating frames
+        with self.assertRaises(ValueError):
+            callysto.Frame(None, "e")
+
+    def test_bundles (self):
+        dummy_kernel = DummyKernel()
+
+        # dummy executor, which returns several
+        # representations of a same content
+        def do_execute_ (self, code):
+            yield (callysto.MIME_TYPE.BUNDLE, {
+                callysto.MIME_TYPE.TEXT: code,
+                callysto.MIME_TYPE.CSV: [(code,)],
+                "dummy/vnd.a": code}, {
+                "dummy/vnd.a": {"width": 10}})
+
+        dummy_kernel.update_executor(do_execute_)
+
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+
+        # all representations should be sent as a single message
+        self.assertEqual(len(results), 1)
+        _, target, data = results[0]
+
+        self.assertEqual(target, "display_data")
+        self.assertEqual(
+            sorted(data["data"]), ["dummy/vnd.a", "text/html", "text/plain"])
+        self.assertEqual(data["data"]["text/plain"], "test")
+        self.assertEqual(data["metadata"], {"dummy/vnd.a": {"width": 10}})
+
+        # representations rendered to a same MIME type should be reported
+        frames = [
+            ("text/html", "<b>a</b>", None),
+            ("text/plain", "a", None),
+            (callysto.MIME_TYPE.BUNDLE.value, {
+                "text/html": "<i>a</i>",
+                "dummy/vnd.a": "a"}, {
+                "text/html": {"width": 10},
+                "dummy/vnd.a": {"width": 20}})]
+
+        logger = logging.getLogger("callysto.renderers.core")
+        handler = RecordingHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        try:
+            data, metadata = callysto.renderers.core._bundle_frames(frames)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(logging.NOTSET)
+
+        self.assertEqual(data, {
+            "text/html": "<b>a</b>", "text/plain": "a", "dummy/vnd.a": "a"})
+        self.assertEqual(metadata, {"dummy/vnd.a": {"width": 20}})
+
+        self.assertEqual(len(handler.records), 1)
+        self.assertIn("MIME type text/html", handler.records[0].getMessage())
+
+    def test_client_side_tables (self):
+        dummy_kernel = DummyKernel()
+
+        table = (("name", "value"), ("a", 1), ("b", "</script>"), ("c",))
+
+        def do_execute_ (self, code):
+            yield ("text/csv;header", table, {"mode": code})
+
+        dummy_kernel.update_executor(do_execute_)
+        dummy_kernel._parent_header = {"header": {"session": "tables"}}
+
+        # tables should be rendered as HTML by default,
+        status_message, results = _execute(dummy_kernel, "html")
+        self.assertEqual(len(results), 1)
+        self.assertIn("<table", results[0][2]["data"]["text/html"])
+
+        # or sent as columns to a viewer in the notebook
+        status_message, results = _execute(dummy_kernel, "client")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 2)
+
+        container = results[0][2]["data"]["text/html"]
+        self.assertTrue(container.startswith(
+            "<div class=\"callysto-table\" id=\"callysto-table-"))
+        container_id = container.split("id=\"")[1].split("\"")[0]
+
+        script = results[1][2]["data"]["text/html"]
+        self.assertIn("require.config({paths: {\"callysto_table\": ", script)
+        self.assertNotIn("</script>", script[:-len("</script>")])
+
+        # with the script drawing the table in its own container
+        arguments = script.split("callysto_table.render(")[1].split(");")[0]
+        self.assertTrue(arguments.startswith("\"%s\", " % container_id))
+
+        data = arguments.split(", ", 1)[1]
+        self.assertEqual(json.loads(data.replace("<\\/", "</")), {
+            "header": ["name", "value"],
+            "columns": [["a", "b", "c"], ["1", "</script>", ""]]})
+
+        # with the viewer configuration only sent once per session,
+        # and each identical table having a container of its own
+        status_message, results = _execute(dummy_kernel, "client")
+        script = results[1][2]["data"]["text/html"]
+        self.assertNotIn("require.config", script)
+        self.assertIn("require([\"callysto_table\"], ", script)
+        self.assertNotIn(container_id, results[0][2]["data"]["text/html"])
+        self.assertNotIn(container_id, script)
+
+        dummy_kernel._parent_header = {"header": {"session": "reloaded"}}
+        status_message, results = _execute(dummy_kernel, "client")
+        self.assertIn("require.config", results[1][2]["data"]["text/html"])
+        self.assertEqual(results[1][2]["metadata"], {})
+
+        # the configuration should be sent again if it was dropped
+        dummy_kernel._parent_header = {"header": {"session": "spilled"}}
+        dummy_kernel.max_cell_output_size = 100
+        dummy_kernel.spill_directory = tempfile.mkdtemp()
+
+        status_message, results = _execute(dummy_kernel, "client")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertIn("output limit", results[-1][2]["text"])
+
+        dummy_kernel.max_cell_output_size = None
+        status_message, results = _execute(dummy_kernel, "client")
+        self.assertIn("require.config", results[1][2]["data"]["text/html"])
+
+        shutil.rmtree(dummy_kernel.spill_directory)
+
+        status_message, results = _execute(dummy_kernel, "unknown")
+        self.assertEqual(status_message["status"], "error")
+
+    def test_binary_frames (self):
+        dummy_kernel = DummyKernel()
+        dummy_kernel.binary_chunk_size = 4
+
+        image = "\x89PNG" + "".join(map(chr, range(256)))
+
+        def do_execute_ (self, code):
+            # images with the 'binary' metadata field,
+            yield ("image/png", image, {"binary": True, "width": 10})
+            # and binary frames streamed by chunks
+            yield ("application/vnd.callysto.binary",
+                iter(["abc", bytearray("def")]),
+                {"mime_type": "application/octet-stream"})
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+
+        # should be sent as raw bytes through comm channels
+        msg_types = [result[1] for result in results]
+        self.assertEqual(msg_types,
+            ["display_data", "comm_open"] + ["comm_msg"] * 65 +
+            ["comm_close", "display_data", "comm_open"] +
+            ["comm_msg"] * 2 + ["comm_close"])
+
+        comm_open = results[1][2]
+        self.assertEqual(comm_open["target_name"], "callysto.binary")
+        self.assertEqual(comm_open["data"]["mime_type"], "image/png")
+        self.assertEqual(comm_open["data"]["metadata"], {"width": 10})
+        self.assertIn(comm_open["data"]["element_id"],
+            results[0][2]["data"]["text/html"])
+
+        chunks = [result[4][0] for result in results[2:67]]
+        self.assertTrue(all(isinstance(chunk, memoryview)
+            for chunk in chunks))
+        self.assertEqual(''.join(chunk.tobytes() for chunk in chunks), image)
+        self.assertEqual(results[67][2]["data"], {"length": len(image)})
+
+        self.assertEqual(''.join(result[4][0].tobytes()
+            for result in results[70:72]), "abcdef")
+
+        # binary frames without metadata are of a default MIME type, and
+        # the frontend shim is only sent once per notebook session
+        def do_execute_ (self, code):
+            yield ("application/vnd.callysto.binary", "abc")
+
+        dummy_kernel.update_executor(do_execute_)
+        dummy_kernel._parent_header = {"header": {"session": "session-a"}}
+
+        for i in range(2):
+            status_message, results = _execute(dummy_kernel, "test")
+            self.assertEqual(status_message["status"], "ok")
+
+            self.assertEqual(results[1][2]["data"]["mime_type"],
+                "application/octet-stream")
+            self.assertEqual("<script" in results[0][2]["data"]["text/html"],
+                (i == 0))
+
+    def test_shared_content (self):
+        dummy_kernel = DummyKernel()
+        image = "\x89PNG" + "".join(map(chr, range(256)))
+
+        # handles are pickled, as they would be by a worker process
+        handles = [cPickle.loads(cPickle.dumps(handle)) for handle in (
+            callysto.shm.share(image),
+            callysto.shm.share(memoryview(image)),
+            callysto.shm.share(u"caf\xe9\n"),
+            callysto.shm.share(''))]
+
+        def do_execute_ (self, code):
+            yield ("image/png", handles[0], {"binary": True})
+            yield ("image/png", handles[1])
+            yield ("text/plain", handles[2])
+            yield ("text/plain", handles[3])
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+
+        # binary content is sent from the shared memory, which
+        # remains readable once released by the kernel
+        self.assertEqual(''.join(result[4][0].tobytes()
+            for result in results if (result[1] == "comm_msg")), image)
+
+        self.assertEqual([result[2]["data"] for result in results[-3:-2]],
+            [{"image/png": base64.b64encode(image)}])
+        self.assertEqual([result[2]["text"] for result in results[-2:]],
+            [u"caf\xe9\n", u''])
+
+        for handle in handles:
+            self.assertFalse(os.path.exists(handle.filename))
+
+        # content not sent should be released once the cell executed,
+        # either because the cell is silent or because it failed
+        def do_execute_ (self, code):
+            handles[:] = [callysto.shm.share(code) for _ in range(2)]
+            return ((mime_type, handle)
+                for (mime_type, handle) in zip(code.split(), handles))
+
+        def failing_renderer (content, mime_type):
+            raise Exception("dummy_error")
+
+        dummy_kernel.update_executor(do_execute_)
+        dummy_kernel.register_renderer(failing_renderer, "dummy/vnd.error")
+
+        status_message = dummy_kernel.do_execute(
+            "text/plain text/plain", silent = True, store_history = False,
+            user_expressions = {}, allow_stdin = False)
+        self.assertEqual(status_message["status"], "ok")
+
+        for handle in handles:
+            self.assertFalse(os.path.exists(handle.filename))
+
+        status_message, results = _execute(dummy_kernel,
+            "dummy/vnd.error text/plain")
+        self.assertEqual(status_message["status"], "error")
+
+        for handle in handles:
+            self.assertFalse(os.path.exists(handle.filename))
+
+    def test_interrupted_sender (self):
+        # sender unable to send anything until released
+        released = threading.Event()
+        sender = callysto.iopub.ResponseSender(
+            lambda *args: released.wait(), 1)
+        sender.start()
+
+        def interrupt (signal_number, frame):
+            raise KeyboardInterrupt
+
+        previous_handler = signal.signal(signal.SIGALRM, interrupt)
+        try:
+            # waiting for the queue to have room or to be
+            # empty should not prevent the kernel interruption
+            for wait in (lambda: sender.send(1), sender.flush):
+                signal.setitimer(signal.ITIMER_REAL, 0.2)
+                start_time = time.time()
+                with self.assertRaises(KeyboardInterrupt):
+                    for i in range(3):
+                        wait()
+                self.assertLess(time.time() - start_time, 5)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+        released.set()
+        sender.flush()
+        sender.stop()
+
+    def test_text_streaming (self):
+        dummy_kernel = DummyKernel()
+        dummy_kernel.stream_text = True
+        dummy_kernel.text_flush_lines = 3
+        dummy_kernel.text_flush_interval = 3600
+
+        def do_execute_ (self, code):
+            for i in range(7):
+                yield "a\n"
+            yield ("text/html", "<b>b</b>")
+            yield "c"
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+
+        # text is sent right away after a quiet period, then by batches
+        # of lines, and always before the frames following it
+        self.assertEqual(
+            [data.get("text", data.get("data")) for (_, _, data) in results],
+            ["a\n", "a\na\na\n", "a\na\na\n", {"text/html": "<b>b</b>"}, "c"])
+
+        # text buffered for too long is sent while the cell is running
+        dummy_kernel.text_flush_interval = 0.05
+
+        def do_execute_ (self, code):
+            time.sleep(0.1)
+            yield "a"
+            yield "b"
+            time.sleep(0.5)
+            self._last_results.append("marker")
+            yield "c"
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(
+            [result if (result == "marker") else result[2]["text"]
+                for result in results],
+            ["a", "b", "marker", "c"])
+
+        # text shared in memory is not streamed, but sent as other frames
+        def do_execute_ (self, code):
+            yield "a"
+            yield ("text/plain", callysto.shm.share("b"))
+            yield "c"
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual([result[2]["text"] for result in results],
+            ["a", "b", "c"])
+
+        # the per-frame budget applies to each streamed text
+        # rather than to the batches of text being sent
+        dummy_kernel.text_flush_lines = 100
+        dummy_kernel.text_flush_interval = 3600
+        dummy_kernel.max_frame_size = 50
+        dummy_kernel.spill_directory = tempfile.mkdtemp()
+
+        def do_execute_ (self, code):
+            time.sleep(0.01)
+            for i in range(20):
+                yield u"line %02d\n" % i
+            yield u"x" * 60
+
+        dummy_kernel.update_executor(do_execute_)
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+
+        text = ''.join(result[2]["text"] for result in results)
+        self.assertTrue(text.startswith(
+            ''.join(u"line %02d\n" % i for i in range(20))))
+        self.assertTrue("[output of 60 bytes" in text)
+        self.assertEqual(dummy_kernel.spilled_frames, 1)
+
+        shutil.rmtree(dummy_kernel.spill_directory)
+        dummy_kernel.do_shutdown()
+
+    def test_sender_thread (self):
+        dummy_kernel = DummyKernel()
+        dummy_kernel.iopub_queue_size = 2
+
+        # dummy executor, which split a string into characters
+        def do_execute_ (self, code):
+            for character in code.strip():
+                yield character
+
+        dummy_kernel.update_executor(do_execute_)
+
+        # all frames should have been sent, in order, once the cell ran
+        code = "abcdefghijklmnopqrstuvwxyz" * 10
+        assertSuccessfulRun(self, dummy_kernel, code, list(code))
+
+        dummy_kernel.do_shutdown()
+
+        # errors while sending should be reported as errors of the cell
+        class FailingDummyKernel (DummyKernel):
+            def send_response (self, stream, msg_type, content):
+                if (content["name"] == "stdout"):
+                    raise Exception("dummy_error")
+                DummyKernel.send_response(self, stream, msg_type, content)
+
+        dummy_kernel = FailingDummyKernel()
+        dummy_kernel.iopub_queue_size = 2
+
+        assertUnsuccessfulRun(self, dummy_kernel, "test",
+            exception_validator = lambda x: x["evalue"].endswith("dummy_error"))
+
+        dummy_kernel.do_shutdown()
+
+    def test_output_budgets (self):
+        dummy_kernel = DummyKernel()
+        dummy_kernel.spill_directory = tempfile.mkdtemp()
+
+        # dummy executor, which returns each line as a frame
+        def do_execute_ (self, code):
+            for line in code.splitlines():
+                yield line
+
+        dummy_kernel.update_executor(do_execute_)
+
+        # frames above the per-frame budget should be spilled to disk,
+        # and replaced by a preview referencing the spilled content
+        dummy_kernel.max_frame_size = 10
+        dummy_kernel.spill_preview_size = 4
+
+        status_message, results = _execute(dummy_kernel, "short\n" + "x" * 20)
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 2)
+
+        self.assertEqual(results[0][2]["text"], "short")
+        preview = results[1][2]["text"]
+        self.assertTrue(preview.startswith("xxxx\n[output of 20 bytes"))
+
+        spilled_fn = preview.split("written to ")[1].rstrip("]\n")
+        self.assertTrue(spilled_fn.endswith(".txt"))
+        self.assertEqual(open(spilled_fn).read(), "x" * 20)
+
+        self.assertEqual(dummy_kernel.spilled_frames, 1)
+        self.assertEqual(dummy_kernel.spilled_bytes, 20)
+
+        # frames above the per-cell budget should be spilled
+        # to disk as well, with a single notice being sent
+        dummy_kernel.max_frame_size = None
+        dummy_kernel.max_cell_output_size = 10
+
+        status_message, results = _execute(dummy_kernel, "abcd\n" * 5)
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 3)
+
+        self.assertEqual(results[0][2]["text"], "abcd")
+        self.assertEqual(results[1][2]["text"], "abcd")
+        self.assertTrue("output limit of 10 bytes" in results[2][2]["text"])
+
+        self.assertEqual(dummy_kernel.spilled_frames, 4)
+        self.assertEqual(dummy_kernel.spilled_bytes, 32)
+
+        # the notice should be sent even if a frame was spilled before
+        # for its size, with previews counting toward the cell budget
+        dummy_kernel.max_frame_size = 10
+        dummy_kernel.max_cell_output_size = 30
+
+        status_message, results = _execute(dummy_kernel,
+            "x" * 20 + "\n" + "abcd\n" * 20)
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 2)
+
+        self.assertTrue(results[0][2]["text"].startswith("xxxx\n"))
+        self.assertTrue("output limit of 30 bytes" in results[1][2]["text"])
+
+        self.assertEqual(dummy_kernel.spilled_frames, 4 + 21)
+        self.assertEqual(dummy_kernel.spilled_bytes, 32 + 100)
+
+        # sizes are measured once encoded
+        dummy_kernel.max_frame_size = None
+        dummy_kernel.max_cell_output_size = 9
+
+        status_message, results = _execute(dummy_kernel,
+            u"caf\xe9\n" * 3)
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 2)
+        self.assertTrue("output limit" in results[1][2]["text"])
+
+        # binary frames without metadata can be spilled as well
+        def do_execute_ (self, code):
+            yield ("application/vnd.callysto.binary", b"x" * 100)
+
+        dummy_kernel.update_executor(do_execute_)
+        dummy_kernel.max_frame_size = 10
+        dummy_kernel.max_cell_output_size = None
+
+        status_message, results = _execute(dummy_kernel, "test")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(len(results), 1)
+
+        preview = results[0][2]["text"]
+        spilled_fn = preview.split("written to ")[1].rstrip("]\n")
+        self.assertTrue(spilled_fn.endswith(".bin"))
+        self.assertEqual(open(spilled_fn, "rb").read(), b"x" * 100)
+
+        shutil.rmtree(dummy_kernel.spill_directory)
+
+    def test_metrics (self):
+        dummy_kernel = DummyKernel()
+
+        assertSuccessfulRun(self, dummy_kernel, "test", ["test"])
+        assertUnsuccessfulRun(self, dummy_kernel, "%unknown")
+
+        metrics = dummy_kernel.metrics
+
+        # cells should be counted by status, and timed
+        self.assertEqual(metrics["callysto_cells_total"].get(status = "ok"), 1)
+        self.assertEqual(
+            metrics["callysto_cells_total"].get(status = "error"), 1)
+        self.assertEqual(
+            metrics["callysto_cell_duration_seconds"].get()[0], 2)
+
+        # emitted content should be counted by MIME type
+        self.assertEqual(metrics["callysto_emitted_bytes_total"].get(
+            mime_type = "text/plain"), 4)
+        self.assertEqual(metrics["callysto_emitted_messages_total"].get(
+            msg_type = "stream"), 1)
+
+        # renderers should be timed
+        self.assertEqual(metrics["callysto_renderer_duration_seconds"].get(
+            renderer = "base_text_renderer")[0], 1)
+
+        # and all metrics should be available in the Prometheus format
+        exposition = metrics.render()
+        self.assertTrue(
+            "# TYPE callysto_cells_total counter" in exposition)
+        self.assertTrue(
+            "callysto_cells_total{status=\"ok\"} 1" in exposition)
+        self.assertTrue(
+            "callysto_cell_duration_seconds_count 2" in exposition)
+
+    def test_renderer_budgets (self):
+        def slow_renderer (content, mime_type, **metadata):
+            if (content == "slow"):
+                time.sleep(60)
+            elif (content == "greedy"):
+                bytearray(1024 ** 3)
+            yield ("text/html", "<b>%s</b>" % content)
+            yield None
+
+        callysto.renderers.register_renderer(slow_renderer,
+            "dummy/vnd.slow", timeout = 0.5, memory_limit = 128 * 1024 ** 2)
+
+        dummy_kernel = DummyKernel()
+
+        def do_execute_ (self, code):
+            for content in code.split():
+                yield ("dummy/vnd.slow", content)
+
+        dummy_kernel.update_executor(do_execute_)
+
+        # renderers within their budget should work as usual,
+        start_time = time.time()
+        status_message, results = _execute(dummy_kernel, "fast slow greedy")
+        self.assertLess(time.time() - start_time, 10)
+        self.assertEqual(status_message["status"], "ok")
+
+        self.assertEqual(results[0][2]["data"], {"text/html": "<b>fast</b>"})
+
+        # while the others should be stopped, with their content shown as is
+        texts = [data["text"] for (_, _, data) in results[1:]]
+        self.assertEqual(len(texts), 4)
+        self.assertIn("time limit", texts[0])
+        self.assertEqual(texts[1], "slow")
+        self.assertIn("memory limit", texts[2])
+        self.assertEqual(texts[3], "greedy")
+
+        metric = dummy_kernel.metrics[
+            "callysto_renderer_budget_exceeded_total"]
+        for reason in ("timeout", "memory"):
+            self.assertEqual(metric.get(
+                renderer = "slow_renderer", reason = reason), 1)
+
+        # renderers given only a memory limit have a default time limit
+        callysto.renderers.deregister_renderer(slow_renderer)
+        callysto.renderers.register_renderer(slow_renderer,
+            "dummy/vnd.slow", memory_limit = 128 * 1024 ** 2)
+
+        default_timeout = callysto.renderers.watchdog.DEFAULT_TIMEOUT
+        callysto.renderers.watchdog.DEFAULT_TIMEOUT = 0.5
+        try:
+            status_message, results = _execute(dummy_kernel, "slow")
+        finally:
+            callysto.renderers.watchdog.DEFAULT_TIMEOUT = default_timeout
+
+        self.assertEqual(status_message["status"], "ok")
+        self.assertIn("time limit of 0.5 seconds", results[0][2]["text"])
+
+        callysto.renderers.deregister_renderer(slow_renderer)
+
+    def test_renderer_budgets_with_threads (self):
+        # locks of the logging module held by another thread at the time
+        # of the fork should not block the renderer in the forked process
+        lock_held, release_lock = threading.Event(), threading.Event()
+
+        def hold_lock ():
+            with logging._lock:
+                lock_held.set()
+                release_lock.wait()
+
+        thread = threading.Thread(target = hold_lock)
+        thread.start()
+        lock_held.wait()
+
+        try:
+            result = callysto.renderers.watchdog.run_with_limits(
+                lambda name: logging.getLogger(name).name, ("dummy",), 5)
+        finally:
+            release_lock.set()
+            thread.join()
+
+        self.assertEqual(result, "dummy")
+
+    def test_tracing (self):
+        trace_path = tempfile.mkdtemp()
+
+        class TracedDummyKernel (DummyKernel):
+            trace_file = os.path.join(trace_path, "spans.jsonl")
+
+        dummy_kernel = TracedDummyKernel()
+        dummy_kernel.declare_pre_flight_command(
+            "pre-flight", lambda x: x.upper())
+
+        assertSuccessfulRun(self, dummy_kernel, "%pre-flight\ntest", ["TEST"])
+        dummy_kernel.tracer.flush()
+
+        spans = map(json.loads, open(TracedDummyKernel.trace_file))
+        spans = dict((span["name"], span) for span in spans)
+
+        # all steps of the execution request should have been traced
+        self.assertEqual(sorted(spans), [
+            "do_execute_", "execute_request", "parse_magic_commands",
+            "pre_flight_command", "render", "send"])
+
+        # as children of the execution request
+        root_span = spans.pop("execute_request")
+        self.assertEqual(root_span["parent_id"], None)
+        self.assertEqual(root_span["attributes"]["status"], "ok")
+
+        for span in spans.values():
+            self.assertEqual(span["trace_id"], root_span["trace_id"])
+            self.assertEqual(span["parent_id"], root_span["span_id"])
+
+        self.assertEqual(
+            spans["pre_flight_command"]["attributes"]["command"], "pre-flight")
+        self.assertEqual(
+            spans["render"]["attributes"]["renderer"], "base_text_renderer")
+
+        dummy_kernel.do_shutdown()
+        shutil.rmtree(trace_path)
+
+    def test_generator_spans (self):
+        trace_path = tempfile.mkdtemp()
+
+        class TracedDummyKernel (DummyKernel):
+            trace_file = os.path.join(trace_path, "spans.jsonl")
+
+        dummy_kernel = TracedDummyKernel()
+
+        # dummy executor and post-flight command, which
+        # take some time to produce each of their frames
+        def do_execute_ (self, code):
+            for line in code.splitlines():
+                time.sleep(0.05)
+                yield line
+
+        def slow (code, frames):
+            """ Usage: slow
+            """
+            for frame in frames:
+                time.sleep(0.05)
+                yield frame
+
+        dummy_kernel.update_executor(do_execute_)
+        dummy_kernel.declare_post_flight_command("slow", slow)
+
+        assertSuccessfulRun(self, dummy_kernel, "%slow\na\nb", ["a", "b"])
+        dummy_kernel.tracer.flush()
+
+        spans = map(json.loads, open(TracedDummyKernel.trace_file))
+        spans = dict((span["name"], span) for span in spans)
+
+        # spans over generators should last until they are exhausted
+        self.assertTrue(spans["do_execute_"]["duration"] >= 0.1)
+        self.assertTrue(spans["post_flight_command"]["duration"] >= 0.2)
+
+        # with the spans started while their frames are
+        # processed being children of the execution request
+        root_span = spans["execute_request"]
+        self.assertEqual(spans["do_execute_"]["parent_id"],
+            spans["post_flight_command"]["span_id"])
+        self.assertEqual(spans["post_flight_command"]["parent_id"],
+            root_span["span_id"])
+        self.assertEqual(spans["render"]["parent_id"], root_span["span_id"])
+
+        dummy_kernel.do_shutdown()
+        shutil.rmtree(trace_path)
+
+if (__name__ == "__main__"):
+    unittest.main()
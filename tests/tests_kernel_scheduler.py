@@ -0,0 +1,143 @@
+
+import logging
+import unittest
+
+import jupyter_client.session
+import zmq
+import zmq.eventloop.zmqstream
+
+import callysto.scheduler
+from commons import *
+
+def execute_request (code, silent = False):
+    return ("execute_request", {"code": code, "silent": silent})
+
+class SchedulerTestCase (unittest.TestCase):
+    def test_superseded_requests (self):
+        find_superseded = callysto.scheduler.find_superseded
+
+        # consecutive identical requests are coalesced into the last one
+        self.assertEqual(find_superseded([
+            execute_request("a"),
+            execute_request("a"),
+            execute_request("a"),
+            execute_request("b")]), {0: "coalesced", 1: "coalesced"})
+
+        # ... but not if other requests are in-between
+        self.assertEqual(find_superseded([
+            execute_request("a"),
+            execute_request("b"),
+            execute_request("a"),
+            ("complete_request", {"code": "a", "cursor_pos": 1}),
+            execute_request("a")]), {})
+
+        # silent requests are superseded by later identical ones
+        self.assertEqual(find_superseded([
+            execute_request("a", silent = True),
+            execute_request("b"),
+            execute_request("a", silent = True),
+            execute_request("a")]), {0: "superseded"})
+
+    def test_request_queue (self):
+        session = jupyter_client.session.Session(key = b"secret")
+
+        # frames as received by the kernel from its shell socket
+        def frames (msg_type, content):
+            msg = session.msg(msg_type, content)
+            return [zmq.Frame(frame) for frame in
+                [b"client"] + session.serialize(msg, ident = None)]
+
+        queue = callysto.scheduler.RequestQueue(session)
+        for (msg_type, content) in (
+            execute_request("a"),
+            execute_request("a"),
+            execute_request("a", silent = True),
+            ("kernel_info_request", {}),
+            execute_request("a", silent = True)):
+            queue.push(None, frames(msg_type, content))
+
+        queue.push(None, [zmq.Frame(b"invalid message")])
+        self.assertEqual(len(queue), 6)
+
+        # the requests are returned in order, with those
+        # superseded by later requests flagged as such
+        requests = [queue.pop() for _ in range(4)]
+        self.assertEqual(
+            [(request.msg_type, request.superseded) for request in requests],
+            [("execute_request", "coalesced"),
+             ("execute_request", None),
+             ("execute_request", "superseded"),
+             ("kernel_info_request", None)])
+
+        for request in requests:
+            self.assertTrue(request.wait_time() >= 0)
+
+        queue.abort_all()
+        request = queue.pop()
+        self.assertEqual(request.superseded, "aborted")
+        self.assertEqual(queue.pop().msg_type, None)
+        self.assertEqual(len(queue), 0)
+
+        # requests are only superseded by others while queued
+        queue.push(None, frames(*execute_request("a", silent = True)))
+        request = queue.pop()
+        queue.push(None, frames(*execute_request("a", silent = True)))
+        self.assertEqual(request.superseded, None)
+        self.assertEqual(queue.pop().superseded, None)
+
+    def test_control_requests (self):
+        context = zmq.Context.instance()
+        session = jupyter_client.session.Session(key = b"secret")
+
+        sockets, streams, clients = [], [], []
+        for name in ("shell", "control"):
+            socket = context.socket(zmq.ROUTER)
+            socket.linger = 0
+            socket.bind("inproc://callysto-test-%s" % name)
+            sockets.append(socket)
+            streams.append(zmq.eventloop.zmqstream.ZMQStream(socket))
+
+            client = context.socket(zmq.DEALER)
+            client.linger = 0
+            client.connect("inproc://callysto-test-%s" % name)
+            clients.append(client)
+
+        iopub_socket = context.socket(zmq.PUB)
+        iopub_socket.linger = 0
+
+        kernel = DummyKernel(session = session,
+            shell_streams = streams, iopub_socket = iopub_socket,
+            log = logging.getLogger(__name__))
+        kernel.coalesce_requests = True
+
+        # handlers recording the order requests are processed in
+        handled = []
+        def handler (stream, idents, msg):
+            handled.append((msg["header"]["msg_type"], msg["content"]))
+
+        for msg_type in ("execute_request", "kernel_info_request"):
+            kernel.shell_handlers[msg_type] = handler
+
+        # execution requests queued before a control request
+        for code in ("a", "b", "c"):
+            session.send(clients[0], "execute_request",
+                {"code": code, "silent": False})
+        session.send(clients[1], "kernel_info_request", {})
+
+        frames = sockets[0].recv_multipart(copy = False)
+        kernel.dispatch_shell(streams[0], frames)
+
+        # the control request should not wait for the queued ones
+        self.assertEqual([msg_type for (msg_type, _) in handled], [
+            "kernel_info_request",
+            "execute_request", "execute_request", "execute_request"])
+        self.assertEqual([content["code"] for (_, content) in handled
+            if ("code" in content)], ["a", "b", "c"])
+
+        for stream in streams:
+            stream.close()
+        for socket in clients + [iopub_socket]:
+            socket.close()
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,105 @@
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import callysto
+from commons import *
+from commons import _execute
+
+def shout (code):
+    """ Usage: shout
+    """
+    return code.upper()
+
+class CounterRenderer (callysto.BaseRenderer):
+    def __init__ (self):
+        self.count = 0
+
+    def render (self, content, mime_type):
+        self.count += 1
+        yield ("text/plain", "%s #%d" % (content, self.count))
+        yield None
+
+class SnapshotKernel (DummyKernel):
+    snapshot_attributes = ("dataset", "missing")
+
+    def do_startup_ (self, **kwargs):
+        self.startups = getattr(self, "startups", 0) + 1
+        if (not hasattr(self, "dataset")):
+            self.dataset = None
+
+        self.renderer = CounterRenderer()
+        self.register_renderer(self.renderer.render, "dummy/vnd.counter")
+
+    def do_shutdown_ (self, will_restart = False):
+        self.deregister_renderer(self.renderer.render)
+
+    def do_snapshot_ (self, snapshot):
+        snapshot["extra"] = {"a": 1}
+
+    def do_restore_ (self, snapshot):
+        self.restored_keys = sorted(snapshot.keys())
+
+    def reverse (self, code):
+        return code[::-1]
+
+class KernelSnapshotsTests (unittest.TestCase):
+
+    def setUp (self):
+        self.tmp_path = tempfile.mkdtemp()
+        SnapshotKernel.snapshot_file = os.path.join(
+            self.tmp_path, "kernel.snapshot")
+
+    def tearDown (self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_restarting_kernel (self):
+        kernel = SnapshotKernel()
+        self.assertIsNone(kernel.snapshot)
+
+        kernel.dataset = range(10)
+        kernel.magic_commands.prefix = '!'
+        kernel.declare_pre_flight_command("shout", shout)
+        kernel.declare_pre_flight_command("reverse", kernel.reverse)
+        kernel.declare_pre_flight_command("lambda", lambda code: code)
+        kernel.renderer.count = 41
+
+        # nothing should be saved when shutting down,
+        kernel.do_shutdown(restart = False)
+        self.assertFalse(os.path.exists(SnapshotKernel.snapshot_file))
+        kernel.register_renderer(kernel.renderer.render, "dummy/vnd.counter")
+
+        # but the kernel state should be saved when restarting,
+        kernel.do_shutdown(restart = True)
+        self.assertTrue(os.path.exists(SnapshotKernel.snapshot_file))
+
+        # and restored by the next kernel instance
+        kernel = SnapshotKernel()
+        self.assertFalse(os.path.exists(SnapshotKernel.snapshot_file))
+
+        self.assertEqual(kernel.startups, 1)
+        self.assertEqual(kernel.dataset, range(10))
+        self.assertIn("extra", kernel.restored_keys)
+        self.assertEqual(kernel.snapshot["extra"], {"a": 1})
+
+        self.assertEqual(kernel.magic_commands.prefix, '!')
+        self.assertTrue(kernel.magic_commands.has_command("shout"))
+        self.assertTrue(kernel.magic_commands.has_command("reverse"))
+        self.assertFalse(kernel.magic_commands.has_command("lambda"))
+
+        status, results = _execute(kernel, "!shout\n!reverse\nabc")
+        self.assertEqual(results[0][2]["text"], "CBA")
+
+        def do_execute_ (self, code):
+            yield ("dummy/vnd.counter", code)
+
+        kernel.update_executor(do_execute_)
+        status, results = _execute(kernel, "x")
+        self.assertEqual(results[0][2]["text"], "x #42")
+
+        kernel.do_shutdown()
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,61 @@
+
+import os
+import unittest
+
+import callysto.large_input
+from commons import *
+from commons import _execute
+
+class LargeInputsTests (unittest.TestCase):
+    def test_large_inputs (self):
+        dummy_kernel = DummyKernel()
+        dummy_kernel.large_input_threshold = 100
+
+        inputs = []
+        def count_lines (code):
+            """ Usage: count-lines
+            """
+            inputs.append(code)
+
+        dummy_kernel.declare_pre_flight_command("count-lines", count_lines)
+
+        def do_execute_ (self, code):
+            inputs.append(code)
+            if (isinstance(code, callysto.large_input.LargeInput)):
+                yield "%d lines" % sum(1 for line in code)
+                yield code.buffer()[:3]
+                yield code.read()[-4:]
+            else:
+                yield code
+
+        dummy_kernel.update_executor(do_execute_)
+
+        # small cells are passed as strings
+        status_message, results = _execute(dummy_kernel, "%count-lines\nabc")
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual(inputs, ["abc", "abc"])
+
+        # large cells as views on a file, with only their
+        # first lines searched for magic commands
+        del inputs[:]
+        code = u"%count-lines\n" + u"caf\xe9\n" * 50 + u"%unknown\nend"
+        status_message, results = _execute(dummy_kernel, code)
+        self.assertEqual(status_message["status"], "ok")
+
+        self.assertEqual(len(inputs), 2)
+        self.assertIs(inputs[0], inputs[1])
+        self.assertEqual([data["text"] for (_, _, data) in results],
+            ["52 lines", "caf", "\nend"])
+
+        # with the file removed once the cell executed
+        self.assertFalse(os.path.exists(inputs[0].filename))
+
+        # byte strings are taken as UTF-8 encoded
+        del inputs[:]
+        status_message, results = _execute(dummy_kernel, code.encode("utf-8"))
+        self.assertEqual(status_message["status"], "ok")
+        self.assertEqual([data["text"] for (_, _, data) in results],
+            ["52 lines", "caf", "\nend"])
+
+if (__name__ == "__main__"):
+    unittest.main()
@@ -0,0 +1,105 @@
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+import callysto.logs
+
+# handler recording the messages it writes, and the thread writing them
+class RecordingHandler (logging.Handler):
+    def __init__ (self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit (self, record):
+        self.messages.append(
+            (self.format(record), threading.current_thread().name))
+
+class QueuedLoggingTests (unittest.TestCase):
+
+    def setUp (self):
+        self.logger = logging.getLogger("callysto.tests.logging")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown (self):
+        callysto.logs.stop_listener()
+        self.logger.removeHandler(self.handler)
+
+    def test_queued_logging (self):
+        callysto.logs.start_listener(self.logger)
+
+        # records should be written by the background thread, with
+        # their message built from the arguments at the time of the call
+        arguments = ["a"]
+        self.logger.info("message %s", arguments)
+        arguments.append("b")
+
+        self.assertEqual(
+            [type(handler).__name__ for handler in self.logger.handlers],
+            ["QueueHandler"])
+
+        callysto.logs.stop_listener()
+        self.assertEqual(len(self.handler.messages), 1)
+
+        message, thread_name = self.handler.messages[0]
+        self.assertEqual(message, "message ['a']")
+        self.assertNotEqual(thread_name, threading.current_thread().name)
+
+        # the handlers should be given back to the logger once stopped
+        self.assertEqual(self.logger.handlers, [self.handler])
+
+    def test_starting_listener_twice (self):
+        # starting the listener again should not nest handlers
+        for i in range(2):
+            callysto.logs.start_listener(self.logger)
+
+        self.assertEqual(len(self.logger.handlers), 1)
+        self.logger.info("message")
+
+        callysto.logs.stop_listener()
+        self.assertEqual(
+            [message for (message, _) in self.handler.messages], ["message"])
+        self.assertEqual(self.logger.handlers, [self.handler])
+
+    def test_restarting_listener (self):
+        fd, log_fn = tempfile.mkstemp()
+        os.close(fd)
+
+        file_handler = logging.FileHandler(log_fn)
+        self.logger.addHandler(file_handler)
+        callysto.logs.start_listener(self.logger)
+
+        # the thread writing records should be restarted after a fork
+        pid = os.fork()
+        if (pid == 0):
+            status = 1
+            try:
+                callysto.logs.restart_listener()
+                self.logger.info("from child")
+                callysto.logs.stop_listener()
+                status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+        self.logger.info("from parent")
+        callysto.logs.stop_listener()
+
+        self.logger.removeHandler(file_handler)
+        file_handler.close()
+
+        with open(log_fn) as fh:
+            self.assertEqual(fh.read().splitlines(),
+                ["from child", "from parent"])
+        os.unlink(log_fn)
+
+if (__name__ == "__main__"):
+    unittest.main()
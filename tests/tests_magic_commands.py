@@ -588,5 +588,51 @@ class MagicCommandsTests (unittest.TestCase):
         self.assertTrue(post_flight.command_2_was_run)
         self.assertFalse(post_flight.command_3_was_run)
 
+    def test_parsed_commands_cache (self):
+        dummy_kernel = DummyKernel()
+        magic_commands = dummy_kernel.magic_commands
+
+        dummy_kernel.declare_pre_flight_command("a", lambda x: x)
+        dummy_kernel.declare_post_flight_command("b", lambda x, y: y)
+
+        def parse (code):
+            pre_flight_commands, post_flight_commands, code_ = \
+                magic_commands._parse_code(code)
+            return (pre_flight_commands + post_flight_commands, code_)
+
+        # cells with the same magic commands share their parsing
+        commands_1, code_1 = parse("%a 1\n  %b\nfoo")
+        commands_2, code_2 = parse("%a 1\n%b  \nbar\n")
+
+        self.assertEqual((code_1, code_2), ("foo", "bar"))
+        self.assertEqual([name for (name, _) in commands_1], ["a", "b"])
+        self.assertEqual(
+            map(id, [function for (_, function) in commands_1]),
+            map(id, [function for (_, function) in commands_2]))
+
+        self.assertNotEqual(
+            id(parse("%a 2\n%b\nfoo")[0][0][1]), id(commands_1[0][1]))
+
+        # unless the magic commands or their prefix changed since
+        for change in (
+            lambda: dummy_kernel.declare_pre_flight_command(
+                "c", lambda x: x),
+            lambda: magic_commands.remove_command("c"),
+            lambda: setattr(magic_commands, "prefix", '!')):
+            change()
+            prefix = magic_commands.prefix
+            commands_3, _ = parse(prefix + "a 1\n" + prefix + "b\nfoo")
+            self.assertEqual(len(commands_3), 2)
+            self.assertNotEqual(id(commands_3[0][1]), id(commands_1[0][1]))
+            commands_1 = commands_3
+
+        # the former prefix is then no longer recognized
+        self.assertEqual(parse("%a 1\nfoo"), ([], "%a 1\nfoo"))
+
+        # errors are raised every time
+        for i in range(2):
+            with self.assertRaises(Exception):
+                parse("!a 1\n!unknown\nfoo")
+
 if (__name__ == "__main__"):
     unittest.main()
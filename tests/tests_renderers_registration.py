@@ -57,6 +57,87 @@ class RenderersRegistrationTests (unittest.TestCase):
             callysto.renderers.list_renderers_for_mime_type("dummy/*"),
             [(dummy_renderer, "dummy/vnd.b")])
 
+    def test_pure_renderers (self):
+        calls = []
+
+        def counting_renderer (content, mime_type, **metadata):
+            calls.append(content)
+            yield ("text/html", "<i>%s</i>" % content)
+            yield None
+
+        render = lambda content, metadata = None: \
+            callysto.renderers.core._render_content(
+                "dummy/vnd.pure", content, metadata)
+
+        # the output of a pure renderer should be cached,
+        callysto.renderers.register_renderer(
+            counting_renderer, "dummy/vnd.pure", pure = True)
+
+        for i in range(3):
+            self.assertEqual(render("a"), [("text/html", "<i>a</i>", None)])
+        render("a", {"width": 1})
+        render("b")
+        self.assertEqual(calls, ["a", "a", "b"])
+
+        # until the renderer is deregistered
+        callysto.renderers.deregister_renderer(counting_renderer)
+        callysto.renderers.register_renderer(
+            counting_renderer, "dummy/vnd.pure")
+
+        render("a")
+        render("a")
+        self.assertEqual(calls, ["a", "a", "b", "a", "a"])
+
+        callysto.renderers.deregister_renderer(counting_renderer)
+
+        # least recently used entries should be evicted first
+        cache = callysto.renderers.cache.RenderCache(max_bytes = 10)
+        frames = lambda content: ((("text/plain", content, None), True),)
+
+        cache.put("a", frames("12345"))
+        cache.put("b", frames("12345"))
+        cache.get("a")
+        cache.put("c", frames("12345"))
+
+        self.assertEqual(cache.size, 10)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_renderers_selection (self):
+        def renderer_a (content, mime_type, **metadata):
+            yield ("text/plain", "a")
+            yield None
+
+        def renderer_b (content, mime_type, **metadata):
+            yield ("text/plain", "b")
+            yield None
+
+        render = lambda content: \
+            callysto.renderers.core._render_content(
+                "dummy/vnd.table", content, None)[0][1]
+
+        # renderers with a higher priority should be preferred,
+        callysto.renderers.register_renderer(
+            renderer_a, "dummy/vnd.table", priority = 1,
+            accepts = lambda content, mime_type: len(content) < 3)
+        callysto.renderers.register_renderer(
+            renderer_b, "dummy/vnd.table")
+
+        self.assertEqual(
+            callysto.renderers.list_renderers_for_mime_type(
+                "dummy/vnd.table"),
+            [(renderer_a, "dummy/vnd.table"),
+             (renderer_b, "dummy/vnd.table")])
+
+        # unless they don't accept the content
+        self.assertEqual(render([1, 2]), "a")
+        self.assertEqual(render([1, 2, 3]), "b")
+
+        callysto.renderers.deregister_renderer(renderer_b)
+        self.assertEqual(render([1, 2, 3]), [1, 2, 3])
+
+        callysto.renderers.deregister_renderer(renderer_a)
+
     def test_mime_type_check (self):
         # each of the known content types should be recognized as valid
         for mime_type in callysto.MIME_TYPE: